@@ -1,10 +1,24 @@
 from django import forms
+from django.conf.urls import patterns, url
 from django.contrib import admin
+from django.http import JsonResponse
 
 # Register your models here.
-from django.contrib.admin.widgets import FilteredSelectMultiple
 
-from learn.models import Quiz, Course, Progress, Question, UserProfile, MCQuestion, Answer,TF_Question,Essay_Question
+from learn.models import Quiz, Course, Progress, CourseScore, Question, UserProfile, MCQuestion, Answer,TF_Question,Essay_Question
+from learn import search
+from learn.widgets import QuestionPickerField, filter_questions, \
+    in_batches, search_results
+
+class QuestionSearchMixin(object):
+    """
+    Searches the changelist with the full text index of learn.search
+    instead of LIKE over search_fields.
+    """
+
+    def get_search_results(self, request, queryset, search_term):
+        return search.filter_questions(queryset, search_term), False
+
 
 class AnswerInline(admin.TabularInline):
     model = Answer
@@ -15,23 +29,28 @@ class QuizAdminForm(forms.ModelForm):
     class Meta:
         model = Quiz
 
-    questions = forms.ModelMultipleChoiceField(
-        queryset=Question.objects.all().select_subclasses(),
-        required=False,
-        widget=FilteredSelectMultiple(
-            verbose_name='Questions',
-            is_stacked=False))
+    questions = QuestionPickerField(required=False)
 
     def __init__(self, *args, **kwargs):
         super(QuizAdminForm, self).__init__(*args, **kwargs)
         if self.instance.pk:
-            self.fields['questions'].initial =\
-                self.instance.question_set.all().select_subclasses()
+            self.fields['questions'].initial = list(
+                self.instance.question_set.values_list('id', flat=True))
 
     def save(self, commit=True):
         quiz = super(QuizAdminForm, self).save(commit=False)
         quiz.save()
-        quiz.question_set = self.cleaned_data['questions']
+
+        # only the questions added or removed are written, in batches
+        # small enough for SQLite
+        current = set(Question.quiz.through.objects.filter(quiz=quiz)
+                      .values_list('question_id', flat=True))
+        picked = set(self.cleaned_data['questions'])
+        for batch in in_batches(current - picked):
+            quiz.question_set.remove(*batch)
+        for batch in in_batches(picked - current):
+            quiz.question_set.add(*batch)
+
         self.save_m2m()
         return quiz
 
@@ -43,12 +62,40 @@ class QuizAdmin(admin.ModelAdmin):
     list_filter = ('course',)
     search_fields = ('description', 'course', )
 
+    question_page_size = 25
+
+    def get_urls(self):
+        return patterns('',
+            url(r'^questions/$',
+                self.admin_site.admin_view(self.question_search),
+                name='learn_quiz_questions'),
+        ) + super(QuizAdmin, self).get_urls()
+
+    def question_search(self, request):
+        """
+        A page of questions for the question picker, as json.
+        Takes ?q= (content), ?course= (id), ?type= and ?page=.
+        """
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+        course = request.GET.get('course', '')
+        questions = filter_questions(Question.objects.all(),
+                                     request.GET.get('q', '').strip(),
+                                     course if course.isdigit() else '',
+                                     request.GET.get('type', ''))
+        results, has_next = search_results(questions, page,
+                                           self.question_page_size)
+        return JsonResponse({'results': results, 'page': page,
+                             'has_next': has_next})
+
 
 class CourseAdmin(admin.ModelAdmin):
     search_fields = ('course', )
 
 	
-class MCQuestionAdmin(admin.ModelAdmin):
+class MCQuestionAdmin(QuestionSearchMixin, admin.ModelAdmin):
     list_display = ('content', 'course', )
     list_filter = ('course',)
     fields = ('content', 'course', 'quiz', 'explanation')
@@ -65,10 +112,16 @@ class ProgressAdmin(admin.ModelAdmin):
     to do:
             create a user section
     """
-    search_fields = ('user', 'score', )
+    search_fields = ('user__username', )
+
+
+class CourseScoreAdmin(admin.ModelAdmin):
+    list_display = ('user', 'course', 'score', 'possible', )
+    list_filter = ('course',)
+    search_fields = ('user__username', )
 
 
-class TFQuestionAdmin(admin.ModelAdmin):
+class TFQuestionAdmin(QuestionSearchMixin, admin.ModelAdmin):
     list_display = ('content', 'course', )
     list_filter = ('course',)
     fields = ('content', 'course', 'quiz', 'explanation', 'correct',)
@@ -83,5 +136,6 @@ admin.site.register(Quiz, QuizAdmin)
 admin.site.register(MCQuestion, MCQuestionAdmin)
 admin.site.register(TF_Question, TFQuestionAdmin)
 admin.site.register(Progress, ProgressAdmin)
+admin.site.register(CourseScore, CourseScoreAdmin)
 
 
@@ -0,0 +1,184 @@
+"""
+Quiz progress of users who are not signed in.
+
+An anonymous sitting is four integers: the checksum of the question ids
+of the quiz snapshot it was started on (see QuizSnapshot.order_checksum),
+the seed its questions were shuffled with (none when the quiz is in set
+order), the cursor and the score. The question order is rebuilt from the
+snapshot and the seed, so nothing else is stored. Edits which leave the
+questions of the quiz as they were keep the checksum, and the sitting.
+
+Where it is stored is chosen by settings.ANON_QUIZ_STORE:
+
+    learn.anon.CacheAnonStore
+        in the cache named by settings.ANON_QUIZ_CACHE, under a random
+        token kept in a cookie.
+    learn.anon.SignedCookieAnonStore
+        in signed cookies, one per quiz.
+
+Neither touches the database or the session.
+"""
+import binascii
+import os
+import re
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from learn.models import shuffle_questions
+
+# as long as the session expiry used before
+MAX_AGE = 259200
+
+TOTALS_KEY = 'totals'
+
+
+class AnonSitting(object):
+
+    def __init__(self, quiz_id, checksum, seed=None, cursor=0, score=0):
+        self.quiz_id = quiz_id
+        self.checksum = checksum
+        self.seed = seed
+        self.cursor = cursor
+        self.score = score
+
+    def encode(self):
+        return '%s:%s:%s:%s' % (self.checksum,
+                                '' if self.seed is None else self.seed,
+                                self.cursor,
+                                self.score)
+
+    @classmethod
+    def decode(cls, quiz_id, value):
+        """
+        Returns the sitting encoded in value, None if it is malformed.
+        """
+        try:
+            checksum, seed, cursor, score = value.split(':')
+            return cls(quiz_id, int(checksum),
+                       int(seed) if seed else None,
+                       int(cursor), int(score))
+        except (AttributeError, ValueError):
+            return None
+
+    def get_question_order(self, snapshot):
+        if getattr(self, '_question_order', None) is None:
+            if self.seed is None:
+                self._question_order = list(snapshot.question_ids)
+            else:
+                self._question_order = shuffle_questions(
+                    snapshot.question_ids, self.seed)
+        return self._question_order
+
+    def next_question_id(self, snapshot):
+        question_order = self.get_question_order(snapshot)
+        if self.cursor >= len(question_order):
+            return None
+        return question_order[self.cursor]
+
+
+class BaseAnonStore(object):
+    """
+    Subclasses implement get, set and delete of string values and may
+    write to the response in apply.
+    """
+
+    def __init__(self, request):
+        self.request = request
+
+    def load(self, quiz):
+        return AnonSitting.decode(quiz.id, self.get(quiz.anon_q_list()))
+
+    def save(self, sitting, quiz):
+        self.set(quiz.anon_q_list(), sitting.encode())
+
+    def remove(self, quiz):
+        self.delete(quiz.anon_q_list())
+
+    def get_totals(self):
+        """
+        Returns the running score over all quizzes as a dict, in the
+        form anon_session_score works on.
+        """
+        try:
+            score, possible = map(int, self.get(TOTALS_KEY).split(':'))
+        except (AttributeError, ValueError):
+            return {}
+        return {'session_score': score, 'session_score_possible': possible}
+
+    def save_totals(self, totals):
+        self.set(TOTALS_KEY, '%s:%s' % (totals['session_score'],
+                                        totals['session_score_possible']))
+
+    def apply(self, response):
+        return response
+
+
+class CacheAnonStore(BaseAnonStore):
+    cookie_name = 'anon_quiz'
+
+    def __init__(self, request):
+        super(CacheAnonStore, self).__init__(request)
+        self.cache = caches[getattr(settings, 'ANON_QUIZ_CACHE', 'default')]
+        self.token = request.COOKIES.get(self.cookie_name, '')
+        self.new_token = re.match(r'^[0-9a-f]{32}$', self.token) is None
+        if self.new_token:
+            self.token = binascii.hexlify(os.urandom(16))
+
+    def _key(self, key):
+        return 'anon_%s_%s' % (self.token, key)
+
+    def get(self, key):
+        return self.cache.get(self._key(key))
+
+    def set(self, key, value):
+        self.cache.set(self._key(key), value, MAX_AGE)
+
+    def delete(self, key):
+        self.cache.delete(self._key(key))
+
+    def apply(self, response):
+        if self.new_token:
+            response.set_cookie(self.cookie_name, self.token,
+                                max_age=MAX_AGE, httponly=True)
+        return response
+
+
+class SignedCookieAnonStore(BaseAnonStore):
+    salt = 'learn.anon'
+
+    def __init__(self, request):
+        super(SignedCookieAnonStore, self).__init__(request)
+        self.changed = {}
+
+    def _cookie(self, key):
+        return 'anon_%s' % key
+
+    def get(self, key):
+        if key in self.changed:
+            return self.changed[key]
+        return self.request.get_signed_cookie(self._cookie(key), None,
+                                              salt=self.salt,
+                                              max_age=MAX_AGE)
+
+    def set(self, key, value):
+        self.changed[key] = value
+
+    def delete(self, key):
+        self.changed[key] = None
+
+    def apply(self, response):
+        for key, value in self.changed.items():
+            if value is None:
+                response.delete_cookie(self._cookie(key))
+            else:
+                response.set_signed_cookie(self._cookie(key), value,
+                                           salt=self.salt, max_age=MAX_AGE,
+                                           httponly=True)
+        return response
+
+
+def get_anon_store(request):
+    return import_string(getattr(settings, 'ANON_QUIZ_STORE',
+                                 'learn.anon.CacheAnonStore'))(request)
@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+class LearnConfig(AppConfig):
+    name = 'learn'
+
+    def ready(self):
+        from learn import database, quizcache, search, signals
+        connection_created.connect(database.configure_connection)
+        quizcache.connect_signals()
+        signals.connect_signals()
+        search.connect_signals()
@@ -0,0 +1,394 @@
+"""
+Streaming import and export of question banks.
+
+A bank is a stream of questions in one of two formats. JSON lines, one
+question per line:
+
+    {"type": "mc", "content": "...", "explanation": "", "course": "python",
+     "quizzes": ["intro"], "answers": [{"content": "...", "correct": true}]}
+    {"type": "tf", "content": "...", "correct": false, ...}
+    {"type": "essay", "content": "...", ...}
+
+or CSV, with the header row type,content,explanation,course,quizzes,correct.
+In CSV the answers of a multiple choice question are rows of type
+"answer" right after it, and the quiz urls are separated by spaces.
+
+Courses and quizzes are named by course name and quiz url and must
+already exist.
+
+Imports are written a batch at a time with bulk_create, all in one
+transaction, so an import which fails part way leaves nothing behind.
+Django cannot bulk create models with multi-table inheritance, so the
+ids of the Question rows are reserved up front and the rows of the
+subclass tables are inserted with them.
+"""
+import csv
+import json
+from collections import OrderedDict
+
+from django.db import connection, transaction
+from django.db.models import Max
+
+from learn import quizcache, search
+from learn.models import Course, Quiz, Question, MCQuestion, TF_Question, \
+    Essay_Question, Answer
+
+TYPES = OrderedDict([('mc', MCQuestion),
+                     ('tf', TF_Question),
+                     ('essay', Essay_Question)])
+
+CSV_FIELDS = ('type', 'content', 'explanation', 'course', 'quizzes',
+              'correct')
+
+CONTENT_LENGTH = Question._meta.get_field('content').max_length
+EXPLANATION_LENGTH = Question._meta.get_field('explanation').max_length
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    value = unicode(value or '').strip().lower()
+    if value in ('1', 'true', 'yes', 'y'):
+        return True
+    if value in ('', '0', 'false', 'no', 'n'):
+        return False
+    raise InvalidRecord('"%s" is not true or false' % value)
+
+
+def read_jsonlines(stream):
+    """
+    Yields the line number and the record of every line, or the line
+    number and an InvalidRecord for lines which are not json objects.
+    """
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as error:
+            yield number, InvalidRecord('not json: %s' % error)
+            continue
+        if not isinstance(record, dict):
+            yield number, InvalidRecord('not a json object')
+            continue
+        yield number, record
+
+
+def read_csv(stream):
+    """
+    Like read_jsonlines, for CSV. Answer rows are gathered into the
+    record of their question.
+    """
+    question = None
+    reader = csv.DictReader(stream)
+    for row in reader:
+        # the physical line, which is what an editor shows
+        number = reader.line_num
+        row = dict((key, (value or '').decode('utf-8'))
+                   for key, value in row.items() if key)
+
+        if row.get('type', '').strip() == 'answer':
+            if question is None or question[1].get('type') != 'mc':
+                yield number, InvalidRecord('answer without a multiple '
+                                            'choice question before it')
+            else:
+                question[1]['answers'].append(
+                    {'content': row.get('content', ''),
+                     'correct': row.get('correct', '')})
+            continue
+
+        if question is not None:
+            yield question
+        row['quizzes'] = row.get('quizzes', '').split()
+        row['answers'] = []
+        question = (number, row)
+
+    if question is not None:
+        yield question
+
+
+READERS = {'jsonl': read_jsonlines, 'csv': read_csv}
+
+
+def format_of(path):
+    """
+    The format of a bank file from its name, json lines unless it ends
+    in .csv.
+    """
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+class Importer(object):
+    """
+    Validates records one at a time and saves the valid ones in batches.
+    Errors are collected as (line number, message) in errors.
+    """
+
+    def __init__(self, batch_size=1000, dry_run=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.courses = dict((name.lower(), course_id) for course_id, name
+                            in Course.objects.values_list('id', 'course')
+                            if name)
+        self.quizzes = dict(Quiz.objects.values_list('url', 'id'))
+        self.batch = []
+        self.errors = []
+        self.counts = dict((kind, 0) for kind in TYPES)
+        self.counts['answer'] = 0
+        self.changed_quizzes = set()
+
+    def validate(self, record):
+        kind = unicode(record.get('type') or '').strip()
+        if kind not in TYPES:
+            raise InvalidRecord('type must be one of %s' % ', '.join(TYPES))
+
+        content = unicode(record.get('content') or '').strip()
+        if not content:
+            raise InvalidRecord('content is empty')
+        if len(content) > CONTENT_LENGTH:
+            raise InvalidRecord('content is longer than %s characters'
+                                % CONTENT_LENGTH)
+        explanation = unicode(record.get('explanation') or '')
+        if len(explanation) > EXPLANATION_LENGTH:
+            raise InvalidRecord('explanation is longer than %s characters'
+                                % EXPLANATION_LENGTH)
+
+        course_id = None
+        course = unicode(record.get('course') or '').strip()
+        if course:
+            course_id = self.courses.get(course.lower())
+            if course_id is None:
+                raise InvalidRecord('no course "%s"' % course)
+
+        quizzes = record.get('quizzes') or []
+        if not isinstance(quizzes, list):
+            raise InvalidRecord('quizzes must be a list of quiz urls')
+        quiz_ids = []
+        for url in quizzes:
+            if url not in self.quizzes:
+                raise InvalidRecord('no quiz with the url "%s"' % url)
+            quiz_ids.append(self.quizzes[url])
+
+        question = {'type': kind, 'content': content,
+                    'explanation': explanation, 'course_id': course_id,
+                    'quiz_ids': quiz_ids}
+
+        if kind == 'tf':
+            question['correct'] = parse_bool(record.get('correct'))
+        elif kind == 'mc':
+            answers = record.get('answers') or []
+            if not isinstance(answers, list) or not answers:
+                raise InvalidRecord('a multiple choice question needs '
+                                    'answers')
+            question['answers'] = []
+            for answer in answers:
+                answer_content = unicode(answer.get('content') or '').strip()
+                if not answer_content:
+                    raise InvalidRecord('an answer is empty')
+                if len(answer_content) > CONTENT_LENGTH:
+                    raise InvalidRecord('an answer is longer than %s '
+                                        'characters' % CONTENT_LENGTH)
+                question['answers'].append(
+                    (answer_content, parse_bool(answer.get('correct'))))
+            if not any(correct for _, correct in question['answers']):
+                raise InvalidRecord('no answer is marked correct')
+
+        return question
+
+    def add(self, number, record):
+        try:
+            if isinstance(record, InvalidRecord):
+                raise record
+            question = self.validate(record)
+        except (InvalidRecord, AttributeError, TypeError) as error:
+            self.errors.append((number, unicode(error)))
+            return
+
+        self.batch.append(question)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def run(self, records):
+        """
+        Imports the records in one transaction. Invalid records are
+        skipped, any database error rolls back the whole import.
+        """
+        with transaction.atomic():
+            for number, record in records:
+                self.add(number, record)
+            self.finish()
+        quizcache.invalidate_pending()
+
+    def reserve_ids(self, count):
+        """
+        Returns count unused Question ids, which were never used before.
+        """
+        table = Question._meta.db_table
+        cursor = connection.cursor()
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id'))"
+                           " FROM generate_series(1, %s)", [table, count])
+            return [row[0] for row in cursor.fetchall()]
+        if connection.vendor == 'sqlite':
+            # the id column is AUTOINCREMENT, so sqlite_sequence holds the
+            # highest id ever given out; writing it takes the write lock,
+            # kept until the import commits, before it is read
+            cursor.execute('UPDATE sqlite_sequence SET seq = seq + %s'
+                           ' WHERE name = %s', [count, table])
+            if not cursor.rowcount:
+                cursor.execute('INSERT INTO sqlite_sequence (name, seq)'
+                               ' VALUES (%s, %s)', [table, count])
+            cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s',
+                           [table])
+            last = cursor.fetchone()[0]
+            return range(last - count + 1, last + 1)
+        first = (Question.objects.select_for_update()
+                                 .aggregate(last=Max('id'))['last'] or 0) + 1
+        return range(first, first + count)
+
+    def insert_subclass_rows(self, model, rows):
+        columns = ['question_ptr_id']
+        if model is TF_Question:
+            columns.append('correct')
+        quote = connection.ops.quote_name
+        connection.cursor().executemany(
+            'INSERT INTO %s (%s) VALUES (%s)' % (
+                quote(model._meta.db_table),
+                ', '.join(quote(column) for column in columns),
+                ', '.join(['%s'] * len(columns))),
+            rows)
+
+    def flush(self):
+        batch, self.batch = self.batch, []
+        if not batch:
+            return
+
+        for question in batch:
+            self.counts[question['type']] += 1
+            self.counts['answer'] += len(question.get('answers', ()))
+            self.changed_quizzes.update(question['quiz_ids'])
+        if self.dry_run:
+            return
+
+        with transaction.atomic():
+            ids = self.reserve_ids(len(batch))
+            Question.objects.bulk_create(
+                Question(id=question_id, content=question['content'],
+                         explanation=question['explanation'],
+                         course_id=question['course_id'],
+                         question_type=TYPES[
+                             question['type']]._meta.model_name)
+                for question_id, question in zip(ids, batch))
+
+            subclass_rows = dict((kind, []) for kind in TYPES)
+            answers = []
+            links = []
+            through = Question.quiz.through
+            for question_id, question in zip(ids, batch):
+                if question['type'] == 'tf':
+                    subclass_rows['tf'].append((question_id,
+                                                question['correct']))
+                else:
+                    subclass_rows[question['type']].append((question_id,))
+                answers.extend(Answer(question_id=question_id,
+                                      content=content, correct=correct)
+                               for content, correct
+                               in question.get('answers', ()))
+                links.extend(through(question_id=question_id,
+                                     quiz_id=quiz_id)
+                             for quiz_id in set(question['quiz_ids']))
+
+            for kind, rows in subclass_rows.items():
+                if rows:
+                    self.insert_subclass_rows(TYPES[kind], rows)
+            Answer.objects.bulk_create(answers)
+            through.objects.bulk_create(links)
+            search.index_questions(
+                (question_id, question['content'], question['explanation'])
+                for question_id, question in zip(ids, batch))
+
+    def finish(self):
+        self.flush()
+        if not self.dry_run and self.changed_quizzes:
+            # bulk_create sends no signals
+            Quiz.objects.update_question_counts(self.changed_quizzes)
+            quizcache.invalidate(self.changed_quizzes)
+
+
+def export_records(questions, batch_size=500):
+    """
+    Yields a record, in the json lines form, for every question of the
+    queryset passed in, loading them a batch at a time.
+    """
+    courses = dict(Course.objects.values_list('id', 'course'))
+    quizzes = dict(Quiz.objects.values_list('id', 'url'))
+    kinds = dict((model, kind) for kind, model in TYPES.items())
+    through = Question.quiz.through
+
+    ids = list(questions.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start:start + batch_size]
+
+        answers = {}
+        for answer in Answer.objects.filter(question__in=chunk)\
+                                    .order_by('id'):
+            answers.setdefault(answer.question_id, []).append(
+                OrderedDict([('content', answer.content),
+                             ('correct', answer.correct)]))
+        links = {}
+        for question_id, quiz_id in through.objects.filter(
+                question__in=chunk).values_list('question_id', 'quiz_id'):
+            links.setdefault(question_id, []).append(quizzes[quiz_id])
+
+        for question in Question.objects.filter(id__in=chunk)\
+                                        .order_by('id').as_subclasses():
+            kind = kinds.get(question.__class__)
+            if kind is None:
+                # a bare Question, without a type
+                continue
+            record = OrderedDict([
+                ('type', kind),
+                ('content', question.content),
+                ('explanation', question.explanation),
+                ('course', courses.get(question.course_id) or ''),
+                ('quizzes', sorted(links.get(question.id, []))),
+            ])
+            if kind == 'tf':
+                record['correct'] = question.correct
+            elif kind == 'mc':
+                record['answers'] = answers.get(question.id, [])
+            yield record
+
+
+def write_jsonlines(records, stream):
+    for record in records:
+        stream.write(json.dumps(record) + '\n')
+        yield record
+
+
+def write_csv(records, stream):
+    writer = csv.writer(stream)
+    writer.writerow(CSV_FIELDS)
+
+    def encode(value):
+        if isinstance(value, bool):
+            return 'true' if value else 'false'
+        return unicode(value).encode('utf-8')
+
+    for record in records:
+        writer.writerow([encode(record['type']), encode(record['content']),
+                         encode(record['explanation']),
+                         encode(record['course']),
+                         encode(' '.join(record['quizzes'])),
+                         encode(record.get('correct', ''))])
+        for answer in record.get('answers', ()):
+            writer.writerow(['answer', encode(answer['content']), '', '', '',
+                             encode(answer['correct'])])
+        yield record
+
+
+WRITERS = {'jsonl': write_jsonlines, 'csv': write_csv}
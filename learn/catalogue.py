@@ -0,0 +1,104 @@
+"""
+Caching of the quiz catalogue pages: the quiz list, the course list, the
+quizzes of a course and the quiz detail page.
+
+Their content only changes when staff edit quizzes or courses, so it is
+cached under a content version which the signal handlers bump on every
+Quiz or Course save and delete. The version is the time of the last
+change in milliseconds, which also gives the pages their Last-Modified.
+The signals are sent before the edit commits, so a page cached in
+between would hold the old content under the new version; as in
+learn.quizcache, CatalogueCacheMiddleware bumps the version once more
+after the view's transaction has ended.
+
+Pages served to anonymous users are cached whole. Pages of users who
+are signed in carry their name, so only the content fragment is cached
+(see the {% cache %} tags in the templates) and the page is rendered
+around it. ETags include the user for the same reason.
+"""
+import hashlib
+import threading
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+
+VERSION_KEY = 'catalogue_version'
+
+_pending = threading.local()
+
+
+def _cache():
+    return caches[getattr(settings, 'CATALOGUE_CACHE', 'default')]
+
+
+def get_version():
+    cache = _cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def _bump():
+    cache = _cache()
+    version = max(int(time.time() * 1000), (cache.get(VERSION_KEY) or 0) + 1)
+    cache.set(VERSION_KEY, version, None)
+
+
+def content_changed(**kwargs):
+    """
+    Bumps the content version. Inside a transaction it is bumped again by
+    invalidate_pending once the transaction has ended.
+    """
+    _bump()
+    if connection.in_atomic_block:
+        _pending.changed = True
+
+
+def invalidate_pending():
+    """
+    Bumps the content version if it changed inside a transaction, call it
+    once the transaction has committed or rolled back.
+    """
+    changed = getattr(_pending, 'changed', False)
+    _pending.changed = False
+    if changed:
+        _bump()
+
+
+class CatalogueCacheMiddleware(object):
+    """
+    Bumps the content version if the view changed quizzes or courses,
+    after its transaction (the admin's, or ATOMIC_REQUESTS) has ended.
+    """
+
+    def process_response(self, request, response):
+        invalidate_pending()
+        return response
+
+    def process_exception(self, request, exception):
+        invalidate_pending()
+
+
+def page_key(request):
+    """
+    The cache key of the whole page, for anonymous requests.
+    """
+    return 'catalogue_page_%s_%s' % (
+        get_version(),
+        hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest())
+
+
+def etag(request, *args, **kwargs):
+    user = request.user.pk if request.user.is_authenticated() else 'anon'
+    return hashlib.md5('%s:%s:%s' % (
+        get_version(), user,
+        request.get_full_path().encode('utf-8'))).hexdigest()
+
+
+def last_modified(request, *args, **kwargs):
+    return datetime.utcfromtimestamp(get_version() / 1000)
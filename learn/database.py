@@ -0,0 +1,38 @@
+"""
+Setup of new database connections, and the counter update shared by the
+tables of running totals.
+"""
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.db.models import F
+
+
+def configure_connection(sender, connection, **kwargs):
+    """
+    Applies settings.SQLITE_PRAGMAS to new SQLite connections.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    # the raw cursor, so the pragmas are not counted as queries
+    cursor = connection.connection.cursor()
+    for name, value in getattr(settings, 'SQLITE_PRAGMAS', ()):
+        cursor.execute('PRAGMA %s = %s' % (name, value))
+    cursor.close()
+
+
+def add_to_row(model, keys, defaults=None, **deltas):
+    """
+    Atomically adds the deltas to the row of model with the keys,
+    creating the row, with the defaults, the first time.
+    """
+    updates = dict((field, F(field) + delta)
+                   for field, delta in deltas.items())
+    if model.objects.filter(**keys).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**dict(keys, **dict(defaults or {},
+                                                     **deltas)))
+    except IntegrityError:
+        #  another request created the row first, add to it instead
+        model.objects.filter(**keys).update(**updates)
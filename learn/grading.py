@@ -0,0 +1,66 @@
+"""
+Answer keys for grading many answers at once.
+
+An AnswerKey is built from questions whose answers are already loaded
+(see QuizSnapshot), so grading a whole sitting is one dictionary lookup
+per answer and makes no queries.
+"""
+from learn.models import MCQuestion, TF_Question, parse_answer_id
+
+
+class AnswerKey(object):
+    """
+    The correct answers of a set of questions.
+
+    correct maps the id of every automatically marked question to the
+    set of guesses accepted for it: answer ids for multiple choice
+    questions, "True" or "False" for true/false questions.
+    content maps the answer ids of the multiple choice questions to their
+    text. Essay questions are marked by hand and are not in the key.
+    """
+
+    def __init__(self, questions):
+        self.correct = {}
+        self.content = {}
+        self.multiple_choice = {}
+
+        for question in questions:
+            if isinstance(question, MCQuestion):
+                correct, content = question.get_answer_key()
+                self.correct[question.id] = correct
+                self.multiple_choice[question.id] = content
+                self.content.update(content)
+            elif isinstance(question, TF_Question):
+                self.correct[question.id] = frozenset(
+                    [unicode(question.correct)])
+
+    def __contains__(self, question_id):
+        return int(question_id) in self.correct
+
+    def is_correct(self, question_id, guess):
+        question_id = int(question_id)
+        if question_id in self.multiple_choice:
+            return parse_answer_id(guess) in self.correct[question_id]
+        return unicode(guess) in self.correct.get(question_id, ())
+
+    def grade_many(self, guesses):
+        """
+        Pass in a dict of question id to guess, as returned by
+        Sitting.get_user_answers.
+
+        Returns a dict of question id (as an integer) to True or False
+        for every automatically marked question in guesses.
+        """
+        return dict((int(question_id), self.is_correct(question_id, guess))
+                    for question_id, guess in guesses.items()
+                    if int(question_id) in self.correct)
+
+    def answer_to_string(self, question_id, guess):
+        """
+        The text of a guess: the answer content for multiple choice
+        questions, the guess itself for the others.
+        """
+        content = self.multiple_choice.get(int(question_id))
+        if content is None:
+            return unicode(guess)
+        return content.get(parse_answer_id(guess), '')
@@ -0,0 +1,247 @@
+"""
+Item analysis of a quiz over all its completed sittings.
+
+For every question of the quiz:
+
+    facility        the share of sittings which answered it correctly
+    discrimination  the point-biserial correlation of answering it
+                    correctly with the score on the other questions
+                    (the corrected item-total correlation)
+
+and for the quiz Cronbach's alpha, the reliability of its total score.
+
+The marks come from the UserAnswer rows of complete sittings; a question
+a sitting never answered counts as wrong. The sittings and their correct
+answers are read together, in one query, so a sitting completed
+meanwhile cannot be half counted, a chunk at a time into a sittings x
+questions matrix of zeros and ones, from which everything is computed
+with array operations. NumPy is used when it is installed; without it
+the same sums are built in Python, which is several times slower on
+large quizzes.
+
+Results are cached under the latest complete sitting of the quiz, the
+quiz content version and a marking version which re-marking bumps
+through marks_changed, so they are computed again only when there is
+something new to count.
+"""
+import math
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import Count, Max
+
+from learn import quizcache
+from learn.models import Sitting, UserAnswer
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+CACHE_TIMEOUT = 24 * 60 * 60
+
+# rows fetched from the cursor at a time
+CHUNK_SIZE = 10000
+
+
+def _cache():
+    return caches[getattr(settings, 'ITEM_ANALYSIS_CACHE', 'default')]
+
+
+def _marks_key(quiz_id):
+    return 'item_analysis_marks_%s' % quiz_id
+
+
+def marks_changed(quiz_ids):
+    """
+    Call after answers of complete sittings of the quizzes passed in are
+    marked again.
+    """
+    cache = _cache()
+    for quiz_id in set(quiz_ids):
+        try:
+            cache.incr(_marks_key(quiz_id))
+        except ValueError:
+            cache.set(_marks_key(quiz_id), 1, None)
+
+
+def _correct_answers(quiz_id, latest):
+    """
+    Yields lists of (sitting id, question id), in sitting order, of the
+    correct answers of the complete sittings of the quiz up to the
+    latest sitting id. A sitting without correct answers has one row,
+    with question id 0.
+    """
+    sql = ('SELECT s.id, COALESCE(a.question_id, 0) FROM {sitting} s'
+           ' LEFT OUTER JOIN {answer} a ON a.sitting_id = s.id'
+           ' AND a.is_correct = %s'
+           ' WHERE s.quiz_id = %s AND s.complete = %s AND s.id <= %s'
+           ' ORDER BY s.id').format(answer=UserAnswer._meta.db_table,
+                                    sitting=Sitting._meta.db_table)
+    cursor = connection.cursor()
+    cursor.execute(sql, [True, quiz_id, True, latest])
+    while True:
+        rows = cursor.fetchmany(CHUNK_SIZE)
+        if not rows:
+            break
+        yield rows
+
+
+def _ratio(numerator, denominator):
+    if denominator <= 0:
+        return None
+    return float(numerator) / denominator
+
+
+def _point_biserial(facility, covariance, total_variance):
+    """
+    The correlation of an item with the rest of the score, from the
+    covariance of the item with the whole score.
+    """
+    variance = facility * (1 - facility)
+    rest_variance = total_variance + variance - 2 * covariance
+    if variance <= 0 or rest_variance <= 1e-12:
+        return None
+    return (covariance - variance) / math.sqrt(variance * rest_variance)
+
+
+def _alpha(items, item_variance, total_variance):
+    if items < 2 or total_variance <= 1e-12:
+        return None
+    return items / (items - 1.0) * (1 - item_variance / total_variance)
+
+
+def _sums_numpy(quiz_id, latest, question_ids):
+    """
+    Returns the number of sittings, the number of correct answers of
+    every question, the sum over sittings of the total score of the
+    sittings answering each question correctly, the sum of the totals
+    and of their squares.
+    """
+    # question id to column, -1 for questions not in the quiz
+    columns = numpy.full(max(question_ids or [0]) + 1, -1,
+                         dtype=numpy.int64)
+    columns[question_ids] = numpy.arange(len(question_ids))
+
+    count = 0
+    last = None
+    marks = []
+    for rows in _correct_answers(quiz_id, latest):
+        rows = numpy.array(rows, dtype=numpy.int64)
+        # the matrix row of every answer, a new one for each new sitting
+        new = numpy.empty(len(rows), dtype=bool)
+        new[0] = rows[0, 0] != last
+        new[1:] = rows[1:, 0] != rows[:-1, 0]
+        indices = count - 1 + numpy.cumsum(new)
+        count, last = int(indices[-1]) + 1, rows[-1, 0]
+
+        known = rows[:, 1] < len(columns)
+        indices, row_columns = indices[known], columns[rows[known, 1]]
+        marks.append((indices[row_columns >= 0],
+                      row_columns[row_columns >= 0]))
+
+    matrix = numpy.zeros((count, len(question_ids)), dtype=numpy.uint8)
+    for indices, row_columns in marks:
+        matrix[indices, row_columns] = 1
+
+    totals = matrix.sum(axis=1, dtype=numpy.float64)
+    return (count, matrix.sum(axis=0, dtype=numpy.float64).tolist(),
+            matrix.T.dot(totals).tolist(),
+            float(totals.sum()), float(totals.dot(totals)))
+
+
+def _sums_python(quiz_id, latest, question_ids):
+    """
+    _sums_numpy without NumPy.
+    """
+    columns = dict((question_id, column)
+                   for column, question_id in enumerate(question_ids))
+    answered = {}
+    for rows in _correct_answers(quiz_id, latest):
+        for sitting_id, question_id in rows:
+            sitting_columns = answered.setdefault(sitting_id, set())
+            column = columns.get(question_id)
+            if column is not None:
+                sitting_columns.add(column)
+
+    correct = [0.0] * len(question_ids)
+    cross = [0.0] * len(question_ids)
+    total_sum = total_squares = 0.0
+    for sitting_columns in answered.values():
+        total = len(sitting_columns)
+        total_sum += total
+        total_squares += total * total
+        for column in sitting_columns:
+            correct[column] += 1
+            cross[column] += total
+    return len(answered), correct, cross, total_sum, total_squares
+
+
+def analyse(quiz_id, use_numpy=None):
+    """
+    Computes the item analysis of a quiz, see the module docstring.
+    use_numpy defaults to whether NumPy is installed.
+
+    Returns a dict of the number of sittings and questions, the mean
+    score, alpha and a list of per question dicts in quiz order.
+    Statistics which are undefined, such as the discrimination of a
+    question everybody answered correctly, are None.
+    """
+    if use_numpy is None:
+        use_numpy = numpy is not None
+    snapshot = quizcache.get_snapshot(quiz_id)
+    question_ids = list(snapshot.question_ids)
+
+    latest = Sitting.objects.filter(quiz=quiz_id, complete=True)\
+                            .aggregate(latest=Max('id'))['latest'] or 0
+
+    sums = _sums_numpy if use_numpy else _sums_python
+    count, correct, cross, total_sum, total_squares = sums(
+        quiz_id, latest, question_ids)
+
+    mean = _ratio(total_sum, count)
+    total_variance = (total_squares / count - mean * mean) if count else 0
+
+    questions = []
+    item_variance = 0.0
+    for question, right, cross_sum in zip(snapshot.questions, correct,
+                                          cross):
+        facility = _ratio(right, count)
+        discrimination = None
+        if facility is not None:
+            item_variance += facility * (1 - facility)
+            covariance = cross_sum / count - facility * mean
+            discrimination = _point_biserial(facility, covariance,
+                                             total_variance)
+        questions.append({'id': question.id,
+                          'content': question.content,
+                          'correct': int(right),
+                          'facility': facility,
+                          'discrimination': discrimination})
+
+    return {'quiz': quiz_id,
+            'sittings': count,
+            'latest_sitting': latest or None,
+            'mean_score': mean,
+            'alpha': _alpha(len(question_ids), item_variance,
+                            total_variance) if count else None,
+            'questions': questions}
+
+
+def item_analysis(quiz_id):
+    """
+    analyse(quiz_id), cached until the quiz has a new complete sitting,
+    its content changes or its sittings are marked again.
+    """
+    cache = _cache()
+    latest = Sitting.objects.filter(quiz=quiz_id, complete=True)\
+                            .aggregate(latest=Max('id'), count=Count('id'))
+    key = 'item_analysis_%s_%s_%s_%s_%s' % (
+        quiz_id, latest['latest'], latest['count'],
+        quizcache.get_version(quiz_id), cache.get(_marks_key(quiz_id), 0))
+    result = cache.get(key)
+    if result is None:
+        result = analyse(quiz_id)
+        cache.set(key, result, CACHE_TIMEOUT)
+    return result
@@ -0,0 +1,59 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from learn.quizcache import get_snapshot
+from learn.synthetic import rolled_back, make_quiz
+
+STORES = ('learn.anon.CacheAnonStore', 'learn.anon.SignedCookieAnonStore')
+
+
+def is_write(sql):
+    return any(verb in sql for verb in ('INSERT ', 'UPDATE ', 'DELETE '))
+
+
+class Command(BaseCommand):
+    help = ("Runs anonymous takers through a synthetic quiz with each "
+            "anonymous quiz store and reports throughput and database "
+            "writes. The synthetic quiz is rolled back afterwards.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--takers', type='int', default=50,
+                    help='Anonymous users taking the quiz per store.'),
+        make_option('--questions', type='int', default=20,
+                    help='Questions in the quiz.'),
+    )
+
+    def handle(self, *args, **options):
+        with rolled_back(), override_settings(ALLOWED_HOSTS=['testserver']):
+            quiz = make_quiz(questions=options['questions'])
+            snapshot = get_snapshot(quiz.id)
+            guesses = [min(snapshot.answer_key.correct[question_id])
+                       for question_id in snapshot.question_ids]
+            url = '/learn/%s/take/' % quiz.url
+
+            for store in STORES:
+                with override_settings(ANON_QUIZ_STORE=store):
+                    self.run(store, url, guesses, options['takers'])
+
+    def run(self, store, url, guesses, takers):
+        requests = 0
+        with CaptureQueriesContext(connection) as queries:
+            start = time.time()
+            for _ in range(takers):
+                client = Client()
+                client.get(url)
+                requests += 1
+                for guess in guesses:
+                    client.post(url, {'answers': guess})
+                    requests += 1
+            elapsed = time.time() - start
+
+        writes = len([query for query in queries if is_write(query['sql'])])
+        self.stdout.write('%-36s %8.1f req/s %6.2f queries/req %d writes' % (
+            store, requests / elapsed, float(len(queries)) / requests,
+            writes))
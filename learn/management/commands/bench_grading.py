@@ -0,0 +1,69 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from learn import quizcache
+from learn.models import Answer
+from learn.synthetic import rolled_back, make_quiz, random_guesses
+
+
+class Command(BaseCommand):
+    help = ("Compares grading a whole sitting one query per guess with "
+            "grading it against the quiz answer key. The synthetic quiz "
+            "is rolled back afterwards.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--questions', type='int', default=200,
+                    help='Number of multiple choice questions.'),
+        make_option('--answers', type='int', default=4,
+                    help='Answers per question.'),
+        make_option('--repeat', type='int', default=20,
+                    help='Times each grading run is repeated.'),
+    )
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            quiz = make_quiz(questions=options['questions'],
+                             answers=options['answers'])
+            guesses = random_guesses(quiz)
+            self.run(quiz, guesses, options['repeat'])
+
+    def measure(self, label, function, repeat):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.time()
+            for _ in range(repeat):
+                result = function()
+            elapsed = (time.time() - start) / repeat
+
+        self.stdout.write('%-28s %9.3f ms %6d queries' % (
+            label, elapsed * 1000, len(queries) / repeat))
+        return result
+
+    def run(self, quiz, guesses, repeat):
+        self.stdout.write('Grading %s answers of quiz "%s"' % (
+            len(guesses), quiz.title))
+
+        def per_guess():
+            return dict((int(question_id),
+                         Answer.objects.get(id=guess).correct)
+                        for question_id, guess in guesses.items())
+
+        def cold_key():
+            quizcache.invalidate([quiz.id])
+            return quizcache.get_snapshot(quiz.id).answer_key\
+                            .grade_many(guesses)
+
+        def warm_key():
+            return quizcache.get_snapshot(quiz.id).answer_key\
+                            .grade_many(guesses)
+
+        expected = self.measure('query per guess', per_guess, repeat)
+        self.measure('answer key, cold snapshot', cold_key, repeat)
+        graded = self.measure('answer key, warm snapshot', warm_key, repeat)
+
+        if graded != expected:
+            self.stderr.write('Answer key grading disagrees with the '
+                              'per guess grading.')
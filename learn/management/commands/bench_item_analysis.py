@@ -0,0 +1,85 @@
+import math
+import random
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from learn import itemanalysis
+from learn.models import Sitting, UserAnswer
+from learn.synthetic import rolled_back, make_quiz, make_users
+
+
+class Command(BaseCommand):
+    help = ("Times the item analysis of a synthetic quiz with many "
+            "complete sittings, with NumPy when it is installed and "
+            "without. The quiz is rolled back afterwards.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--sittings', type='int', default=100000,
+                    help='Complete sittings of the quiz.'),
+        make_option('--questions', type='int', default=20,
+                    help='Questions in the quiz.'),
+        make_option('--users', type='int', default=1000,
+                    help='Users the sittings are shared between.'),
+    )
+
+    def handle(self, *args, **options):
+        random.seed(0)
+        with rolled_back():
+            start = time.time()
+            quiz = make_quiz(questions=options['questions'])
+            answers = self.make_sittings(quiz, options['sittings'],
+                                         options['users'])
+            self.stdout.write('Created %s sittings, %s answers in %.1f s' % (
+                options['sittings'], answers, time.time() - start))
+
+            runs = [('python', False)]
+            if itemanalysis.numpy is not None:
+                runs.insert(0, ('numpy', True))
+            else:
+                self.stdout.write('NumPy is not installed')
+            for name, use_numpy in runs:
+                start = time.time()
+                analysis = itemanalysis.analyse(quiz.id, use_numpy=use_numpy)
+                self.stdout.write('%-7s %6.2f s  alpha %.3f' % (
+                    name, time.time() - start, analysis['alpha']))
+
+    def make_sittings(self, quiz, count, users):
+        """
+        Creates complete sittings whose answers follow a one parameter
+        logistic model, so the statistics come out as they would for
+        real takers. Returns the number of answers created.
+        """
+        question_ids = list(quiz.question_set.order_by('id')
+                                .values_list('id', flat=True))
+        difficulty = dict((question_id, random.gauss(0, 1))
+                          for question_id in question_ids)
+        user_ids = [user.id for user in make_users(users)]
+
+        first = (Sitting.objects.order_by('-id')
+                                .values_list('id', flat=True)[:1] or [0])[0]
+        Sitting.objects.bulk_create(
+            Sitting(user_id=user_ids[number % len(user_ids)], quiz=quiz,
+                    question_order='[]', max_score=len(question_ids),
+                    current_score=0, complete=True)
+            for number in range(count))
+        sitting_ids = Sitting.objects.filter(quiz=quiz, id__gt=first)\
+                                     .values_list('id', flat=True)
+
+        created = 0
+        batch = []
+        for sitting_id in sitting_ids.iterator():
+            ability = random.gauss(0, 1)
+            for question_id in question_ids:
+                correct = random.random() < 1 / (1 + math.exp(
+                    difficulty[question_id] - ability))
+                batch.append(UserAnswer(sitting_id=sitting_id,
+                                        question_id=question_id,
+                                        is_correct=correct))
+            if len(batch) >= 20000:
+                UserAnswer.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        UserAnswer.objects.bulk_create(batch)
+        return created + len(batch)
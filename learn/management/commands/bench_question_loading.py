@@ -0,0 +1,85 @@
+import random
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries
+
+from learn.bank import Importer, TYPES
+from learn.models import Question
+from learn.synthetic import rolled_back
+
+
+class Command(BaseCommand):
+    help = ("Compares loading questions as their subclasses with "
+            "select_subclasses and with the question_type discriminator, "
+            "over synthetic banks holding one, two and three question "
+            "types. The banks are rolled back afterwards.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--questions', type='int', default=20000,
+                    help='Questions in each synthetic bank.'),
+        make_option('--load', type='int', default=200,
+                    help='Questions loaded at a time, as for one quiz.'),
+        make_option('--repeat', type='int', default=20,
+                    help='Times each load is run.'),
+    )
+
+    def handle(self, *args, **options):
+        random.seed(0)
+        kinds = list(TYPES)
+        for present in range(1, len(kinds) + 1):
+            with rolled_back():
+                self.make_bank(kinds[:present], options['questions'])
+                ids = random.sample(
+                    list(Question.objects.values_list('id', flat=True)),
+                    min(options['load'], options['questions']))
+                self.run(kinds[:present], ids, options['repeat'])
+
+    def make_bank(self, kinds, count):
+        def record(number):
+            kind = kinds[number % len(kinds)]
+            record = {'type': kind, 'content': 'question %s' % number}
+            if kind == 'tf':
+                record['correct'] = number % 2 == 0
+            elif kind == 'mc':
+                record['answers'] = [{'content': 'yes', 'correct': True},
+                                     {'content': 'no', 'correct': False}]
+            return number, record
+
+        Importer(batch_size=2000).run(record(number)
+                                      for number in range(count))
+
+    def measure(self, function, repeat):
+        times = []
+        for _ in range(repeat):
+            start = time.time()
+            function()
+            times.append(time.time() - start)
+        times.sort()
+
+        debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        reset_queries()
+        function()
+        queries = len(connection.queries)
+        connection.use_debug_cursor = debug_cursor
+        return times[len(times) // 2] * 1000, queries
+
+    def run(self, kinds, ids, repeat):
+        def joined():
+            return list(Question.objects.filter(id__in=ids)
+                                        .select_subclasses()
+                                        .select_related('course'))
+
+        def discriminated():
+            return Question.objects.filter(id__in=ids)\
+                                   .as_subclasses('course')
+
+        joined_ms, joined_queries = self.measure(joined, repeat)
+        typed_ms, typed_queries = self.measure(discriminated, repeat)
+        self.stdout.write(
+            '%-12s %d questions: select_subclasses %6.1f ms (%d queries), '
+            'question_type %6.1f ms (%d queries)' % (
+                '+'.join(kinds), len(ids), joined_ms, joined_queries,
+                typed_ms, typed_queries))
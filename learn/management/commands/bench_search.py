@@ -0,0 +1,85 @@
+import random
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from learn import search
+from learn.bank import Importer
+from learn.models import Question
+from learn.synthetic import rolled_back
+
+
+class Command(BaseCommand):
+    help = ("Compares question search through the full text index with "
+            "LIKE over a synthetic question bank. The bank is rolled back "
+            "afterwards.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--questions', type='int', default=100000,
+                    help='Questions in the synthetic bank.'),
+        make_option('--repeat', type='int', default=20,
+                    help='Times each search is run.'),
+    )
+
+    def handle(self, *args, **options):
+        random.seed(0)
+        vocabulary = ['%s%s' % (random.choice(('photo', 'thermo', 'hydro',
+                                               'electro', 'bio', 'geo')),
+                                random.choice(('synthesis', 'dynamics',
+                                               'logy', 'lysis', 'meter',
+                                               'graphy', 'sphere')))
+                      for _ in range(40)]
+        vocabulary += ['word%s' % number for number in range(5000)]
+
+        with rolled_back():
+            start = time.time()
+            importer = Importer(batch_size=2000)
+            importer.run((number, {
+                'type': 'essay',
+                'content': ' '.join(random.choice(vocabulary)
+                                    for _ in range(12)),
+                'explanation': ' '.join(random.choice(vocabulary)
+                                        for _ in range(20))})
+                for number in range(options['questions']))
+            self.stdout.write('Created %s questions in %.1f s, search '
+                              'backend %s' % (
+                                  Question.objects.count(),
+                                  time.time() - start, search.backend()))
+
+            for text in ('photo', 'thermo', 'word4242', 'word4242 thermo',
+                         'word42'):
+                self.run(text, options['repeat'])
+
+    def measure(self, function, repeat):
+        times = []
+        for _ in range(repeat):
+            start = time.time()
+            result = function()
+            times.append(time.time() - start)
+        times.sort()
+        return times[len(times) // 2] * 1000, result
+
+    def run(self, text, repeat):
+        def indexed():
+            return search.filter_questions(Question.objects.all(),
+                                           text).count()
+
+        def ranked():
+            return search.ranked_ids(text, limit=20)
+
+        def like():
+            queryset = Question.objects.all()
+            for term in search.words(text):
+                queryset = queryset.filter(Q(content__icontains=term) |
+                                           Q(explanation__icontains=term))
+            return queryset.count()
+
+        index_ms, index_count = self.measure(indexed, repeat)
+        ranked_ms, _ = self.measure(ranked, repeat)
+        like_ms, like_count = self.measure(like, repeat)
+        self.stdout.write(
+            '%-18s index %7.1f ms (%d found), top 20 ranked %7.1f ms, '
+            'LIKE %7.1f ms (%d found)' % (text, index_ms, index_count,
+                                          ranked_ms, like_ms, like_count))
@@ -0,0 +1,50 @@
+import sys
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from learn.bank import WRITERS, export_records, format_of
+from learn.models import Course, Question
+
+
+class Command(BaseCommand):
+    args = '[file]'
+    help = ("Exports questions, with their answers and quizzes, as JSON "
+            "lines or CSV in the format import_questions reads. Writes "
+            "to standard output when no file is given.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--format', choices=sorted(WRITERS),
+                    help='jsonl or csv, by default from the file name.'),
+        make_option('--quiz', help='Only the questions of this quiz url.'),
+        make_option('--course', help='Only the questions of this course.'),
+        make_option('--batch-size', type='int', default=500,
+                    help='Questions loaded per batch.'),
+    )
+
+    def handle(self, *args, **options):
+        path = args[0] if args else '-'
+        questions = Question.objects.all()
+        if options['quiz']:
+            questions = questions.filter(quiz__url=options['quiz'])
+        if options['course']:
+            course = Course.objects.lookup(options['course'])
+            if course is None:
+                raise CommandError('No course "%s".' % options['course'])
+            questions = questions.filter(course=course)
+
+        write = WRITERS[options['format'] or format_of(path)]
+        records = export_records(questions, options['batch_size'])
+
+        start = time.time()
+        if path == '-':
+            count = sum(1 for _ in write(records, sys.stdout))
+        else:
+            with open(path, 'wb') as stream:
+                count = sum(1 for _ in write(records, stream))
+        elapsed = time.time() - start
+
+        self.stderr.write('Exported %s questions in %.1f s, %.0f '
+                          'questions/s.' % (count, elapsed,
+                                            count / elapsed if elapsed else 0))
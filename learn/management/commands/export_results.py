@@ -0,0 +1,78 @@
+import sys
+import time
+from datetime import datetime
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from learn import results
+from learn.models import Course, Quiz
+
+
+def parse_date(value, name):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError('--%s must be a date, YYYY-MM-DD.' % name)
+
+
+class Command(BaseCommand):
+    args = '[file]'
+    help = ("Exports the complete sittings, with the answer given to "
+            "every question, as CSV or JSON lines. Writes to standard "
+            "output when no file is given.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--format', choices=sorted(results.FORMATS),
+                    help='csv or jsonl, by default from the file name.'),
+        make_option('--quiz', help='Only the sittings of this quiz url.'),
+        make_option('--course', help='Only the sittings of this course.'),
+        make_option('--start', help='Only sittings finished on or after '
+                                    'this date, YYYY-MM-DD.'),
+        make_option('--end', help='Only sittings finished on or before '
+                                  'this date, YYYY-MM-DD.'),
+        make_option('--chunk-size', type='int', default=results.CHUNK_SIZE,
+                    help='Sittings loaded per chunk.'),
+    )
+
+    def handle(self, *args, **options):
+        path = args[0] if args else '-'
+        filters = {}
+        dates = {}
+        if options['quiz']:
+            try:
+                filters['quiz'] = Quiz.objects.get(url=options['quiz'])
+            except Quiz.DoesNotExist:
+                raise CommandError('No quiz "%s".' % options['quiz'])
+        if options['course']:
+            filters['course'] = Course.objects.lookup(options['course'])
+            if filters['course'] is None:
+                raise CommandError('No course "%s".' % options['course'])
+        for name in ('start', 'end'):
+            if options[name]:
+                dates[name] = parse_date(options[name], name)
+
+        export_format = options['format'] or (
+            'jsonl' if path.lower().endswith('.jsonl') else 'csv')
+        count = [0]
+
+        def counted(records):
+            for record in records:
+                count[0] += 1
+                yield record
+
+        lines = results.FORMATS[export_format](counted(
+            results.export_records(results.complete_sittings(**filters),
+                                   chunk_size=options['chunk_size'],
+                                   **dates)))
+
+        start = time.time()
+        if path == '-':
+            sys.stdout.writelines(lines)
+        else:
+            with open(path, 'wb') as stream:
+                stream.writelines(lines)
+        elapsed = time.time() - start
+
+        self.stderr.write('Exported %s sittings in %.1f s.' % (
+            count[0], elapsed))
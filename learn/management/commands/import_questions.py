@@ -0,0 +1,57 @@
+import sys
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from learn.bank import READERS, Importer, format_of
+
+
+class Command(BaseCommand):
+    args = '<file>'
+    help = ("Imports multiple choice, true/false and essay questions, "
+            "with their answers and quizzes, from a JSON lines or CSV "
+            "file (- reads standard input). See learn.bank for the "
+            "format. Invalid records are reported and skipped; the "
+            "rest are imported in one transaction.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--format', choices=sorted(READERS),
+                    help='jsonl or csv, by default from the file name.'),
+        make_option('--batch-size', type='int', default=1000,
+                    help='Questions saved per bulk insert.'),
+        make_option('--dry-run', action='store_true', default=False,
+                    help='Only validate the file.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Give the file to import, or - for '
+                               'standard input.')
+        path = args[0]
+        read = READERS[options['format'] or format_of(path)]
+        importer = Importer(batch_size=options['batch_size'],
+                            dry_run=options['dry_run'])
+
+        start = time.time()
+        if path == '-':
+            importer.run(read(sys.stdin))
+        else:
+            with open(path, 'rb') as stream:
+                importer.run(read(stream))
+        elapsed = time.time() - start
+
+        for number, message in importer.errors:
+            self.stderr.write('line %s: %s' % (number, message))
+
+        questions = sum(count for kind, count in importer.counts.items()
+                        if kind != 'answer')
+        self.stdout.write(
+            '%s %s questions (%s multiple choice, %s true/false, %s essay)'
+            ' and %s answers in %.1f s, %.0f questions/s. %s invalid '
+            'records.' % (
+                'Validated' if options['dry_run'] else 'Imported',
+                questions, importer.counts['mc'], importer.counts['tf'],
+                importer.counts['essay'], importer.counts['answer'],
+                elapsed, questions / elapsed if elapsed else 0,
+                len(importer.errors)))
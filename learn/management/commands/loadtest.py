@@ -0,0 +1,252 @@
+import os
+import random
+import threading
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from learn.models import Course
+from learn.quizcache import get_snapshot
+from learn.synthetic import rolled_back, make_catalogue, make_users
+
+
+def percentile(values, percent):
+    """
+    Nearest rank percentile of an already sorted list.
+    """
+    if not values:
+        return 0
+    rank = int(round(percent / 100.0 * len(values) + 0.5)) - 1
+    return values[min(max(rank, 0), len(values) - 1)]
+
+
+def scratch_database():
+    """
+    Whether the database was named in SMA_DB_NAME, and is not the
+    project's own db.sqlite3.
+    """
+    name = os.environ.get('SMA_DB_NAME')
+    if not name:
+        return False
+    return os.path.realpath(name) != os.path.realpath(
+        os.path.join(settings.BASE_DIR, 'db.sqlite3'))
+
+
+def delete_in_batches(model, field, values, size=500):
+    """
+    Deletes the rows whose field is in values, a batch at a time as
+    SQLite limits the number of query parameters.
+    """
+    values = list(values)
+    for start in range(0, len(values), size):
+        model.objects.filter(**{'%s__in' % field:
+                                values[start:start + size]}).delete()
+
+
+class Taker(object):
+    """
+    One simulated quiz taker: a client, the quiz and the guesses it will
+    post, in the order the questions are served.
+    """
+
+    def __init__(self, client, quiz, guesses):
+        self.client = client
+        self.url = '/learn/%s/take/' % quiz.url
+        self.guesses = guesses
+        self.position = -1
+
+    @property
+    def finished(self):
+        return self.position >= len(self.guesses)
+
+    def step(self):
+        if self.position < 0:
+            response = self.client.get(self.url)
+        else:
+            response = self.client.post(
+                self.url, {'answers': self.guesses[self.position]})
+        self.position += 1
+        return response
+
+
+class Stats(object):
+
+    def __init__(self, label):
+        self.label = label
+        self.latencies = []
+        self.queries = []
+        self.errors = 0
+        self.elapsed = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, latency, queries, status_code):
+        with self.lock:
+            self._add(latency, queries, status_code)
+
+    def _add(self, latency, queries, status_code):
+        self.latencies.append(latency)
+        self.queries.append(queries)
+        if status_code != 200:
+            self.errors += 1
+
+    def report(self):
+        requests = len(self.latencies)
+        if not requests:
+            return '%-10s no requests' % self.label
+        latencies = sorted(self.latencies)
+        return ('%-10s %7d req %4d errors %8.1f req/s  '
+                'p50 %6.1f  p95 %6.1f  p99 %6.1f ms  '
+                '%5.2f queries/req (max %d)' % (
+                    self.label, requests, self.errors,
+                    requests / self.elapsed if self.elapsed else 0,
+                    percentile(latencies, 50) * 1000,
+                    percentile(latencies, 95) * 1000,
+                    percentile(latencies, 99) * 1000,
+                    float(sum(self.queries)) / requests,
+                    max(self.queries)))
+
+
+class Command(BaseCommand):
+    help = ("Load tests QuizTake: creates synthetic courses, quizzes and "
+            "users, then drives logged in and anonymous takers through "
+            "the quizzes with the test client, all sittings open at once "
+            "and served in turn. Reports throughput, latency percentiles "
+            "and queries per request. With one thread everything is "
+            "rolled back afterwards. More threads need the synthetic "
+            "data committed, so they are refused unless SMA_DB_NAME "
+            "names a scratch copy of the database; the data is deleted "
+            "again at the end.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--courses', type='int', default=5,
+                    help='Synthetic courses.'),
+        make_option('--quizzes', type='int', default=4,
+                    help='Quizzes per course.'),
+        make_option('--questions', type='int', default=20,
+                    help='Questions per quiz.'),
+        make_option('--users', type='int', default=500,
+                    help='Logged in takers.'),
+        make_option('--anon', type='int', default=500,
+                    help='Anonymous takers.'),
+        make_option('--threads', type='int', default=1,
+                    help='Threads sending requests at the same time.'),
+        make_option('--seed', type='int', default=0,
+                    help='Random seed, for repeatable runs.'),
+    )
+
+    def handle(self, *args, **options):
+        if options['threads'] > 1 and not scratch_database():
+            raise CommandError('More than one thread commits the synthetic '
+                               'data; set SMA_DB_NAME to a scratch copy of '
+                               'the database.')
+        random.seed(options['seed'])
+        # logging in thousands of users with the default hasher would
+        # take longer than the test itself
+        with override_settings(
+                ALLOWED_HOSTS=['testserver'],
+                PASSWORD_HASHERS=(
+                    'django.contrib.auth.hashers.MD5PasswordHasher',)):
+            if options['threads'] > 1:
+                self.committed_test(options)
+            else:
+                with rolled_back():
+                    self.run(self.setup(options), 1)
+
+    def committed_test(self, options):
+        self.users, self.quizzes, takers = [], [], []
+        try:
+            takers = self.setup(options)
+            self.run(takers, options['threads'])
+        finally:
+            delete_in_batches(Session, 'session_key', [
+                taker.client.cookies['sessionid'].value
+                for flow, taker in takers
+                if 'sessionid' in taker.client.cookies])
+            delete_in_batches(User, 'id', [user.id for user in self.users])
+            delete_in_batches(Course, 'id', set(quiz.course_id
+                                                for quiz in self.quizzes))
+
+    def setup(self, options):
+        self.quizzes = quizzes = make_catalogue(
+            courses=options['courses'], quizzes=options['quizzes'],
+            questions=options['questions'])
+        self.users = make_users(options['users'])
+        guesses = dict((quiz.id, self.guess_choices(quiz))
+                       for quiz in quizzes)
+
+        takers = []
+        for user in self.users:
+            client = Client()
+            client.login(username=user.username, password='synthetic')
+            takers.append(('user', self.make_taker(client, quizzes,
+                                                   guesses)))
+        for _ in range(options['anon']):
+            takers.append(('anon', self.make_taker(Client(), quizzes,
+                                                   guesses)))
+        random.shuffle(takers)
+
+        self.stdout.write('%s takers, %s quizzes of %s questions, '
+                          '%s threads' % (len(takers), len(quizzes),
+                                          options['questions'],
+                                          options['threads']))
+        return takers
+
+    def guess_choices(self, quiz):
+        snapshot = get_snapshot(quiz.id)
+        key = snapshot.answer_key
+        return [sorted(key.multiple_choice[question_id])
+                for question_id in snapshot.question_ids]
+
+    def make_taker(self, client, quizzes, guesses):
+        quiz = random.choice(quizzes)
+        return Taker(client, quiz,
+                     [random.choice(choices) for choices in guesses[quiz.id]])
+
+    def run(self, takers, threads):
+        stats = {'user': Stats('logged in'), 'anon': Stats('anonymous')}
+        total = Stats('total')
+
+        def serve(takers):
+            while takers:
+                for flow, taker in takers:
+                    with CaptureQueriesContext(connection) as queries:
+                        began = time.time()
+                        response = taker.step()
+                        latency = time.time() - began
+                    stats[flow].add(latency, len(queries),
+                                    response.status_code)
+                    total.add(latency, len(queries), response.status_code)
+                takers = [(flow, taker) for flow, taker in takers
+                          if not taker.finished]
+
+        start = time.time()
+        if threads == 1:
+            serve(takers)
+        else:
+            def serve_and_close(takers):
+                try:
+                    serve(takers)
+                finally:
+                    connection.close()
+
+            workers = [threading.Thread(target=serve_and_close,
+                                        args=(takers[number::threads],))
+                       for number in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        elapsed = time.time() - start
+
+        for flow in ('user', 'anon'):
+            stats[flow].elapsed = elapsed
+            self.stdout.write(stats[flow].report())
+        total.elapsed = elapsed
+        self.stdout.write(total.report())
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from learn import quizstats
+from learn.models import Quiz
+
+
+class Command(BaseCommand):
+    args = '[quiz url ...]'
+    help = ("Recounts the statistics and leaderboards of the quizzes "
+            "named, or of every quiz, from the sittings in the database.")
+
+    def handle(self, *urls, **options):
+        quiz_ids = None
+        if urls:
+            found = dict(Quiz.objects.filter(url__in=urls)
+                                     .values_list('url', 'id'))
+            missing = [url for url in urls if url not in found]
+            if missing:
+                raise CommandError('No quiz with the url %s.' %
+                                   ', '.join(missing))
+            quiz_ids = found.values()
+        count = quizstats.rebuild(quiz_ids)
+        self.stdout.write('Counted %s sittings.' % count)
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from learn import search
+
+
+class Command(BaseCommand):
+    help = ("Refills the question search index from the question table, "
+            "for questions written without signals (raw SQL, fixtures).")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = search.rebuild_index()
+        if count is None:
+            self.stdout.write('This database has no FTS5 search index to '
+                              'rebuild.')
+        else:
+            self.stdout.write('Indexed %s questions.' % count)
@@ -0,0 +1,52 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from learn import requeststats
+
+
+class Command(BaseCommand):
+    help = ("Lists the views with the slowest or most query heavy "
+            "requests, as sampled by RequestStatsMiddleware.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--top', type='int', default=10,
+                    help='Number of views listed.'),
+        make_option('--order', default='time',
+                    help='One of %s.' % ', '.join(
+                        sorted(requeststats.ORDERINGS))),
+        make_option('--reset', action='store_true', default=False,
+                    help='Clear the stats after listing them.'),
+    )
+
+    def handle(self, *args, **options):
+        if options['order'] not in requeststats.ORDERINGS:
+            raise CommandError('--order must be one of %s' % ', '.join(
+                sorted(requeststats.ORDERINGS)))
+
+        views = requeststats.top(options['top'], options['order'])
+        if not views:
+            self.stdout.write('No requests sampled. Check '
+                              'REQUEST_STATS_SAMPLE_RATE and that '
+                              'REQUEST_STATS_CACHE is shared with the '
+                              'web server.')
+
+        for stats in views:
+            render = stats['mean_render_time']
+            self.stdout.write(
+                '%s\n  %d requests, %.1f ms mean (max %.1f), '
+                '%.1f queries (max %d) taking %.1f ms, '
+                '%d duplicate queries, render %s' % (
+                    stats['view'], stats['requests'],
+                    stats['mean_time'] * 1000, stats['max_time'] * 1000,
+                    stats['mean_queries'], stats['max_queries'],
+                    stats['mean_sql_time'] * 1000,
+                    stats['duplicate_queries'],
+                    '-' if render is None else '%.1f ms' % (render * 1000)))
+            worst = stats['worst_duplicate']
+            if worst['count']:
+                self.stdout.write('  run %d times: %s' % (worst['count'],
+                                                          worst['sql']))
+
+        if options['reset']:
+            requeststats.reset()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+
+import re
+
+SCORE_CSV = re.compile(r'(?P<course>[^,]+),(?P<score>\d+),(?P<possible>\d+),')
+
+
+def split_progress_scores(apps, schema_editor):
+    """
+    Moves each "course,score,possible," triple of Progress.score into its
+    own CourseScore row. Triples naming a course that no longer exists
+    are dropped, duplicates of the same course are summed.
+    """
+    Course = apps.get_model('learn', 'Course')
+    Progress = apps.get_model('learn', 'Progress')
+    CourseScore = apps.get_model('learn', 'CourseScore')
+
+    courses = dict((name.lower(), pk) for pk, name in
+                   Course.objects.exclude(course=None)
+                                 .values_list('id', 'course'))
+    rows = []
+
+    for user_id, csv in Progress.objects.values_list('user_id', 'score'):
+        totals = {}
+        for match in SCORE_CSV.finditer(csv or ''):
+            course_id = courses.get(match.group('course').strip().lower())
+            if course_id is None:
+                continue
+            score, possible = totals.get(course_id, (0, 0))
+            totals[course_id] = (score + int(match.group('score')),
+                                 possible + int(match.group('possible')))
+
+        rows.extend(CourseScore(user_id=user_id,
+                                course_id=course_id,
+                                score=score,
+                                possible=possible)
+                    for course_id, (score, possible) in totals.items())
+
+    CourseScore.objects.bulk_create(rows, batch_size=500)
+
+
+def join_progress_scores(apps, schema_editor):
+    Progress = apps.get_model('learn', 'Progress')
+    CourseScore = apps.get_model('learn', 'CourseScore')
+
+    csv = {}
+    for user_id, course, score, possible in CourseScore.objects.values_list(
+            'user_id', 'course__course', 'score', 'possible'):
+        csv.setdefault(user_id, []).append(
+            '%s,%s,%s,' % (course, score, possible))
+
+    for progress in Progress.objects.all():
+        progress.score = ''.join(csv.get(progress.user_id, []))
+        progress.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('learn', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseScore',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('score', models.PositiveIntegerField(default=0)),
+                ('possible', models.PositiveIntegerField(default=0)),
+                ('course', models.ForeignKey(to='learn.Course')),
+                ('user', models.ForeignKey(to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Course score',
+                'verbose_name_plural': 'Course scores',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='coursescore',
+            unique_together=set([('user', 'course')]),
+        ),
+        migrations.AlterField(
+            model_name='progress',
+            name='score',
+            field=models.CommaSeparatedIntegerField(default='', max_length=1024, blank=True),
+        ),
+        migrations.RunPython(split_progress_scores, join_progress_scores),
+        migrations.RemoveField(
+            model_name='progress',
+            name='score',
+        ),
+    ]
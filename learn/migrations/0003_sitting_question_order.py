@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+
+from django.db import models, migrations
+
+
+def question_list_to_order(apps, schema_editor):
+    """
+    question_list only held the unanswered questions. The answered ones,
+    known from user_answers, are put in front of them and the cursor
+    placed after them.
+    """
+    Sitting = apps.get_model('learn', 'Sitting')
+
+    for sitting in Sitting.objects.all():
+        remaining = [int(q) for q in sitting.question_list.split(',') if q]
+        try:
+            answered = sorted(int(q) for q in json.loads(sitting.user_answers)
+                              if int(q) not in remaining)
+        except ValueError:
+            answered = []
+
+        sitting.question_order = json.dumps(answered + remaining)
+        sitting.cursor = len(answered)
+        sitting.save()
+
+
+def question_order_to_list(apps, schema_editor):
+    Sitting = apps.get_model('learn', 'Sitting')
+
+    for sitting in Sitting.objects.all():
+        remaining = json.loads(sitting.question_order)[sitting.cursor:]
+        sitting.question_list = ''.join('%s,' % q for q in remaining)
+        sitting.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learn', '0002_course_scores'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sitting',
+            name='cursor',
+            field=models.PositiveIntegerField(default=0),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='sitting',
+            name='question_order',
+            field=models.TextField(default='[]'),
+            preserve_default=True,
+        ),
+        migrations.AlterField(
+            model_name='sitting',
+            name='question_list',
+            field=models.CommaSeparatedIntegerField(default='', max_length=1024, blank=True),
+        ),
+        migrations.RunPython(question_list_to_order, question_order_to_list),
+        migrations.RemoveField(
+            model_name='sitting',
+            name='question_list',
+        ),
+    ]
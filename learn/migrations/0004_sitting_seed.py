@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learn', '0003_sitting_question_order'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sitting',
+            name='seed',
+            field=models.IntegerField(null=True, blank=True),
+            preserve_default=True,
+        ),
+    ]
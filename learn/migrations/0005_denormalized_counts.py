@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+
+from django.db import models, migrations
+
+
+def fill_counts(apps, schema_editor):
+    Quiz = apps.get_model('learn', 'Quiz')
+    Sitting = apps.get_model('learn', 'Sitting')
+
+    for quiz in Quiz.objects.all():
+        Quiz.objects.filter(pk=quiz.pk).update(
+            question_count=quiz.question_set.count())
+
+    for sitting in Sitting.objects.all():
+        sitting.max_score = len(json.loads(sitting.question_order))
+        sitting.save()
+
+
+def clear_counts(apps, schema_editor):
+    # the columns are dropped when unapplied
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learn', '0004_sitting_seed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='question_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='sitting',
+            name='max_score',
+            field=models.PositiveIntegerField(default=0),
+            preserve_default=True,
+        ),
+        migrations.RunPython(fill_counts, clear_counts),
+    ]
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+
+from django.db import models, migrations
+
+
+def split_user_answers(apps, schema_editor):
+    """
+    Creates a UserAnswer for every entry of the user_answers json of each
+    sitting. Answers to questions since deleted are dropped.
+    """
+    Sitting = apps.get_model('learn', 'Sitting')
+    Question = apps.get_model('learn', 'Question')
+    UserAnswer = apps.get_model('learn', 'UserAnswer')
+
+    questions = set(Question.objects.values_list('id', flat=True))
+    rows = []
+
+    for sitting in Sitting.objects.all():
+        try:
+            answers = json.loads(sitting.user_answers or '{}')
+        except ValueError:
+            continue
+        incorrect = set(int(q) for q in sitting.incorrect_questions.split(',')
+                        if q)
+
+        rows.extend(UserAnswer(sitting_id=sitting.id,
+                               question_id=int(question_id),
+                               guess=unicode(guess),
+                               is_correct=int(question_id) not in incorrect)
+                    for question_id, guess in answers.items()
+                    if int(question_id) in questions)
+
+    UserAnswer.objects.bulk_create(rows, batch_size=500)
+
+
+def join_user_answers(apps, schema_editor):
+    Sitting = apps.get_model('learn', 'Sitting')
+    UserAnswer = apps.get_model('learn', 'UserAnswer')
+
+    answers = {}
+    for sitting_id, question_id, guess in UserAnswer.objects.values_list(
+            'sitting_id', 'question_id', 'guess'):
+        answers.setdefault(sitting_id, {})[question_id] = guess
+
+    for sitting in Sitting.objects.all():
+        sitting.user_answers = json.dumps(answers.get(sitting.id, {}))
+        sitting.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learn', '0005_denormalized_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserAnswer',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('guess', models.TextField(blank=True)),
+                ('is_correct', models.BooleanField(default=False)),
+                ('answered_at', models.DateTimeField(auto_now_add=True)),
+                ('question', models.ForeignKey(to='learn.Question')),
+                ('sitting', models.ForeignKey(to='learn.Sitting')),
+            ],
+            options={
+                'verbose_name': 'User answer',
+                'verbose_name_plural': 'User answers',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='useranswer',
+            unique_together=set([('sitting', 'question')]),
+        ),
+        migrations.RunPython(split_user_answers, join_user_answers),
+        migrations.RemoveField(
+            model_name='sitting',
+            name='user_answers',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learn', '0006_user_answers'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='sitting',
+            index_together=set([('complete', 'quiz'), ('complete', 'user')]),
+        ),
+    ]
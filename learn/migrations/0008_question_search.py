@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, transaction, DatabaseError
+
+
+def create_search_index(apps, schema_editor):
+    """
+    An FTS5 table on SQLite, kept up to date by learn.search, or a GIN
+    index over the question text on PostgreSQL. Other databases, and
+    SQLite builds without FTS5, search with LIKE.
+    """
+    vendor = schema_editor.connection.vendor
+    cursor = schema_editor.connection.cursor()
+    if vendor == 'sqlite':
+        try:
+            with transaction.atomic():
+                cursor.execute(
+                    "CREATE VIRTUAL TABLE learn_question_fts USING fts5("
+                    "content, explanation, tokenize = 'porter unicode61')")
+        except DatabaseError:
+            return
+        cursor.execute(
+            'INSERT INTO learn_question_fts (rowid, content, explanation) '
+            'SELECT id, content, explanation FROM learn_question')
+    elif vendor == 'postgresql':
+        cursor.execute(
+            "CREATE INDEX learn_question_search ON learn_question USING gin "
+            "(to_tsvector('english', content || ' ' || explanation))")
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    cursor = schema_editor.connection.cursor()
+    if vendor == 'sqlite':
+        cursor.execute('DROP TABLE IF EXISTS learn_question_fts')
+    elif vendor == 'postgresql':
+        cursor.execute('DROP INDEX IF EXISTS learn_question_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learn', '0007_sitting_marking_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def fill_question_types(apps, schema_editor):
+    Question = apps.get_model('learn', 'Question')
+    for model_name in ('mcquestion', 'tf_question', 'essay_question'):
+        model = apps.get_model('learn', model_name)
+        Question.objects.filter(
+            id__in=model.objects.values('question_ptr')
+        ).update(question_type=model_name)
+
+
+def clear_question_types(apps, schema_editor):
+    # the column is dropped when unapplied
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learn', '0008_question_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='question_type',
+            field=models.CharField(max_length=30, editable=False, blank=True),
+            preserve_default=True,
+        ),
+        migrations.RunPython(fill_question_types, clear_question_types),
+    ]
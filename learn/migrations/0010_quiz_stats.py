@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('learn', '0009_question_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('sitting', models.PositiveIntegerField()),
+                ('percent', models.PositiveSmallIntegerField()),
+                ('achieved', models.DateTimeField()),
+                ('quiz', models.ForeignKey(to='learn.Quiz')),
+                ('user', models.ForeignKey(to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-percent', 'achieved'],
+                'verbose_name': 'Leaderboard entry',
+                'verbose_name_plural': 'Leaderboard entries',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='QuizStats',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('completions', models.PositiveIntegerField(default=0)),
+                ('score_sum', models.BigIntegerField(default=0)),
+                ('score_squares', models.BigIntegerField(default=0)),
+                ('passed', models.PositiveIntegerField(default=0)),
+                ('quiz', models.OneToOneField(related_name='stats', to='learn.Quiz')),
+            ],
+            options={
+                'verbose_name': 'Quiz statistics',
+                'verbose_name_plural': 'Quiz statistics',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='leaderboardentry',
+            unique_together=set([('quiz', 'user')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='leaderboardentry',
+            index_together=set([('quiz', 'percent')]),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learn', '0010_quiz_stats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sitting',
+            name='incorrect_questions',
+            field=models.TextField(blank=True),
+        ),
+    ]
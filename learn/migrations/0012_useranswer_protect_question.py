@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learn', '0011_sitting_incorrect_questions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='useranswer',
+            name='question',
+            field=models.ForeignKey(to='learn.Question', on_delete=django.db.models.deletion.PROTECT),
+            preserve_default=True,
+        ),
+    ]
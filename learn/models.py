@@ -1,12 +1,16 @@
 import re
 import json
+import random
+from collections import OrderedDict
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.dispatch import Signal
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator
 
-from model_utils.managers import InheritanceManager
+from model_utils.managers import InheritanceManager, InheritanceQuerySet
 
 
 # Create your models here.
@@ -24,6 +28,20 @@ class UserProfile(models.Model):
 		
 class CourseManager(models.Manager):
 
+    def lookup(self, course):
+        """
+        Accepts a Course or the name of one.
+        Returns the Course, or None if it does not exist.
+        """
+        if isinstance(course, Course):
+            return course
+        if not course:
+            return None
+        try:
+            return self.get(course__iexact=course)
+        except (Course.DoesNotExist, Course.MultipleObjectsReturned):
+            return None
+
     def new_course(self, course):
         new_course = self.create(course=re.sub('\s+', '-', course)
                                    .lower())
@@ -47,6 +65,34 @@ class Course(models.Model):
     def __unicode__(self):
         return unicode(self.course)
 
+# first parts of the paths of learn/urls.py, which a quiz url would hide
+RESERVED_QUIZ_URLS = frozenset(['register', 'login', 'restricted', 'logout',
+                                'course', 'progress', 'marking', 'search',
+                                'stats'])
+
+
+def normalize_quiz_url(url):
+    url = re.sub('\s+', '-', url).lower()
+    return ''.join(letter for letter in url if
+                   letter.isalnum() or letter == '-')
+
+
+class QuizManager(models.Manager):
+
+    def update_question_counts(self, quiz_ids):
+        """
+        Recounts the questions of the quizzes passed in and stores the
+        result in Quiz.question_count.
+        Returns a dict of quiz id to its new count.
+        """
+        through = Question.quiz.through
+        counts = {}
+        for quiz_id in set(quiz_ids):
+            counts[quiz_id] = through.objects.filter(quiz_id=quiz_id).count()
+            self.filter(id=quiz_id).update(question_count=counts[quiz_id])
+        return counts
+
+
 class Quiz(models.Model):
 
     title = models.CharField(max_length=60,
@@ -102,11 +148,17 @@ class Quiz(models.Model):
     fail_text = models.TextField(blank=True,
                                  help_text="Displayed if user fails.")
 
-    def save(self, force_insert=False, force_update=False, *args, **kwargs):
-        self.url = re.sub('\s+', '-', self.url).lower()
+    question_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = QuizManager()
 
-        self.url = ''.join(letter for letter in self.url if
-                           letter.isalnum() or letter == '-')
+    def clean(self):
+        if normalize_quiz_url(self.url or '') in RESERVED_QUIZ_URLS:
+            raise ValidationError({'url': [u'"%s" is used by another page'
+                                           % self.url]})
+
+    def save(self, force_insert=False, force_update=False, *args, **kwargs):
+        self.url = normalize_quiz_url(self.url)
 
         if self.single_attempt is True:
             self.exam_paper = True
@@ -114,6 +166,9 @@ class Quiz(models.Model):
         if self.pass_mark > 100:
             raise ValidationError(u'%s is above 100' % self.pass_mark)
 
+        if self.url in RESERVED_QUIZ_URLS:
+            raise ValidationError(u'"%s" is used by another page' % self.url)
+
         super(Quiz, self).save(force_insert, force_update, *args, **kwargs)
 
     class Meta:
@@ -124,11 +179,11 @@ class Quiz(models.Model):
         return unicode(self.title)
 
     def get_questions(self):
-        return self.question_set.all().select_subclasses()
+        return self.question_set.all().as_subclasses()
 
     @property
     def get_max_score(self):
-        return self.get_questions().count()
+        return self.question_count
 
     def anon_score_id(self):
         return str(self.id) + "_score"
@@ -140,8 +195,7 @@ class Quiz(models.Model):
 class ProgressManager(models.Manager):
 
     def new_progress(self, user):
-        new_progress = self.create(user=user,
-                                   score="")
+        new_progress = self.create(user=user)
         new_progress.save()
         return new_progress
 
@@ -151,13 +205,11 @@ class Progress(models.Model):
     Progress is used to track an individual signed in users score on different
     quiz's and categories
 
-    Data stored in csv using the format:
-        course, score, possible, course, score, possible, ...
+    The scores themselves are stored one row per course in CourseScore,
+    this model keeps the per user API used by the views.
     """
     user = models.OneToOneField("auth.User")
 
-    score = models.CommaSeparatedIntegerField(max_length=1024)
-
     objects = ProgressManager()
 
     class Meta:
@@ -175,136 +227,346 @@ class Progress(models.Model):
 
         The dict will have one key for every course that you have defined
         """
-        score_before = self.score
-        output = {}
-
-        for crs in Course.objects.all():
-            to_find = re.escape(Course.course) + r",(\d+),(\d+),"
-            #  group 1 is score, group 2 is highest possible
-
-            match = re.search(to_find, self.score, re.IGNORECASE)
-
-            if match:
-                score = int(match.group(1))
-                possible = int(match.group(2))
-
-                try:
-                    percent = int(round((float(score) / float(possible))
-                                        * 100))
-                except:
-                    percent = 0
-
-                output[cat.course] = [score, possible, percent]
-
-            else:  # if course has not been added yet, add it.
-                self.score += cat.course + ",0,0,"
-                output[cat.course] = [0, 0]
-
-        if len(self.score) > len(score_before):
-            # If a new course has been added, save changes.
-            self.save()
+        from learn.progress import course_scores
+        return course_scores(self.user_id)
 
-        return output
+    list_all_cat_scores = list_all_course_scores
 
     def check_cat_score(self, course_queried):
         """
         Pass in a course, get the users score and possible maximum score
         as the integers x,y respectively
         """
-        course_test = Course.objects.filter(course=course_queried) \
-                                        .exists()
+        course = Course.objects.lookup(course_queried)
 
-        if course_test is False:
+        if course is None:
             return "error", "course does not exist"
 
-        to_find = re.escape(course_queried) +\
-            r",(?P<score>\d+),(?P<possible>\d+),"
-        match = re.search(to_find, self.score, re.IGNORECASE)
-
-        if match:
-            return int(match.group('score')), int(match.group('possible'))
-
-        else:  # if not found but course exists, add course with 0 points
-            self.score += course_queried + ",0,0,"
-            self.save()
-
+        try:
+            return CourseScore.objects.filter(user=self.user_id,
+                                              course=course)\
+                                      .values_list('score', 'possible')[0]
+        except IndexError:
             return 0, 0
 
     def update_score(self, course, score_to_add=0, possible_to_add=0):
         """
-        Pass in string of the course name, amount to increase score
+        Pass in the course (or its name), amount to increase score
         and max possible.
 
         Does not return anything.
         """
-        course_test = Course.objects.filter(course=course) \
-                                        .exists()
+        course = Course.objects.lookup(course)
 
-        if any([course_test is False, score_to_add is False,
+        if any([course is None, score_to_add is False,
                 possible_to_add is False, str(score_to_add).isdigit() is False,
                 str(possible_to_add).isdigit() is False]):
             return "error", "course does not exist or invalid score"
 
-        to_find = re.escape(str(course)) +\
-            r",(?P<score>\d+),(?P<possible>\d+),"
+        CourseScore.objects.add_score(self.user_id, course,
+                                      abs(int(score_to_add)),
+                                      abs(int(possible_to_add)))
+        from learn.progress import forget_course_scores
+        forget_course_scores([self.user_id])
+
+    def show_exams(self):
+        """
+        Finds the previous quizzes marked as 'exam papers'.
+        Returns a queryset of complete exams.
+        """
+        return Sitting.objects.filter(user=self.user) \
+                              .filter(complete=True) \
+                              .select_related('quiz')
+
 
-        match = re.search(to_find, self.score, re.IGNORECASE)
+def course_percent(score, possible):
+    """
+    Percentage of score out of possible, rounded to an integer.
+    Returns 0 when nothing has been attempted.
+    """
+    if possible < 1:
+        return 0
+    return int(round((float(score) / float(possible)) * 100))
 
-        if match:
-            updated_score = int(match.group('score')) + abs(score_to_add)
-            updated_possible = int(match.group('possible')) +\
-                abs(possible_to_add)
 
-            new_score = (str(course) + "," +
-                         str(updated_score) + "," +
-                         str(updated_possible) + ",")
+def parse_answer_id(guess):
+    """
+    Returns the answer id of a multiple choice guess, None if the guess
+    is not an id at all.
+    """
+    try:
+        return int(guess)
+    except (TypeError, ValueError):
+        return None
 
-            # swap old score for the new one
-            self.score = self.score.replace(match.group(), new_score)
-            self.save()
 
-        else:
-            #  if not present but existing, add with the points passed in
-            self.score += (str(course) + "," +
-                           str(score_to_add) + "," +
-                           str(possible_to_add) + ",")
-            self.save()
+class CourseScoreManager(models.Manager):
 
-    def show_exams(self):
+    def add_score(self, user_id, course, score_to_add, possible_to_add):
         """
-        Finds the previous quizzes marked as 'exam papers'.
-        Returns a queryset of complete exams.
+        Atomically adds to the users score for a course, creating the row
+        the first time the course is attempted.
+        Course may be a Course or its primary key.
+
+        The cached scores of the user are left to the caller to drop, with
+        learn.progress.forget_course_scores, once its transaction has
+        committed; dropped any earlier, a concurrent read could cache the
+        old scores again.
         """
-        return Sitting.objects.filter(user=self.user) \
-                              .filter(complete=True)
+        from learn.database import add_to_row
+        add_to_row(self.model, {'user_id': user_id,
+                                'course_id': getattr(course, 'pk', course)},
+                   score=score_to_add, possible=possible_to_add)
+
+
+class CourseScore(models.Model):
+    """
+    Running score of a signed in user for one course.
+
+    Score is the number of questions answered correctly and possible is
+    the number of questions attempted. There is at most one row per user
+    and course.
+    """
+    user = models.ForeignKey("auth.User")
+
+    course = models.ForeignKey(Course)
+
+    score = models.PositiveIntegerField(default=0)
+
+    possible = models.PositiveIntegerField(default=0)
+
+    objects = CourseScoreManager()
+
+    class Meta:
+        unique_together = (('user', 'course'),)
+        verbose_name = "Course score"
+        verbose_name_plural = "Course scores"
+
+    def __unicode__(self):
+        return u'%s: %s/%s' % (self.course, self.score, self.possible)
+
+    @property
+    def percent(self):
+        return course_percent(self.score, self.possible)
+
+
+class QuizStats(models.Model):
+    """
+    Running totals of the sittings of one quiz, kept up to date by
+    learn.quizstats as sittings start, complete and are marked again.
+
+    Score_sum and score_squares are over the percent score of each
+    complete sitting, which gives the mean and spread without reading
+    the sittings.
+    """
+    quiz = models.OneToOneField(Quiz, related_name='stats')
+
+    attempts = models.PositiveIntegerField(default=0)
+
+    completions = models.PositiveIntegerField(default=0)
+
+    score_sum = models.BigIntegerField(default=0)
+
+    score_squares = models.BigIntegerField(default=0)
+
+    passed = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "Quiz statistics"
+        verbose_name_plural = "Quiz statistics"
+
+    def __unicode__(self):
+        return u'%s: %s/%s' % (self.quiz, self.completions, self.attempts)
 
+    @property
+    def mean(self):
+        if not self.completions:
+            return None
+        return float(self.score_sum) / self.completions
+
+    @property
+    def standard_deviation(self):
+        if not self.completions:
+            return None
+        variance = float(self.score_squares) / self.completions -\
+            self.mean ** 2
+        return max(variance, 0) ** 0.5
+
+    @property
+    def pass_rate(self):
+        return course_percent(self.passed, self.completions)
+
+
+class LeaderboardEntry(models.Model):
+    """
+    The best complete sitting of a user on a quiz, while it is one of
+    the best settings.QUIZ_LEADERBOARD_SIZE of the quiz.
+
+    Sitting is the id of the sitting and not a foreign key, because the
+    sittings of quizzes which are not exam papers are deleted when they
+    complete.
+    """
+    quiz = models.ForeignKey(Quiz)
+
+    user = models.ForeignKey('auth.User')
+
+    sitting = models.PositiveIntegerField()
+
+    percent = models.PositiveSmallIntegerField()
+
+    achieved = models.DateTimeField()
+
+    class Meta:
+        unique_together = (('quiz', 'user'),)
+        index_together = (('quiz', 'percent'),)
+        ordering = ['-percent', 'achieved']
+        verbose_name = "Leaderboard entry"
+        verbose_name_plural = "Leaderboard entries"
+
+    def __unicode__(self):
+        return u'%s: %s %s%%' % (self.quiz, self.user, self.percent)
+
+
+def new_seed():
+    return random.SystemRandom().randint(0, 2 ** 31 - 1)
+
+
+def shuffle_questions(question_ids, seed):
+    """
+    Returns the question id's in a random order decided by seed alone,
+    so the order of a sitting can be reproduced from its seed.
+    """
+    question_ids = sorted(question_ids)
+    random.Random(seed).shuffle(question_ids)
+    return question_ids
+
+
+# sent when a sitting is completed
+sitting_completed = Signal(providing_args=['sitting'])
+
+# sent when the score of a complete sitting changes through marking
+sitting_remarked = Signal(providing_args=['sitting', 'previous_score'])
 
 
 class SittingManager(models.Manager):
 
     def new_sitting(self, user, quiz):
-        if quiz.random_order is True:
-            question_set = quiz.question_set.all() \
-                                            .select_subclasses() \
-                                            .order_by('?')
-        else:
-            question_set = quiz.question_set.all() \
-                                            .select_subclasses()
+        from learn.quizcache import get_snapshot
+        questions = list(get_snapshot(quiz.id).question_ids)
 
-        questions = ""
-        for question in question_set:
-            questions += str(question.id) + ","
+        seed = None
+        if quiz.random_order is True:
+            seed = new_seed()
+            questions = shuffle_questions(questions, seed)
 
         new_sitting = self.create(user=user,
                                   quiz=quiz,
-                                  question_list=questions,
+                                  question_order=json.dumps(questions),
+                                  cursor=0,
+                                  seed=seed,
+                                  max_score=len(questions),
                                   incorrect_questions="",
                                   current_score=0,
-                                  complete=False,
-                                  user_answers='{}')
-        new_sitting.save()
+                                  complete=False)
         return new_sitting
 
+    def apply_marks(self, marks):
+        """
+        Pass in an iterable of (sitting id, question id, correct) marks,
+        across any number of complete sittings. A later mark for the same
+        question of a sitting replaces an earlier one.
+
+        All changes are written in one transaction: one UPDATE per changed
+        sitting, the answer rows and the course scores of the users.
+
+        Returns a dict of sitting id to its new score, percent and
+        incorrect questions, and a list of the marks which were refused.
+        """
+        decisions = OrderedDict()
+        for sitting_id, question_id, correct in marks:
+            decisions[(int(sitting_id), int(question_id))] = bool(correct)
+
+        errors = []
+        totals = {}
+        courses = dict(Question.objects.filter(
+            id__in=set(question_id for _, question_id in decisions))
+            .values_list('id', 'course_id'))
+
+        with transaction.atomic():
+            sittings = self.select_for_update().in_bulk(
+                set(sitting_id for sitting_id, _ in decisions))
+            previous_scores = dict((sitting_id, sitting.current_score)
+                                   for sitting_id, sitting in sittings.items())
+
+            course_deltas = {}
+            now_correct, now_incorrect = [], []
+            changed = set()
+
+            for (sitting_id, question_id), correct in decisions.items():
+                sitting = sittings.get(sitting_id)
+                if sitting is None or not sitting.complete or\
+                        question_id not in sitting.get_question_order():
+                    errors.append({'sitting': sitting_id,
+                                   'question': question_id,
+                                   'correct': correct})
+                    continue
+
+                incorrect = sitting.get_incorrect_questions
+                if correct and question_id in incorrect:
+                    incorrect.remove(question_id)
+                    delta = 1
+                    now_correct.append((sitting_id, question_id))
+                elif not correct and question_id not in incorrect:
+                    incorrect.append(question_id)
+                    delta = -1
+                    now_incorrect.append((sitting_id, question_id))
+                else:
+                    continue
+
+                sitting.incorrect_questions = ','.join(map(str, incorrect))
+                sitting.current_score += delta
+                changed.add(sitting_id)
+
+                course_id = courses.get(question_id)
+                if course_id is not None:
+                    key = (sitting.user_id, course_id)
+                    course_deltas[key] = course_deltas.get(key, 0) + delta
+
+            for sitting_id in changed:
+                sittings[sitting_id].save(update_fields=[
+                    'incorrect_questions', 'current_score'])
+
+            UserAnswer.objects.set_correct(now_correct, True)
+            UserAnswer.objects.set_correct(now_incorrect, False)
+
+            for (user_id, course_id), delta in course_deltas.items():
+                if delta:
+                    CourseScore.objects.filter(user=user_id,
+                                               course=course_id)\
+                                       .update(score=F('score') + delta)
+
+        from learn.progress import forget_course_scores
+        forget_course_scores(user_id for user_id, _ in course_deltas)
+        from learn.itemanalysis import marks_changed
+        marks_changed(sittings[sitting_id].quiz_id for sitting_id in changed)
+        for sitting_id in changed:
+            if sittings[sitting_id].current_score !=\
+                    previous_scores[sitting_id]:
+                sitting_remarked.send(
+                    sender=Sitting, sitting=sittings[sitting_id],
+                    previous_score=previous_scores[sitting_id])
+
+        for sitting_id in set(sitting_id for sitting_id, _ in decisions):
+            if sitting_id in sittings:
+                sitting = sittings[sitting_id]
+                totals[sitting_id] = {
+                    'score': sitting.current_score,
+                    'max_score': sitting.max_score,
+                    'percent': sitting.get_percent_correct,
+                    'incorrect_questions': sitting.get_incorrect_questions}
+
+        return totals, errors
+
     def user_sitting(self, user, quiz):
         if quiz.single_attempt is True and self.filter(user=user,
                                                        quiz=quiz,
@@ -319,6 +581,7 @@ class SittingManager(models.Manager):
         except Sitting.MultipleObjectsReturned:
             sitting = self.filter(user=user, quiz=quiz, complete=False)[0]
         finally:
+            sitting.quiz = quiz
             return sitting
 
 
@@ -327,36 +590,45 @@ class Sitting(models.Model):
     Used to store the progress of logged in users sitting a quiz.
     Replaces the session system used by anon users.
 
-    Question_list is a list of integers which represent id's of
-    the unanswered questions in csv format.
+    Question_order is a json list of the id's of every question in the
+    order they are asked, written once when the sitting starts. Cursor is
+    the position in it of the next unanswered question. When the quiz is
+    in random order, seed is the seed the order was shuffled with.
+
+    Incorrect_questions is a list of question id's in csv format, with no
+    limit on its length.
 
-    Incorrect_questions is a list in the same format.
+    Max_score is the number of questions in the sitting, fixed when it
+    starts.
 
     Sitting deleted when quiz finished unless quiz.exam_paper is true.
 
-    User_answers is a json object in which the question PK is stored
-    with the answer the user gave.
+    The answers given are stored one row each as UserAnswer.
     """
 
     user = models.ForeignKey('auth.User')
 
     quiz = models.ForeignKey(Quiz)
 
-    question_list = models.CommaSeparatedIntegerField(max_length=1024)
+    question_order = models.TextField(default='[]')
+
+    cursor = models.PositiveIntegerField(default=0)
 
-    incorrect_questions = models.CommaSeparatedIntegerField(max_length=1024,
-                                                            blank=True)
+    seed = models.IntegerField(blank=True, null=True)
+
+    incorrect_questions = models.TextField(blank=True)
 
     current_score = models.IntegerField()
 
-    complete = models.BooleanField(default=False, blank=False)
+    max_score = models.PositiveIntegerField(default=0)
 
-    user_answers = models.TextField(blank=True, default='{}')
+    complete = models.BooleanField(default=False, blank=False)
 
     objects = SittingManager()
 
     class Meta:
         permissions = (("view_sittings", "Can see completed exams."),)
+        index_together = (('complete', 'quiz'), ('complete', 'user'))
 
     def get_first_question(self):
         """
@@ -364,17 +636,27 @@ class Sitting(models.Model):
         If no question is found, returns False
         Does NOT remove the question from the front of the list.
         """
-        first_comma = self.question_list.find(',')
-        if first_comma == -1 or first_comma == 0:
+        question_order = self.get_question_order()
+        if self.cursor >= len(question_order):
             return False
-        question_id = int(self.question_list[:first_comma])
-        return Question.objects.get_subclass(id=question_id)
+        from learn.quizcache import get_question
+        return get_question(self.quiz_id, question_order[self.cursor])
 
     def remove_first_question(self):
-        first_comma = self.question_list.find(',')
-        if first_comma != -1 or first_comma != 0:
-            self.question_list = self.question_list[first_comma + 1:]
-            self.save()
+        self.cursor += 1
+        self.save(update_fields=['cursor'])
+
+    def get_question_order(self):
+        """
+        Returns the list of question id's of the sitting, parsed once.
+        """
+        if getattr(self, '_question_order', None) is None:
+            self._question_order = json.loads(self.question_order)
+        return self._question_order
+
+    @property
+    def questions_remaining(self):
+        return max(len(self.get_question_order()) - self.cursor, 0)
 
     def add_to_score(self, points):
         self.current_score += int(points)
@@ -387,7 +669,7 @@ class Sitting(models.Model):
     @property
     def get_percent_correct(self):
         dividend = float(self.current_score)
-        divisor = self.quiz.question_set.all().select_subclasses().count()
+        divisor = self.max_score
         if divisor < 1:
             return 0            # prevent divide by zero error
 
@@ -402,20 +684,36 @@ class Sitting(models.Model):
             return 0
 
     def mark_quiz_complete(self):
+        was_complete = self.complete
         self.complete = True
         self.save()
+        if not was_complete:
+            sitting_completed.send(sender=Sitting, sitting=self)
 
     def add_incorrect_question(self, question):
         """
         Adds uid of incorrect question to the list.
         The question object must be passed in.
         """
+        self._append_incorrect_question(question)
+        UserAnswer.objects.filter(sitting=self, question=question)\
+                          .update(is_correct=False)
+        self._save_marking(-1 if self.complete else 0)
+
+    def _save_marking(self, points):
+        """
+        Saves the incorrect questions and adds points to the score with
+        one UPDATE.
+        """
+        Sitting.objects.filter(pk=self.pk).update(
+            incorrect_questions=self.incorrect_questions,
+            current_score=F('current_score') + points)
+        self.current_score += points
+
+    def _append_incorrect_question(self, question):
         if len(self.incorrect_questions) > 0:
             self.incorrect_questions += ','
         self.incorrect_questions += str(question.id) + ","
-        if self.complete:
-            self.add_to_score(-1)
-        self.save()
 
     @property
     def get_incorrect_questions(self):
@@ -429,8 +727,9 @@ class Sitting(models.Model):
         current = self.get_incorrect_questions
         current.remove(question.id)
         self.incorrect_questions = ','.join(map(str, current))
-        self.add_to_score(1)
-        self.save()
+        UserAnswer.objects.filter(sitting=self, question=question)\
+                          .update(is_correct=True)
+        self._save_marking(1)
 
     @property
     def check_if_passed(self):
@@ -446,25 +745,275 @@ class Sitting(models.Model):
         else:
             return self.quiz.fail_text
 
-    def add_user_answer(self, question, guess):
-        current = json.loads(self.user_answers)
-        current[question.id] = guess
-        self.user_answers = json.dumps(current)
-        self.save()
+    def add_user_answer(self, question, guess, is_correct=False):
+        UserAnswer.objects.create(sitting=self,
+                                  question=question,
+                                  guess=guess,
+                                  is_correct=is_correct)
+
+    def get_user_answers(self):
+        """
+        Returns a dict of question id to the answer the user gave.
+        """
+        return dict(self.useranswer_set.values_list('question_id', 'guess'))
+
+    def record_answer(self, question, guess, is_correct):
+        """
+        Records the answer to the question at the cursor in one go.
+
+        The score or incorrect list and the cursor are changed in memory
+        and written with a single UPDATE, together with the answer row and
+        the users course score, in one transaction.
+        """
+        if is_correct is True:
+            self.current_score += 1
+        else:
+            self._append_incorrect_question(question)
+
+        self.cursor += 1
+
+        with transaction.atomic():
+            self.save(update_fields=['current_score', 'incorrect_questions',
+                                     'cursor'])
+            self.add_user_answer(question, guess, is_correct is True)
+            if question.course_id is not None:
+                CourseScore.objects.add_score(self.user_id,
+                                              question.course_id,
+                                              int(is_correct is True), 1)
+
+        if question.course_id is not None:
+            from learn.progress import forget_course_scores
+            forget_course_scores([self.user_id])
+
+    def get_remaining_questions(self):
+        """
+        Returns the questions not yet answered, in the order of the
+        sitting, from the quiz snapshot. Questions removed from the quiz
+        since the sitting started are loaded from the database together,
+        those deleted since are left out.
+        """
+        from learn.quizcache import get_snapshot
+        snapshot = get_snapshot(self.quiz_id)
+        remaining = self.get_question_order()[self.cursor:]
+        removed = dict((question.id, question) for question in
+                       Question.objects.filter(id__in=[
+                           question_id for question_id in remaining
+                           if snapshot.get_question(question_id) is None])
+                       .as_subclasses())
+        questions = []
+        for question_id in remaining:
+            question = snapshot.get_question(question_id) or\
+                removed.get(question_id)
+            if question is not None:
+                questions.append(question)
+        return questions
+
+    def record_answers(self, guesses):
+        """
+        Answers every question left in the sitting at once and completes
+        it. Pass in a dict of question id to guess; questions without a
+        guess are answered with an empty one.
+
+        The answers are graded in one pass against the quiz answer key,
+        essay questions are left for marking, and the answer rows, the
+        sitting and the users course scores are written in one
+        transaction. Returns a dict of question id to whether it was
+        answered correctly.
+        """
+        from learn.quizcache import get_snapshot
+        answer_key = get_snapshot(self.quiz_id).answer_key
+        questions = self.get_remaining_questions()
+        guesses = dict((question.id, unicode(guesses.get(question.id, '')))
+                       for question in questions)
+        graded = answer_key.grade_many(guesses)
+
+        answers = []
+        course_scores = {}
+        incorrect = self.get_incorrect_questions
+        for question in questions:
+            if question.id not in graded:
+                #  essay questions, and questions removed from the quiz
+                graded[question.id] = question.check_if_correct(
+                    guesses[question.id]) is True
+            is_correct = graded[question.id]
+            if is_correct:
+                self.current_score += 1
+            else:
+                incorrect.append(question.id)
+            answers.append(UserAnswer(sitting=self, question=question,
+                                      guess=guesses[question.id],
+                                      is_correct=is_correct))
+            if question.course_id is not None:
+                score, possible = course_scores.get(question.course_id,
+                                                    (0, 0))
+                course_scores[question.course_id] = (
+                    score + int(is_correct), possible + 1)
+
+        self.incorrect_questions = ','.join(map(str, incorrect))
+        self.cursor = len(self.get_question_order())
+
+        with transaction.atomic():
+            UserAnswer.objects.bulk_create(answers)
+            for course_id, (score, possible) in course_scores.items():
+                CourseScore.objects.add_score(self.user_id, course_id,
+                                              score, possible)
+            self.mark_quiz_complete()
+
+        from learn.progress import forget_course_scores
+        forget_course_scores([self.user_id])
+        return dict((question.id, graded[question.id])
+                    for question in questions)
 
     @property
     def questions_with_user_answers(self):
-        output = {}
-        user_answers = json.loads(self.user_answers)
-        for question in self.quiz.question_set.all().select_subclasses():
-            output[question] = user_answers[unicode(question.id)]
+        """
+        Returns a dict of each question of the quiz to the text of the
+        answer given, graded against the quiz answer key.
+        """
+        from learn.quizcache import get_snapshot
+        snapshot = get_snapshot(self.quiz_id)
+        key = snapshot.answer_key
+        output = OrderedDict()
+        user_answers = self.get_user_answers()
+        for question in snapshot.questions:
+            guess = user_answers.get(question.id, '')
+            output[question] = key.answer_to_string(question.id, guess)
         return output
 
+    def remark(self):
+        """
+        Grades every answer again against the current answer key, in one
+        pass. Essay questions keep the mark given by hand.
+        """
+        from learn.quizcache import get_snapshot
+        key = get_snapshot(self.quiz_id).answer_key
+        user_answers = self.get_user_answers()
+        graded = key.grade_many(user_answers)
+
+        previous_score = self.current_score
+        incorrect = [question_id for question_id in self.get_incorrect_questions
+                     if question_id not in graded]
+        incorrect += [question_id for question_id, is_correct
+                      in sorted(graded.items()) if not is_correct]
+
+        self.incorrect_questions = ','.join(map(str, incorrect))
+        self.current_score = len(user_answers) - len(incorrect)
+
+        with transaction.atomic():
+            self.save(update_fields=['incorrect_questions', 'current_score'])
+            answers = self.useranswer_set.filter(question__in=graded.keys())
+            answers.exclude(question__in=incorrect).update(is_correct=True)
+            answers.filter(question__in=incorrect).update(is_correct=False)
+
+        from learn.itemanalysis import marks_changed
+        marks_changed([self.quiz_id])
+        if self.complete and self.current_score != previous_score:
+            sitting_remarked.send(sender=Sitting, sitting=self,
+                                  previous_score=previous_score)
+
+
+class UserAnswerManager(models.Manager):
+
+    def set_correct(self, pairs, is_correct):
+        """
+        Sets is_correct on the answers of the (sitting id, question id)
+        pairs passed in, with one query to find them and one to update.
+        """
+        pairs = set(pairs)
+        if not pairs:
+            return
+        ids = [answer_id for answer_id, sitting_id, question_id in
+               self.filter(sitting__in=set(p[0] for p in pairs),
+                           question__in=set(p[1] for p in pairs))
+                   .values_list('id', 'sitting_id', 'question_id')
+               if (sitting_id, question_id) in pairs]
+        self.filter(id__in=ids).update(is_correct=is_correct)
+
+
+class UserAnswer(models.Model):
+    """
+    The answer given to one question of a sitting.
+
+    Guess is stored as submitted: an answer id for multiple choice
+    questions, "True" or "False" for true/false questions and the text
+    of essay answers. Is_correct follows any later marking. Questions
+    which have been answered cannot be deleted, so marks and item
+    analysis keep the question they were given for.
+    """
+    sitting = models.ForeignKey(Sitting)
+
+    question = models.ForeignKey('Question', on_delete=models.PROTECT)
+
+    guess = models.TextField(blank=True)
+
+    is_correct = models.BooleanField(default=False)
+
+    answered_at = models.DateTimeField(auto_now_add=True)
+
+    objects = UserAnswerManager()
+
+    class Meta:
+        unique_together = (('sitting', 'question'),)
+        verbose_name = "User answer"
+        verbose_name_plural = "User answers"
+
+    def __unicode__(self):
+        return unicode(self.guess)
+
+
+class QuestionQuerySet(InheritanceQuerySet):
+
+    def as_subclasses(self, *related):
+        """
+        Evaluates the queryset to a list of questions as their subclasses.
+
+        Unlike select_subclasses, which outer joins every subclass table,
+        this reads the ids and question types first and then loads each
+        type present with one query (a batch of ids at a time), in
+        which the fields named in related are selected as well.
+        """
+        rows = list(self.values_list('id', 'question_type'))
+        ids_by_type = {}
+        for question_id, question_type in rows:
+            ids_by_type.setdefault(question_type, []).append(question_id)
+
+        loaded = {}
+        for question_type, ids in ids_by_type.items():
+            model = QUESTION_MODELS.get(question_type, Question)
+            queryset = model._base_manager.all()
+            if related:
+                queryset = queryset.select_related(*related)
+            for start in range(0, len(ids), QUESTION_BATCH):
+                loaded.update(
+                    (question.pk, question) for question in
+                    queryset.filter(pk__in=ids[start:start + QUESTION_BATCH]))
+
+        return [loaded[question_id] for question_id, _ in rows
+                if question_id in loaded]
+
+    def get_subclass(self, *args, **kwargs):
+        question_id, question_type = self.values_list(
+            'id', 'question_type').get(*args, **kwargs)
+        model = QUESTION_MODELS.get(question_type, Question)
+        return model._base_manager.get(pk=question_id)
+
+
+class QuestionManager(InheritanceManager):
+
+    def get_queryset(self):
+        return QuestionQuerySet(self.model, using=self._db)
+
+    def as_subclasses(self, *related):
+        return self.get_queryset().as_subclasses(*related)
+
 
 class Question(models.Model):
     """
     Base class for all question types.
     Shared properties placed here.
+
+    question_type holds the model name of the subclass a question was
+    saved as, see QuestionQuerySet.as_subclasses.
     """
 
     quiz = models.ManyToManyField(Quiz,
@@ -487,11 +1036,20 @@ class Question(models.Model):
                                              "been answered.",
                                    verbose_name='Explanation')
 
-    objects = InheritanceManager()
+    question_type = models.CharField(max_length=30,
+                                     blank=True,
+                                     editable=False)
+
+    objects = QuestionManager()
 
     class Meta:
         ordering = ['course']
 
+    def save(self, *args, **kwargs):
+        if type(self) is not Question:
+            self.question_type = self._meta.model_name
+        super(Question, self).save(*args, **kwargs)
+
     def __unicode__(self):
         return unicode(self.content)
 
@@ -535,23 +1093,49 @@ class TF_Question(Question):
 
 class MCQuestion(Question):
 
-    def check_if_correct(self, guess):
-        answer = Answer.objects.get(id=guess)
+    def set_answer_cache(self, answers):
+        """
+        Stores already loaded answers so the methods below do not query.
+        """
+        self._answer_cache = list(answers)
+        self._answer_key = None
 
-        if answer.correct is True:
-            return True
-        else:
-            return False
+    def get_answer_cache(self):
+        if not hasattr(self, '_answer_cache'):
+            self.set_answer_cache(Answer.objects.filter(question=self)
+                                                .order_by('id'))
+        return self._answer_cache
+
+    def get_answer_key(self):
+        """
+        Returns the set of correct answer ids and a dict of answer id to
+        content for the answers of this question.
+        """
+        if getattr(self, '_answer_key', None) is None:
+            answers = self.get_answer_cache()
+            self._answer_key = (
+                frozenset(answer.id for answer in answers if answer.correct),
+                dict((answer.id, answer.content) for answer in answers))
+        return self._answer_key
+
+    def check_if_correct(self, guess):
+        correct, content = self.get_answer_key()
+        return parse_answer_id(guess) in correct
 
     def get_answers(self):
-        return Answer.objects.filter(question=self)
+        return self.get_answer_cache()
 
     def get_answers_list(self):
         return [(answer.id, answer.content) for answer in
-                Answer.objects.filter(question=self)]
+                self.get_answer_cache()]
 
     def answer_choice_to_string(self, guess):
-        return Answer.objects.get(id=guess).content
+        """
+        Returns the content of the answer guessed, an empty string if it
+        is not an answer to this question.
+        """
+        correct, content = self.get_answer_key()
+        return content.get(parse_answer_id(guess), '')
 
     class Meta:
         verbose_name = "Multiple Choice Question"
@@ -593,4 +1177,12 @@ class Essay_Question(Question):
 
     class Meta:
         verbose_name = "Essay style question"
-		
\ No newline at end of file
+		
+
+
+# the subclasses of Question by their question_type
+QUESTION_MODELS = dict((model._meta.model_name, model)
+                       for model in (MCQuestion, TF_Question, Essay_Question))
+
+# stays under the 999 parameters SQLite allows in one query
+QUESTION_BATCH = 500
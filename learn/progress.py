@@ -0,0 +1,83 @@
+"""
+Per user progress: the score of every course and the exams sat.
+
+Course scores are read with a single query, a left join of every course
+to the user's CourseScore rows, and kept in the default cache until one
+of the user's scores or the list of courses changes.
+"""
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.db import connection
+
+from learn.models import Course, CourseScore, Sitting, course_percent
+
+CACHE_TIMEOUT = 60 * 60
+
+EXAMS_PER_PAGE = 20
+
+_COURSES_VERSION = 'progress_courses_version'
+
+
+def _scores_key(user_id):
+    return 'progress_%s_%s' % (user_id, cache.get(_COURSES_VERSION, 0))
+
+
+def course_scores(user_id):
+    """
+    Returns an ordered dict of course name to a list of the score, the
+    possible score and the percentage correct, with every course in it.
+    """
+    key = _scores_key(user_id)
+    scores = cache.get(key)
+    if scores is not None:
+        return scores
+
+    sql = ('SELECT c.course, COALESCE(s.score, 0), COALESCE(s.possible, 0)'
+           ' FROM {course} c LEFT OUTER JOIN {score} s'
+           ' ON s.course_id = c.id AND s.user_id = %s'
+           ' ORDER BY c.course').format(course=Course._meta.db_table,
+                                        score=CourseScore._meta.db_table)
+    cursor = connection.cursor()
+    cursor.execute(sql, [user_id])
+
+    scores = OrderedDict((course, [score, possible,
+                                   course_percent(score, possible)])
+                         for course, score, possible in cursor.fetchall())
+    cache.set(key, scores, CACHE_TIMEOUT)
+    return scores
+
+
+def forget_course_scores(user_ids):
+    """
+    Drops the cached course scores of the users passed in.
+    """
+    cache.delete_many([_scores_key(user_id) for user_id in set(user_ids)])
+
+
+def courses_changed(**kwargs):
+    """
+    Signal handler for Course saves and deletes, drops every user's
+    cached course scores.
+    """
+    try:
+        cache.incr(_COURSES_VERSION)
+    except ValueError:
+        cache.set(_COURSES_VERSION, 1, None)
+
+
+def exam_page(user, page=1):
+    """
+    Returns a page of the complete exams of the user, newest first.
+    """
+    exams = Sitting.objects.filter(user=user, complete=True)\
+                           .select_related('quiz')\
+                           .order_by('-id')
+    paginator = Paginator(exams, EXAMS_PER_PAGE)
+    try:
+        return paginator.page(page)
+    except PageNotAnInteger:
+        return paginator.page(1)
+    except EmptyPage:
+        return paginator.page(paginator.num_pages)
@@ -0,0 +1,255 @@
+"""
+Compiled, read only snapshots of quiz content.
+
+Serving a question needs the question (as its subclass), its course and,
+for multiple choice questions, the answers. Quiz content only changes
+when staff edit it, so each quiz is loaded once into a QuizSnapshot and
+kept in process. Snapshots are versioned: the version of every quiz is
+kept in the cache named by settings.QUIZ_CACHE and bumped by the signal
+handlers at the bottom of this module, so every process sharing that
+cache (a file or memcached backend) drops its stale copy.
+
+The signals are sent before the edit commits, and a snapshot built in
+between holds the content from before it, so QuizCacheMiddleware bumps
+the versions of the quizzes changed during a request once more after
+the view has returned; code editing quizzes outside a request calls
+invalidate_pending after its transaction. Snapshots, in process and in
+the cache, expire after settings.QUIZ_CACHE_TIMEOUT seconds and are then
+built again, which bounds how long a process whose cache is not shared
+(the default locmem backend) serves old content. Versions are kept until
+bumped, since sittings and cached results are keyed on them.
+
+The question instances held by a snapshot are shared between requests
+and must be treated as read only.
+"""
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.db.models.signals import post_save, pre_delete, post_delete,\
+    m2m_changed
+
+from learn.grading import AnswerKey
+from learn.models import Course, Quiz, Question, MCQuestion, TF_Question,\
+    Essay_Question, Answer
+
+_snapshots = {}
+
+_pending = threading.local()
+
+
+def _cache():
+    return caches[getattr(settings, 'QUIZ_CACHE', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'QUIZ_CACHE_TIMEOUT', 300)
+
+
+def _version_key(quiz_id):
+    return 'quiz_version_%s' % quiz_id
+
+
+def _snapshot_key(quiz_id, version):
+    return 'quiz_snapshot_%s_%s' % (quiz_id, version)
+
+
+def get_version(quiz_id):
+    """
+    Returns the current content version of a quiz.
+    A version lost from the cache is replaced with a new one.
+    """
+    cache = _cache()
+    version = cache.get(_version_key(quiz_id))
+    if version is None:
+        version = int(time.time() * 1000)
+        if not cache.add(_version_key(quiz_id), version, None):
+            version = cache.get(_version_key(quiz_id), version)
+    return version
+
+
+class QuizSnapshot(object):
+    """
+    The questions of one quiz, in their set order, with course and
+    answers already loaded.
+    """
+
+    def __init__(self, quiz_id, version, questions):
+        self.quiz_id = quiz_id
+        self.version = version
+        self.questions = questions
+        self.question_ids = [question.id for question in questions]
+        self._by_id = dict((question.id, question) for question in questions)
+        self._answer_key = None
+
+    def __len__(self):
+        return len(self.questions)
+
+    @property
+    def order_checksum(self):
+        """
+        A checksum of the question ids in their set order, which only
+        changes when questions are added, removed or reordered.
+        """
+        if getattr(self, '_order_checksum', None) is None:
+            self._order_checksum = zlib.crc32(
+                ','.join(map(str, self.question_ids))) & 0xffffffff
+        return self._order_checksum
+
+    def get_question(self, question_id):
+        return self._by_id.get(int(question_id))
+
+    @property
+    def answer_key(self):
+        if self._answer_key is None:
+            self._answer_key = AnswerKey(self.questions)
+        return self._answer_key
+
+    @classmethod
+    def build(cls, quiz_id, version):
+        questions = Question.objects.filter(quiz=quiz_id)\
+                                    .as_subclasses('course')
+
+        answers = {}
+        for answer in Answer.objects.filter(question__quiz=quiz_id)\
+                                    .order_by('id'):
+            answers.setdefault(answer.question_id, []).append(answer)
+
+        for question in questions:
+            if isinstance(question, MCQuestion):
+                question.set_answer_cache(answers.get(question.id, []))
+
+        return cls(quiz_id, version, questions)
+
+
+def get_snapshot(quiz_id):
+    """
+    Returns the QuizSnapshot of the current version of a quiz, building
+    it only if neither this process nor the shared cache has it.
+    """
+    version = get_version(quiz_id)
+    snapshot, expires = _snapshots.get(quiz_id, (None, 0))
+    if snapshot is not None and snapshot.version == version and\
+            expires > time.time():
+        return snapshot
+
+    cache = _cache()
+    snapshot = cache.get(_snapshot_key(quiz_id, version))
+    if snapshot is None:
+        snapshot = QuizSnapshot.build(quiz_id, version)
+        cache.set(_snapshot_key(quiz_id, version), snapshot, _timeout())
+
+    _snapshots[quiz_id] = (snapshot, time.time() + _timeout())
+    return snapshot
+
+
+def get_question(quiz_id, question_id):
+    """
+    Returns a question of the quiz from its snapshot.
+    Questions removed from the quiz since are loaded from the database.
+    """
+    question = get_snapshot(quiz_id).get_question(question_id)
+    if question is None:
+        question = Question.objects.get_subclass(id=question_id)
+    return question
+
+
+def _bump(quiz_ids):
+    cache = _cache()
+    for quiz_id in quiz_ids:
+        try:
+            cache.incr(_version_key(quiz_id))
+        except ValueError:
+            # not cached, the next get_version starts a new version
+            pass
+        _snapshots.pop(quiz_id, None)
+
+
+def invalidate(quiz_ids):
+    """
+    Bumps the versions of the quizzes. Inside a transaction they are kept
+    to be bumped again by invalidate_pending once it has committed.
+    """
+    quiz_ids = set(quiz_ids)
+    _bump(quiz_ids)
+    if connection.in_atomic_block:
+        if getattr(_pending, 'quiz_ids', None) is None:
+            _pending.quiz_ids = set()
+        _pending.quiz_ids.update(quiz_ids)
+
+
+def invalidate_pending():
+    """
+    Bumps the versions of the quizzes changed inside a transaction, call
+    it once the transaction has committed or rolled back.
+    """
+    quiz_ids = getattr(_pending, 'quiz_ids', None)
+    _pending.quiz_ids = None
+    if quiz_ids:
+        _bump(quiz_ids)
+
+
+class QuizCacheMiddleware(object):
+    """
+    Bumps the versions of the quizzes changed by the view, after its
+    transaction (the admin's, or ATOMIC_REQUESTS) has ended.
+    """
+
+    def process_response(self, request, response):
+        invalidate_pending()
+        return response
+
+    def process_exception(self, request, exception):
+        invalidate_pending()
+
+
+def _quizzes_of_question(question_id):
+    return Quiz.objects.filter(question=question_id)\
+                       .values_list('id', flat=True)
+
+
+def quiz_changed(sender, instance, **kwargs):
+    invalidate([instance.pk])
+
+
+def question_changed(sender, instance, **kwargs):
+    invalidate(_quizzes_of_question(instance.pk))
+
+
+def answer_changed(sender, instance, **kwargs):
+    invalidate(_quizzes_of_question(instance.question_id))
+
+
+def course_changed(sender, instance, **kwargs):
+    invalidate(Quiz.objects.filter(question__course=instance)
+                           .values_list('id', flat=True))
+
+
+def question_quizzes_changed(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    if reverse:
+        # quiz.question_set was changed
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        invalidate(pk_set)
+    elif action == 'pre_clear':
+        invalidate(_quizzes_of_question(instance.pk))
+
+
+def connect_signals():
+    for model in (Question, MCQuestion, TF_Question, Essay_Question):
+        post_save.connect(question_changed, sender=model)
+        # the quiz links are gone by post_delete
+        pre_delete.connect(question_changed, sender=model)
+
+    post_save.connect(quiz_changed, sender=Quiz)
+    post_delete.connect(quiz_changed, sender=Quiz)
+    post_save.connect(answer_changed, sender=Answer)
+    post_delete.connect(answer_changed, sender=Answer)
+    post_save.connect(course_changed, sender=Course)
+    m2m_changed.connect(question_quizzes_changed,
+                        sender=Question.quiz.through)
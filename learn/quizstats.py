@@ -0,0 +1,199 @@
+"""
+Per quiz statistics and leaderboards, kept up to date as sittings happen.
+
+QuizStats counts the sittings of a quiz started, completed and passed,
+with the sum and the sum of squares of their percent scores. The
+leaderboard keeps the best sitting of each of the top users of a quiz,
+at most settings.QUIZ_LEADERBOARD_SIZE entries; a sitting which does not
+beat the lowest entry of a full board costs a couple of indexed lookups
+and no write. Neither needs the sittings afterwards, which matters as
+the sittings of quizzes that are not exam papers are deleted when they
+complete.
+
+The handlers below are connected in learn.signals. Re-marking corrects
+the totals and moves the entry of the sitting. A sitting marked down
+keeps its entry, at its new score, as the sittings below the board are
+not kept; rebuild() recounts everything from the sittings still in the
+database.
+"""
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.db.models import F, Max, Sum
+from django.utils import timezone
+
+from learn.database import add_to_row
+from learn.models import Quiz, QuizStats, LeaderboardEntry, Sitting,\
+    course_percent
+
+
+def leaderboard_size():
+    return getattr(settings, 'QUIZ_LEADERBOARD_SIZE', 10)
+
+
+def percent_of(score, max_score):
+    """
+    Sitting.get_percent_correct of a score.
+    """
+    return max(0, min(course_percent(score, max_score), 100))
+
+
+def offer(quiz_id, user_id, sitting_id, percent):
+    """
+    Enters a complete sitting on the leaderboard of its quiz if it is
+    the best of its user and the board has room or it beats the lowest
+    entry, which then drops off.
+    """
+    entries = LeaderboardEntry.objects.filter(quiz=quiz_id)
+    with transaction.atomic():
+        own = entries.select_for_update().filter(user=user_id).first()
+        if own is not None:
+            if percent > own.percent:
+                own.sitting = sitting_id
+                own.percent = percent
+                own.achieved = timezone.now()
+                own.save(update_fields=['sitting', 'percent', 'achieved'])
+            return
+
+        # the last entry of a full board
+        size = leaderboard_size()
+        last = list(entries.select_for_update()
+                           .order_by('-percent', 'achieved')[size - 1:size])
+        if last:
+            if percent <= last[0].percent:
+                return
+            last[0].delete()
+
+        try:
+            with transaction.atomic():
+                LeaderboardEntry.objects.create(
+                    quiz_id=quiz_id, user_id=user_id, sitting=sitting_id,
+                    percent=percent, achieved=timezone.now())
+        except IntegrityError:
+            # the user's entry was made by another request
+            pass
+
+
+def sitting_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        add_to_row(QuizStats, {'quiz_id': instance.quiz_id},
+                   attempts=1)
+
+
+def sitting_completed(sender, sitting, **kwargs):
+    percent = sitting.get_percent_correct
+    add_to_row(QuizStats, {'quiz_id': sitting.quiz_id}, completions=1,
+               score_sum=percent, score_squares=percent * percent,
+               passed=int(sitting.check_if_passed))
+    offer(sitting.quiz_id, sitting.user_id, sitting.id, percent)
+
+
+def sitting_remarked(sender, sitting, previous_score, **kwargs):
+    before = percent_of(previous_score, sitting.max_score)
+    after = sitting.get_percent_correct
+    pass_mark = sitting.quiz.pass_mark
+    QuizStats.objects.filter(quiz=sitting.quiz_id).update(
+        score_sum=F('score_sum') + after - before,
+        score_squares=F('score_squares') + after * after - before * before,
+        passed=F('passed') + int(after >= pass_mark) -
+        int(before >= pass_mark))
+
+    if not LeaderboardEntry.objects.filter(
+            quiz=sitting.quiz_id, sitting=sitting.id)\
+            .update(percent=after):
+        offer(sitting.quiz_id, sitting.user_id, sitting.id, after)
+
+
+def rebuild(quiz_ids=None):
+    """
+    Recounts the statistics and leaderboards of the quizzes passed in,
+    or of every quiz, from their sittings in the database.
+    Returns the number of sittings read.
+    """
+    if quiz_ids is None:
+        quiz_ids = list(Quiz.objects.values_list('id', flat=True))
+    quiz_ids = list(quiz_ids)
+    pass_marks = dict(Quiz.objects.filter(id__in=quiz_ids)
+                                  .values_list('id', 'pass_mark'))
+    now = timezone.now()
+
+    totals = {}
+    best = {}
+    sittings = Sitting.objects.filter(quiz__in=quiz_ids)\
+        .annotate(finished=Max('useranswer__answered_at'))\
+        .values_list('id', 'quiz_id', 'user_id', 'complete',
+                     'current_score', 'max_score', 'finished')
+    count = 0
+    for sitting_id, quiz_id, user_id, complete, score, max_score, finished\
+            in sittings.iterator():
+        count += 1
+        stats = totals.setdefault(quiz_id, QuizStats(quiz_id=quiz_id))
+        stats.attempts += 1
+        if not complete:
+            continue
+        percent = percent_of(score, max_score)
+        stats.completions += 1
+        stats.score_sum += percent
+        stats.score_squares += percent * percent
+        stats.passed += int(percent >= pass_marks[quiz_id])
+
+        entry = (percent, sitting_id, finished or now)
+        users = best.setdefault(quiz_id, {})
+        if user_id not in users or percent > users[user_id][0]:
+            users[user_id] = entry
+
+    size = leaderboard_size()
+    entries = []
+    for quiz_id, users in best.items():
+        ranked = sorted(users.items(),
+                        key=lambda item: (-item[1][0], item[1][2]))
+        entries.extend(LeaderboardEntry(quiz_id=quiz_id, user_id=user_id,
+                                        sitting=sitting_id, percent=percent,
+                                        achieved=achieved)
+                       for user_id, (percent, sitting_id, achieved)
+                       in ranked[:size])
+
+    with transaction.atomic():
+        QuizStats.objects.filter(quiz__in=quiz_ids).delete()
+        LeaderboardEntry.objects.filter(quiz__in=quiz_ids).delete()
+        QuizStats.objects.bulk_create(totals.values())
+        LeaderboardEntry.objects.bulk_create(entries)
+    return count
+
+
+def _summary(stats):
+    return {'attempts': stats.attempts,
+            'completions': stats.completions,
+            'mean': stats.mean,
+            'standard_deviation': stats.standard_deviation,
+            'passed': stats.passed,
+            'pass_rate': stats.pass_rate}
+
+
+def quiz_summary(quiz):
+    """
+    The statistics and leaderboard of a quiz, as a dict.
+    """
+    try:
+        stats = quiz.stats
+    except QuizStats.DoesNotExist:
+        stats = QuizStats(quiz=quiz)
+    summary = _summary(stats)
+    summary['leaderboard'] = [
+        {'user': username, 'percent': percent, 'achieved': achieved}
+        for username, percent, achieved in
+        LeaderboardEntry.objects.filter(quiz=quiz)
+                                .values_list('user__username', 'percent',
+                                             'achieved')]
+    return summary
+
+
+def course_summary(course):
+    """
+    The statistics of every quiz of a course added together, as a dict.
+    """
+    sums = QuizStats.objects.filter(quiz__course=course).aggregate(
+        attempts=Sum('attempts'), completions=Sum('completions'),
+        score_sum=Sum('score_sum'), score_squares=Sum('score_squares'),
+        passed=Sum('passed'))
+    return _summary(QuizStats(**dict((field, value or 0)
+                                     for field, value in sums.items())))
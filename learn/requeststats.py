@@ -0,0 +1,243 @@
+"""
+Per view query counts and timings, sampled from live requests.
+
+RequestStatsMiddleware looks at a share of requests, given by
+settings.REQUEST_STATS_SAMPLE_RATE (0 to 1), and records for the view
+that served each one the total time, the number of queries on the
+default database, their time, how many of them repeated a statement
+already run in the same request and the template render time.
+
+The numbers are added up in process and written every
+settings.REQUEST_STATS_FLUSH_INTERVAL seconds to the cache named by
+settings.REQUEST_STATS_CACHE, one entry per process. collect() adds
+together the entries of every process which shares that cache, so use
+a file or memcached backend when the report is read from another
+process (the request_stats command).
+"""
+import copy
+import os
+import random
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+
+PROCESSES_KEY = 'request_stats_processes'
+
+ORDERINGS = {
+    'time': 'mean_time',
+    'queries': 'mean_queries',
+    'sql_time': 'mean_sql_time',
+    'duplicates': 'duplicate_queries',
+    'render_time': 'mean_render_time',
+    'requests': 'requests',
+}
+
+_lock = threading.Lock()
+_stats = {}
+_last_flush = [time.time()]
+
+
+def _cache():
+    return caches[getattr(settings, 'REQUEST_STATS_CACHE', 'default')]
+
+
+def _process_key():
+    return 'request_stats_%s_%s' % (socket.gethostname(), os.getpid())
+
+
+class ViewStats(object):
+    """
+    Totals and maxima of the sampled requests of one view.
+    """
+
+    def __init__(self, view):
+        self.view = view
+        self.requests = 0
+        self.time = 0.0
+        self.max_time = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.sql_time = 0.0
+        self.duplicate_queries = 0
+        self.worst_duplicate = (0, '')
+        self.renders = 0
+        self.render_time = 0.0
+
+    def add(self, elapsed, queries, sql_time, duplicates, worst_duplicate,
+            render_time=None):
+        self.requests += 1
+        self.time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.queries += queries
+        self.max_queries = max(self.max_queries, queries)
+        self.sql_time += sql_time
+        self.duplicate_queries += duplicates
+        self.worst_duplicate = max(self.worst_duplicate, worst_duplicate)
+        if render_time is not None:
+            self.renders += 1
+            self.render_time += render_time
+
+    def merge(self, other):
+        self.requests += other.requests
+        self.time += other.time
+        self.max_time = max(self.max_time, other.max_time)
+        self.queries += other.queries
+        self.max_queries = max(self.max_queries, other.max_queries)
+        self.sql_time += other.sql_time
+        self.duplicate_queries += other.duplicate_queries
+        self.worst_duplicate = max(self.worst_duplicate,
+                                   other.worst_duplicate)
+        self.renders += other.renders
+        self.render_time += other.render_time
+
+    def as_dict(self):
+        requests = self.requests or 1
+        return {
+            'view': self.view,
+            'requests': self.requests,
+            'mean_time': self.time / requests,
+            'max_time': self.max_time,
+            'mean_queries': float(self.queries) / requests,
+            'max_queries': self.max_queries,
+            'mean_sql_time': self.sql_time / requests,
+            'duplicate_queries': self.duplicate_queries,
+            'worst_duplicate': {'count': self.worst_duplicate[0],
+                                'sql': self.worst_duplicate[1]},
+            'mean_render_time': (self.render_time / self.renders
+                                 if self.renders else None),
+        }
+
+
+def record(view, elapsed, queries, render_time=None):
+    """
+    Adds one sampled request of view. queries is the list of queries it
+    ran, as found in connection.queries.
+    """
+    statements = {}
+    for query in queries:
+        statements[query['sql']] = statements.get(query['sql'], 0) + 1
+    worst = max([(count, sql[:500]) for sql, count in statements.items()]
+                or [(0, '')])
+
+    with _lock:
+        stats = _stats.get(view)
+        if stats is None:
+            stats = _stats[view] = ViewStats(view)
+        stats.add(elapsed, len(queries),
+                  sum(float(query['time']) for query in queries),
+                  len(queries) - len(statements),
+                  worst if worst[0] > 1 else (0, ''),
+                  render_time)
+
+    interval = getattr(settings, 'REQUEST_STATS_FLUSH_INTERVAL', 60)
+    if time_since_flush() >= interval:
+        flush()
+
+
+def time_since_flush():
+    return time.time() - _last_flush[0]
+
+
+def flush():
+    """
+    Writes the stats of this process to the shared cache.
+    """
+    with _lock:
+        snapshot = dict((view, copy.copy(stats))
+                        for view, stats in _stats.items())
+        _last_flush[0] = time.time()
+
+    cache = _cache()
+    key = _process_key()
+    cache.set(key, snapshot, None)
+    processes = cache.get(PROCESSES_KEY) or []
+    if key not in processes:
+        cache.set(PROCESSES_KEY, processes + [key], None)
+
+
+def collect():
+    """
+    Returns the stats of every process sharing the cache, added
+    together, as a dict of view name to ViewStats.
+    """
+    flush()
+    cache = _cache()
+    merged = {}
+    for process in cache.get_many(cache.get(PROCESSES_KEY) or []).values():
+        for view, stats in process.items():
+            if view not in merged:
+                merged[view] = ViewStats(view)
+            merged[view].merge(stats)
+    return merged
+
+
+def top(count=10, order='time'):
+    """
+    Returns as dicts the count views with the highest value of the
+    given ordering, one of the keys of ORDERINGS.
+    """
+    field = ORDERINGS[order]
+    views = [stats.as_dict() for stats in collect().values()]
+    views.sort(key=lambda stats: stats[field], reverse=True)
+    return views[:count]
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+    cache = _cache()
+    cache.delete_many((cache.get(PROCESSES_KEY) or []) + [PROCESSES_KEY])
+
+
+class RequestStatsMiddleware(object):
+    """
+    Put it first in MIDDLEWARE_CLASSES, so the time of the other
+    middleware is counted as well.
+    """
+
+    def process_request(self, request):
+        rate = getattr(settings, 'REQUEST_STATS_SAMPLE_RATE', 0)
+        if rate <= 0 or random.random() >= rate:
+            return
+        request._request_stats = {
+            'start': time.time(),
+            'debug_cursor': connection.use_debug_cursor,
+            'first_query': len(connection.queries),
+            'view': None,
+            'render_time': None,
+        }
+        connection.use_debug_cursor = True
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        sample = getattr(request, '_request_stats', None)
+        if sample is not None:
+            sample['view'] = '%s.%s' % (view_func.__module__,
+                                        view_func.__name__)
+
+    def process_template_response(self, request, response):
+        sample = getattr(request, '_request_stats', None)
+        if sample is not None:
+            render_start = time.time()
+
+            def rendered(response):
+                sample['render_time'] = time.time() - render_start
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def process_response(self, request, response):
+        sample = getattr(request, '_request_stats', None)
+        if sample is None:
+            return response
+
+        connection.use_debug_cursor = sample['debug_cursor']
+        # requests no view was resolved for, 404s mostly
+        if sample['view'] is not None:
+            record(sample['view'], time.time() - sample['start'],
+                   connection.queries[sample['first_query']:],
+                   sample['render_time'])
+        return response
@@ -0,0 +1,210 @@
+"""
+Streaming export of the results of complete sittings, with the answer
+given to every question, for markers.
+
+Sittings are read in chunks by id and their answers with one query per
+chunk, so memory use does not grow with the number of sittings. When a
+sitting was finished, the time of its last answer, is found per chunk
+too, and sittings finished outside the dates asked for are skipped
+there, rather than with an aggregate over the whole answer table. The
+text of questions and answers comes from the quiz snapshots, loaded
+once per quiz, and is looked up per answer in dictionaries; questions
+since removed from their quiz are loaded in bulk as they turn up.
+
+The formats are JSON lines, one sitting per line with its answers in a
+list, and CSV, one row per answer with the columns of its sitting
+repeated.
+"""
+import csv
+import json
+from collections import OrderedDict
+from datetime import datetime, time, timedelta
+
+from django.db.models import Max
+from django.utils import timezone
+
+from learn.models import Sitting, UserAnswer, Question, Answer,\
+    MCQuestion, parse_answer_id
+from learn.quizcache import get_snapshot
+
+CHUNK_SIZE = 500
+
+CSV_FIELDS = ('sitting', 'user', 'quiz', 'course', 'finished', 'score',
+              'max_score', 'percent', 'passed', 'question_id', 'question',
+              'answer', 'correct')
+
+
+def day_start(day):
+    """
+    The first moment of a date, in the current time zone.
+    """
+    moment = datetime.combine(day, time())
+    if timezone.is_naive(timezone.now()):
+        return moment
+    return timezone.make_aware(moment, timezone.get_current_timezone())
+
+
+def complete_sittings(quiz=None, course=None):
+    """
+    The complete sittings of a quiz, the quizzes of a course or every
+    quiz.
+    """
+    sittings = Sitting.objects.filter(complete=True)
+    if quiz is not None:
+        sittings = sittings.filter(quiz=quiz)
+    if course is not None:
+        sittings = sittings.filter(quiz__course=course)
+    return sittings
+
+
+class TextLookup(object):
+    """
+    The text of the questions and multiple choice answers of the
+    sittings exported.
+    """
+
+    def __init__(self):
+        self.quizzes = set()
+        self.questions = {}
+        self.answers = {}
+        self.multiple_choice = set()
+
+    def add_quiz(self, quiz_id):
+        if quiz_id in self.quizzes:
+            return
+        self.quizzes.add(quiz_id)
+        snapshot = get_snapshot(quiz_id)
+        for question in snapshot.questions:
+            self.questions[question.id] = question.content
+        self.answers.update(snapshot.answer_key.content)
+        self.multiple_choice.update(snapshot.answer_key.multiple_choice)
+
+    def add_questions(self, question_ids):
+        missing = set(question_ids) - set(self.questions)
+        if not missing:
+            return
+        multiple_choice = MCQuestion._meta.model_name
+        for question_id, content, question_type in Question.objects.filter(
+                id__in=missing).values_list('id', 'content',
+                                            'question_type'):
+            self.questions[question_id] = content
+            if question_type == multiple_choice:
+                self.multiple_choice.add(question_id)
+        self.answers.update(Answer.objects.filter(question__in=missing)
+                                          .values_list('id', 'content'))
+
+    def answer(self, question_id, guess):
+        if question_id in self.multiple_choice:
+            return self.answers.get(parse_answer_id(guess), '')
+        return guess
+
+
+def export_records(sittings, start=None, end=None, chunk_size=CHUNK_SIZE):
+    """
+    Yields a record, in the json lines form, for every sitting of the
+    queryset passed in (see complete_sittings) finished from the start
+    date to the end date, both included, a chunk at a time.
+    """
+    after = day_start(start) if start is not None else None
+    before = day_start(end + timedelta(days=1)) if end is not None else None
+    lookup = TextLookup()
+    sittings = sittings.select_related('user', 'quiz', 'quiz__course')\
+                       .order_by('id')
+    last = 0
+    while True:
+        chunk = list(sittings.filter(id__gt=last)[:chunk_size])
+        if not chunk:
+            return
+        last = chunk[-1].id
+
+        chunk_answers = UserAnswer.objects.filter(
+            sitting__in=[sitting.id for sitting in chunk])
+        finished = dict(chunk_answers.values_list('sitting')
+                                     .annotate(Max('answered_at'))
+                                     .order_by())
+        if after is not None or before is not None:
+            chunk = [sitting for sitting in chunk
+                     if sitting.id in finished and
+                     (after is None or finished[sitting.id] >= after) and
+                     (before is None or finished[sitting.id] < before)]
+            if not chunk:
+                continue
+            chunk_answers = chunk_answers.filter(
+                sitting__in=[sitting.id for sitting in chunk])
+
+        answers = {}
+        for sitting_id, question_id, guess, correct in chunk_answers\
+                .order_by('id')\
+                .values_list('sitting_id', 'question_id', 'guess',
+                             'is_correct').iterator():
+            answers.setdefault(sitting_id, []).append(
+                (question_id, guess, correct))
+
+        for sitting in chunk:
+            lookup.add_quiz(sitting.quiz_id)
+        lookup.add_questions(question_id for rows in answers.values()
+                             for question_id, _, _ in rows)
+
+        for sitting in chunk:
+            percent = sitting.get_percent_correct
+            yield OrderedDict([
+                ('sitting', sitting.id),
+                ('user', sitting.user.username),
+                ('quiz', sitting.quiz.url),
+                ('course', unicode(sitting.quiz.course or '')),
+                ('finished', finished[sitting.id].isoformat()
+                 if sitting.id in finished else None),
+                ('score', sitting.current_score),
+                ('max_score', sitting.max_score),
+                ('percent', percent),
+                ('passed', percent >= sitting.quiz.pass_mark),
+                ('answers', [OrderedDict([
+                    ('question_id', question_id),
+                    ('question', lookup.questions.get(question_id, '')),
+                    ('answer', lookup.answer(question_id, guess)),
+                    ('correct', correct)])
+                    for question_id, guess, correct
+                    in answers.get(sitting.id, ())]),
+            ])
+
+
+def jsonl_lines(records):
+    for record in records:
+        yield json.dumps(record) + '\n'
+
+
+class _Line(object):
+    """
+    A file for csv.writer whose writerow returns the line.
+    """
+
+    def write(self, line):
+        return line
+
+
+def csv_lines(records):
+    writer = csv.writer(_Line())
+
+    def encode(value):
+        if isinstance(value, bool):
+            return 'true' if value else 'false'
+        if value is None:
+            return ''
+        return unicode(value).encode('utf-8')
+
+    yield writer.writerow(CSV_FIELDS)
+    for record in records:
+        sitting = [encode(record[field]) for field in CSV_FIELDS[:9]]
+        if not record['answers']:
+            yield writer.writerow(sitting + [''] * 4)
+        for answer in record['answers']:
+            yield writer.writerow(sitting + [encode(answer['question_id']),
+                                             encode(answer['question']),
+                                             encode(answer['answer']),
+                                             encode(answer['correct'])])
+
+
+FORMATS = {'jsonl': jsonl_lines, 'csv': csv_lines}
+
+CONTENT_TYPES = {'jsonl': 'application/x-ndjson',
+                 'csv': 'text/csv; charset=utf-8'}
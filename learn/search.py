@@ -0,0 +1,193 @@
+"""
+Full text search over the content and explanation of questions.
+
+SQLite keeps the text in the FTS5 table learn_question_fts (made by
+migration 0008), indexed under the question id. The signal handlers at
+the bottom keep it up to date with saves and deletes; code writing
+questions in bulk calls index_questions itself. PostgreSQL searches a
+GIN index over to_tsvector of the question text, which the database
+keeps up to date. Any other database, or SQLite without FTS5, falls
+back to LIKE.
+
+Search text is split into words and every word has to match, as a
+prefix, so "photo synth" finds "photosynthesis".
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+
+from learn.models import Quiz, Question, MCQuestion, TF_Question, \
+    Essay_Question
+
+FTS_TABLE = 'learn_question_fts'
+
+PG_DOCUMENT = "to_tsvector('english', content || ' ' || explanation)"
+
+_fts_available = {}
+
+
+def words(text):
+    return re.findall(r'\w+', text or '', re.UNICODE)
+
+
+def backend():
+    """
+    'fts5', 'postgresql' or None when searching falls back to LIKE.
+    """
+    if connection.vendor == 'postgresql':
+        return 'postgresql'
+    if connection.vendor == 'sqlite':
+        name = connection.settings_dict['NAME']
+        if name not in _fts_available:
+            _fts_available[name] = (
+                FTS_TABLE in connection.introspection.table_names())
+        if _fts_available[name]:
+            return 'fts5'
+    return None
+
+
+def _match_sql(text, ranked=True):
+    """
+    The SQL selecting the ids of the questions matching text, best match
+    first when ranked, and its parameters.
+    """
+    terms = words(text)
+    if backend() == 'fts5':
+        sql = 'SELECT rowid FROM %s WHERE %s MATCH %%s' % (FTS_TABLE,
+                                                          FTS_TABLE)
+        params = [' '.join('"%s"*' % term for term in terms)]
+        if ranked:
+            sql += ' ORDER BY rank'
+        return sql, params
+
+    query = ' & '.join('%s:*' % term for term in terms)
+    sql = ("SELECT id FROM learn_question WHERE %s @@ "
+           "to_tsquery('english', %%s)" % PG_DOCUMENT)
+    params = [query]
+    if ranked:
+        sql += (" ORDER BY ts_rank(%s, to_tsquery('english', %%s)) DESC"
+                % PG_DOCUMENT)
+        params.append(query)
+    return sql, params
+
+
+def ranked_ids(text, limit=50, offset=0):
+    """
+    Returns the ids of the questions matching text, best match first.
+    """
+    if not words(text):
+        return []
+    if backend() is None:
+        return list(filter_questions(Question.objects.all(), text)
+                    .order_by('id')
+                    .values_list('id', flat=True)[offset:offset + limit])
+
+    sql, params = _match_sql(text)
+    cursor = connection.cursor()
+    cursor.execute(sql + ' LIMIT %s OFFSET %s', params + [limit, offset])
+    return [row[0] for row in cursor.fetchall()]
+
+
+def filter_questions(queryset, text):
+    """
+    Narrows a queryset of Question, or of one of its subclasses, to the
+    questions matching text.
+    """
+    terms = words(text)
+    if not terms:
+        return queryset
+
+    if backend() is None:
+        for term in terms:
+            queryset = queryset.filter(Q(content__icontains=term) |
+                                       Q(explanation__icontains=term))
+        return queryset
+
+    sql, params = _match_sql(text, ranked=False)
+    quote = connection.ops.quote_name
+    column = '%s.%s' % (quote(queryset.model._meta.db_table),
+                        quote(queryset.model._meta.pk.column))
+    return queryset.extra(where=['%s IN (%s)' % (column, sql)],
+                          params=params)
+
+
+def search_quizzes(text, limit=20, questions=200):
+    """
+    Returns (quiz, number of matching questions) for the quizzes whose
+    title matches text, then for those holding the best questions of the
+    first questions matches, best first.
+    """
+    if not words(text):
+        return []
+
+    ranked = ranked_ids(text, limit=questions)
+    position = dict((question_id, number)
+                    for number, question_id in enumerate(ranked))
+    best = {}
+    matches = {}
+    for question_id, quiz_id in Question.quiz.through.objects.filter(
+            question__in=ranked).values_list('question_id', 'quiz_id'):
+        best[quiz_id] = min(best.get(quiz_id, questions),
+                            position[question_id])
+        matches[quiz_id] = matches.get(quiz_id, 0) + 1
+
+    titles = Quiz.objects.all()
+    for term in words(text):
+        titles = titles.filter(title__icontains=term)
+    for quiz_id in titles.values_list('id', flat=True)[:limit]:
+        best[quiz_id] = -1
+
+    quiz_ids = sorted(best, key=lambda quiz_id: (best[quiz_id], quiz_id))
+    quiz_ids = quiz_ids[:limit]
+    quizzes = Quiz.objects.select_related('course').in_bulk(quiz_ids)
+    return [(quizzes[quiz_id], matches.get(quiz_id, 0))
+            for quiz_id in quiz_ids if quiz_id in quizzes]
+
+
+def index_questions(questions):
+    """
+    Writes (id, content, explanation) of each question to the FTS5
+    table, replacing what it held for them.
+    """
+    if backend() != 'fts5':
+        return
+    rows = [(question_id, content, explanation or '')
+            for question_id, content, explanation in questions]
+    cursor = connection.cursor()
+    cursor.executemany('DELETE FROM %s WHERE rowid = %%s' % FTS_TABLE,
+                       [(row[0],) for row in rows])
+    cursor.executemany('INSERT INTO %s (rowid, content, explanation) '
+                       'VALUES (%%s, %%s, %%s)' % FTS_TABLE, rows)
+
+
+def rebuild_index():
+    """
+    Refills the FTS5 table from the question table.
+    Returns the number of questions indexed, None without FTS5.
+    """
+    if backend() != 'fts5':
+        return None
+    cursor = connection.cursor()
+    cursor.execute('DELETE FROM %s' % FTS_TABLE)
+    cursor.execute('INSERT INTO %s (rowid, content, explanation) '
+                   'SELECT id, content, explanation FROM learn_question'
+                   % FTS_TABLE)
+    return Question.objects.count()
+
+
+def question_saved(sender, instance, **kwargs):
+    index_questions([(instance.pk, instance.content, instance.explanation)])
+
+
+def question_deleted(sender, instance, **kwargs):
+    if backend() == 'fts5':
+        connection.cursor().execute(
+            'DELETE FROM %s WHERE rowid = %%s' % FTS_TABLE, [instance.pk])
+
+
+def connect_signals():
+    for model in (Question, MCQuestion, TF_Question, Essay_Question):
+        post_save.connect(question_saved, sender=model)
+        post_delete.connect(question_deleted, sender=model)
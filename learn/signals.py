@@ -0,0 +1,63 @@
+"""
+Signal handlers keeping denormalized values up to date.
+"""
+from django.db.models.signals import post_save, pre_delete, post_delete,\
+    m2m_changed
+
+from learn import catalogue, progress, quizstats
+from learn.models import Course, Quiz, Question, MCQuestion, TF_Question,\
+    Essay_Question, Sitting, sitting_completed, sitting_remarked
+
+
+def quiz_saved(sender, instance, **kwargs):
+    # a save from a stale instance may have written an old count back
+    counts = Quiz.objects.update_question_counts([instance.pk])
+    instance.question_count = counts[instance.pk]
+
+
+def question_quizzes_changed(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        if action == 'pre_clear' and not reverse:
+            instance._cleared_quiz_ids = list(
+                instance.quiz.values_list('id', flat=True))
+        return
+
+    if reverse:
+        counts = Quiz.objects.update_question_counts([instance.pk])
+        instance.question_count = counts[instance.pk]
+    elif action == 'post_clear':
+        Quiz.objects.update_question_counts(
+            getattr(instance, '_cleared_quiz_ids', []))
+    else:
+        Quiz.objects.update_question_counts(pk_set)
+
+
+def question_deleting(sender, instance, **kwargs):
+    instance._deleted_quiz_ids = list(
+        Quiz.objects.filter(question=instance.pk).values_list('id',
+                                                              flat=True))
+
+
+def question_deleted(sender, instance, **kwargs):
+    Quiz.objects.update_question_counts(
+        getattr(instance, '_deleted_quiz_ids', []))
+
+
+def connect_signals():
+    post_save.connect(quiz_saved, sender=Quiz)
+    post_save.connect(progress.courses_changed, sender=Course)
+    post_delete.connect(progress.courses_changed, sender=Course)
+    for model in (Quiz, Course):
+        post_save.connect(catalogue.content_changed, sender=model)
+        post_delete.connect(catalogue.content_changed, sender=model)
+    m2m_changed.connect(question_quizzes_changed,
+                        sender=Question.quiz.through)
+
+    for model in (Question, MCQuestion, TF_Question, Essay_Question):
+        pre_delete.connect(question_deleting, sender=model)
+        post_delete.connect(question_deleted, sender=model)
+
+    post_save.connect(quizstats.sitting_saved, sender=Sitting)
+    sitting_completed.connect(quizstats.sitting_completed, sender=Sitting)
+    sitting_remarked.connect(quizstats.sitting_remarked, sender=Sitting)
@@ -0,0 +1,120 @@
+"""
+Synthetic quiz content for the benchmark and load test commands.
+
+Everything is created through the ORM, so signals (and with them the
+quiz snapshot versions) behave as they do for content made in admin.
+Wrap calls in rolled_back() to leave the database untouched.
+"""
+import random
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from learn import quizcache
+from learn.models import Course, Quiz, MCQuestion, TF_Question, Answer, \
+    Question
+
+
+@contextmanager
+def rolled_back():
+    """
+    Runs the block in a transaction which is always rolled back.
+    """
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def make_quiz(questions=200, answers=4, true_false=0, course=None,
+              url=None, **quiz_fields):
+    """
+    Creates a quiz of multiple choice questions, each with one correct
+    answer out of the given number, followed by true_false true/false
+    questions. Extra keyword arguments are set on the Quiz.
+    """
+    if course is None:
+        course = Course.objects.create(
+            course='synthetic-%s' % random.randint(0, 10 ** 9))
+    if url is None:
+        url = 'synthetic-%s' % random.randint(0, 10 ** 9)
+
+    quiz = Quiz.objects.create(title=url[:60], url=url, course=course,
+                               **quiz_fields)
+
+    created = []
+    rows = []
+    for number in range(questions):
+        question = MCQuestion.objects.create(content='question %s' % number,
+                                             course=course)
+        correct = random.randrange(answers)
+        rows.extend(Answer(question=question,
+                           content='answer %s' % choice,
+                           correct=choice == correct)
+                    for choice in range(answers))
+        created.append(question)
+
+    for number in range(true_false):
+        created.append(TF_Question.objects.create(
+            content='statement %s' % number,
+            course=course,
+            correct=random.random() < 0.5))
+
+    Answer.objects.bulk_create(rows)
+    Question.quiz.through.objects.bulk_create(
+        Question.quiz.through(question_id=question.id, quiz_id=quiz.id)
+        for question in created)
+    # bulk_create sends no m2m_changed
+    quiz.question_count = Quiz.objects.update_question_counts(
+        [quiz.id])[quiz.id]
+    quizcache.invalidate([quiz.id])
+
+    return quiz
+
+
+def make_catalogue(courses=5, quizzes=4, questions=20, **quiz_fields):
+    """
+    Creates the given number of courses, each with its own quizzes made
+    by make_quiz, and returns the quizzes.
+    """
+    created = []
+    for _ in range(courses):
+        course = Course.objects.create(
+            course='synthetic-%s' % random.randint(0, 10 ** 9))
+        created.extend(make_quiz(questions=questions, course=course,
+                                 **quiz_fields)
+                       for _ in range(quizzes))
+    return created
+
+
+def make_users(count, password='synthetic'):
+    """
+    Creates count users who all share the given password, hashed once.
+    """
+    prefix = 's%s-' % random.randint(0, 10 ** 9)
+    hashed = make_password(password)
+    User.objects.bulk_create(User(username='%s%s' % (prefix, number),
+                                  password=hashed)
+                             for number in range(count))
+    return list(User.objects.filter(username__startswith=prefix)
+                            .order_by('id'))
+
+
+def random_guesses(quiz):
+    """
+    Returns a dict of question id to a random valid guess, in the form
+    Sitting.get_user_answers returns them.
+    """
+    guesses = {}
+    choices = {}
+    for question_id, answer_id in Answer.objects.filter(
+            question__quiz=quiz).values_list('question_id', 'id'):
+        choices.setdefault(question_id, []).append(answer_id)
+
+    for question_id in quiz.question_set.values_list('id', flat=True):
+        if question_id in choices:
+            guesses[str(question_id)] = str(random.choice(choices[question_id]))
+        else:
+            guesses[str(question_id)] = random.choice(['True', 'False'])
+    return guesses
@@ -1,3 +1,1166 @@
-from django.test import TestCase
+import datetime
+import json
+import math
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+from unittest import skipIf
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, IntegrityError
+from django.db.models import ProtectedError
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from learn.models import Course, Quiz, Question, MCQuestion, TF_Question,\
+    Essay_Question, Answer, Sitting, UserAnswer, CourseScore, QuizStats,\
+    LeaderboardEntry, Progress, shuffle_questions
+from learn import bank, catalogue, itemanalysis, progress, quizcache,\
+    quizstats, requeststats, results, search, synthetic
+from learn.progress import course_scores
+from learn.quizcache import get_snapshot, get_question
+from learn.views import QuizMarkingList
 
 # Create your tests here.
+
+
+class QuizTakeMixin(object):
+
+    def setUp(self):
+        self.course = Course.objects.new_course('elderberries')
+        self.quiz = Quiz.objects.create(title='test quiz',
+                                        url='tq',
+                                        course=self.course)
+        self.questions = []
+        for number in range(3):
+            question = MCQuestion.objects.create(content='q%s' % number,
+                                                 course=self.course)
+            question.quiz.add(self.quiz)
+            Answer.objects.create(question=question, content='right',
+                                  correct=True)
+            Answer.objects.create(question=question, content='wrong',
+                                  correct=False)
+            self.questions.append(question)
+        # as at the end of the request which set the quiz up
+        quizcache.invalidate_pending()
+
+        self.url = '/learn/tq/take/'
+
+    def answer(self, question, correct):
+        guess = question.answer_set.get(correct=correct).id
+        return self.client.post(self.url, {'answers': guess})
+
+
+class QuizTakeUserTest(QuizTakeMixin, TestCase):
+
+    def setUp(self):
+        super(QuizTakeUserTest, self).setUp()
+        User.objects.create_user('jacob', 'jacob@jacob.com', 'top_secret')
+        self.client.login(username='jacob', password='top_secret')
+
+    def test_answer_query_count(self):
+        self.client.get(self.url)
+        guess = self.questions[0].answer_set.get(correct=True).id
+        with self.assertNumQueries(12):
+            self.client.post(self.url, {'answers': guess})
+
+    def test_answer_writes_sitting_once(self):
+        self.client.get(self.url)
+        guess = self.questions[0].answer_set.get(correct=True).id
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.url, {'answers': guess})
+
+        writes = [query['sql'] for query in queries
+                  if 'UPDATE "learn_sitting"' in query['sql']]
+        self.assertEqual(len(writes), 1)
+
+        sitting = Sitting.objects.get()
+        self.assertEqual(sitting.current_score, 1)
+        self.assertEqual(sitting.get_first_question(), self.questions[1])
+
+    def test_result_page_runs_no_count_queries(self):
+        self.client.get(self.url)
+        self.answer(self.questions[0], True)
+        self.answer(self.questions[1], True)
+        guess = self.questions[2].answer_set.get(correct=False).id
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {'answers': guess})
+
+        self.assertContains(response, 'out of 3')
+        self.assertFalse([query for query in queries
+                          if 'COUNT(' in query['sql']])
+
+    def test_resumes_at_the_cursor(self):
+        self.client.get(self.url)
+        self.answer(self.questions[0], True)
+        self.client.logout()
+
+        self.client.login(username='jacob', password='top_secret')
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['question'], self.questions[1])
+        self.assertEqual(Sitting.objects.get().cursor, 1)
+
+    def test_question_count_follows_quiz_membership(self):
+        self.assertEqual(Quiz.objects.get().question_count, 3)
+        self.questions[0].delete()
+        self.quiz.question_set.remove(self.questions[1])
+        self.assertEqual(Quiz.objects.get().question_count, 1)
+        self.questions[2].quiz.clear()
+        self.assertEqual(Quiz.objects.get().question_count, 0)
+
+    def test_answered_questions_cannot_be_deleted(self):
+        self.client.get(self.url)
+        self.answer(self.questions[0], True)
+        with self.assertRaises(ProtectedError):
+            self.questions[0].delete()
+        self.assertEqual(UserAnswer.objects.get().question_id,
+                         self.questions[0].id)
+        self.questions[1].delete()
+
+    def test_answers_update_sitting_and_course_score(self):
+        self.client.get(self.url)
+        self.answer(self.questions[0], True)
+        self.answer(self.questions[1], False)
+
+        sitting = Sitting.objects.get()
+        self.assertEqual(sitting.current_score, 1)
+        self.assertEqual(sitting.get_incorrect_questions,
+                         [self.questions[1].id])
+
+        score = CourseScore.objects.get()
+        self.assertEqual((score.score, score.possible), (1, 2))
+
+        answers = sitting.useranswer_set.order_by('question')
+        self.assertEqual([answer.is_correct for answer in answers],
+                         [True, False])
+
+    def test_marking_a_question_saves_the_sitting_once(self):
+        self.client.get(self.url)
+        self.answer(self.questions[0], True)
+        self.answer(self.questions[1], False)
+        sitting = Sitting.objects.get()
+
+        with CaptureQueriesContext(connection) as queries:
+            sitting.remove_incorrect_question(self.questions[1])
+            sitting.add_incorrect_question(self.questions[0])
+        writes = [query['sql'] for query in queries
+                  if 'UPDATE "learn_sitting"' in query['sql']]
+        self.assertEqual(len(writes), 2)
+
+        self.assertEqual(sitting.current_score, 2)
+        sitting = Sitting.objects.get()
+        self.assertEqual(sitting.current_score, 2)
+        self.assertEqual(sitting.get_incorrect_questions,
+                         [self.questions[0].id])
+        answers = sitting.useranswer_set.order_by('question')
+        self.assertEqual([answer.is_correct for answer in answers],
+                         [False, True])
+
+
+class QuizSnapshotTest(TestCase):
+
+    def setUp(self):
+        self.course = Course.objects.new_course('spam')
+        self.quiz = Quiz.objects.create(title='snapshot', url='snap',
+                                        course=self.course)
+        self.question = MCQuestion.objects.create(content='q',
+                                                  course=self.course)
+        self.question.quiz.add(self.quiz)
+        self.answer = Answer.objects.create(question=self.question,
+                                            content='a', correct=True)
+
+    def test_snapshot_serves_without_queries(self):
+        get_snapshot(self.quiz.id)
+        with self.assertNumQueries(0):
+            question = get_question(self.quiz.id, self.question.id)
+            self.assertEqual(question.get_answers_list(),
+                             [(self.answer.id, u'a')])
+            self.assertTrue(question.check_if_correct(str(self.answer.id)))
+
+    def test_content_changes_invalidate_snapshot(self):
+        get_snapshot(self.quiz.id)
+        self.answer.correct = False
+        self.answer.save()
+        question = get_question(self.quiz.id, self.question.id)
+        self.assertFalse(question.check_if_correct(str(self.answer.id)))
+
+        self.question.quiz.remove(self.quiz)
+        self.assertEqual(get_snapshot(self.quiz.id).question_ids, [])
+
+    def test_edits_bumped_again_after_commit(self):
+        get_snapshot(self.quiz.id)
+        self.answer.correct = False
+        self.answer.save()
+        # built before the edit committed, as another process could
+        version = quizcache.get_version(self.quiz.id)
+
+        quizcache.invalidate_pending()
+        self.assertNotEqual(quizcache.get_version(self.quiz.id), version)
+        self.assertIsNone(quizcache._pending.quiz_ids)
+
+    def test_snapshots_expire(self):
+        with self.settings(QUIZ_CACHE_TIMEOUT=0):
+            snapshot = get_snapshot(self.quiz.id)
+            self.assertIsNot(get_snapshot(self.quiz.id), snapshot)
+
+    def test_versions_do_not_expire(self):
+        quizcache._cache().delete(quizcache._version_key(self.quiz.id))
+        with self.settings(QUIZ_CACHE_TIMEOUT=0):
+            version = quizcache.get_version(self.quiz.id)
+            get_snapshot(self.quiz.id)
+            self.assertEqual(quizcache.get_version(self.quiz.id), version)
+
+    def test_answer_key_grades_only_own_answers(self):
+        other = MCQuestion.objects.create(content='other', course=self.course)
+        other.quiz.add(self.quiz)
+        wrong = Answer.objects.create(question=other, content='b',
+                                      correct=False)
+        key = get_snapshot(self.quiz.id).answer_key
+
+        guesses = {str(self.question.id): str(self.answer.id),
+                   str(other.id): str(self.answer.id)}
+        self.assertEqual(key.grade_many(guesses),
+                         {self.question.id: True, other.id: False})
+        self.assertEqual(key.answer_to_string(other.id, wrong.id), u'b')
+        self.assertEqual(key.answer_to_string(other.id, self.answer.id), '')
+
+    def test_remark_uses_current_answer_key(self):
+        user = User.objects.create_user('remark', 'r@r.com', 'secret')
+        sitting = Sitting.objects.new_sitting(user, self.quiz)
+        sitting.record_answer(self.question, str(self.answer.id), False)
+        sitting.complete = True
+        sitting.save()
+
+        sitting.remark()
+        sitting = Sitting.objects.get(id=sitting.id)
+        self.assertEqual(sitting.current_score, 1)
+        self.assertEqual(sitting.get_incorrect_questions, [])
+
+    def test_random_order_is_reproducible_from_seed(self):
+        for number in range(5):
+            MCQuestion.objects.create(content='r%s' % number,
+                                      course=self.course).quiz.add(self.quiz)
+        self.quiz.random_order = True
+        self.quiz.save()
+        user = User.objects.create_user('seed', 's@s.com', 'secret')
+
+        sitting = Sitting.objects.new_sitting(user, self.quiz)
+        order = sitting.get_question_order()
+        self.assertEqual(sorted(order),
+                         sorted(get_snapshot(self.quiz.id).question_ids))
+        self.assertEqual(shuffle_questions(reversed(order), sitting.seed),
+                         order)
+
+
+class QuizMarkingListTest(TestCase):
+
+    def setUp(self):
+        self.course = Course.objects.new_course('marking')
+        self.quiz = Quiz.objects.create(title='exam', url='exam',
+                                        course=self.course, exam_paper=True)
+        User.objects.create_superuser('marker', 'm@m.com', 'secret')
+        self.client.login(username='marker', password='secret')
+
+    def add_sittings(self, number):
+        for _ in range(number):
+            user = User.objects.create_user('taker%s' % User.objects.count(),
+                                            't@t.com', 'secret')
+            sitting = Sitting.objects.new_sitting(user, self.quiz)
+            sitting.mark_quiz_complete()
+
+    def test_query_count_does_not_grow_with_sittings(self):
+        self.add_sittings(3)
+        with self.assertNumQueries(3):
+            self.client.get('/learn/marking/')
+
+        self.add_sittings(10)
+        with self.assertNumQueries(3):
+            response = self.client.get('/learn/marking/')
+        self.assertEqual(len(response.context['sitting_list']), 13)
+
+    def test_keyset_pages(self):
+        QuizMarkingList.page_size, page_size = 5, QuizMarkingList.page_size
+        try:
+            self.add_sittings(7)
+            response = self.client.get('/learn/marking/?user_filter=taker')
+            first = response.context['sitting_list']
+            self.assertEqual(len(first), 5)
+
+            response = self.client.get('/learn/marking/?' +
+                                       response.context['next_page'])
+            second = response.context['sitting_list']
+            self.assertEqual(len(second), 2)
+            self.assertNotIn('next_page', response.context)
+            self.assertTrue(first[-1].id > second[0].id)
+        finally:
+            QuizMarkingList.page_size = page_size
+
+
+class QuizMarkingBulkTest(TestCase):
+
+    def setUp(self):
+        self.course = Course.objects.new_course('essays')
+        self.quiz = Quiz.objects.create(title='essays', url='essays',
+                                        course=self.course, exam_paper=True)
+        self.questions = []
+        for number in range(2):
+            question = Essay_Question.objects.create(content='e%s' % number,
+                                                     course=self.course)
+            question.quiz.add(self.quiz)
+            self.questions.append(question)
+
+        self.sittings = []
+        for number in range(2):
+            user = User.objects.create_user('student%s' % number,
+                                            's@s.com', 'secret')
+            sitting = Sitting.objects.new_sitting(user, self.quiz)
+            for question in self.questions:
+                sitting.record_answer(question, 'an essay', False)
+            sitting.mark_quiz_complete()
+            self.sittings.append(sitting)
+
+        User.objects.create_superuser('marker', 'm@m.com', 'secret')
+        self.client.login(username='marker', password='secret')
+
+    def post(self, marks):
+        return self.client.post('/learn/marking/bulk/', json.dumps(marks),
+                                content_type='application/json')
+
+    def test_marks_many_sittings_at_once(self):
+        first, second = self.sittings
+        response = self.post({'marks': [
+            {'sitting': first.id, 'question': self.questions[0].id,
+             'correct': True},
+            {'sitting': first.id, 'question': self.questions[1].id,
+             'correct': True},
+            {'sitting': second.id, 'question': self.questions[1].id,
+             'correct': True},
+            {'sitting': second.id, 'question': 9999, 'correct': True}]})
+
+        result = json.loads(response.content)
+        self.assertEqual(result['sittings'][str(first.id)]['score'], 2)
+        self.assertEqual(result['sittings'][str(second.id)]['percent'], 50)
+        self.assertEqual(len(result['errors']), 1)
+
+        self.assertEqual(Sitting.objects.get(id=first.id).current_score, 2)
+        self.assertEqual(
+            CourseScore.objects.get(user=first.user).score, 2)
+        self.assertEqual(
+            UserAnswer.objects.filter(is_correct=True).count(), 3)
+
+    def test_invalid_body(self):
+        self.assertEqual(self.post({'marks': [{}]}).status_code, 400)
+
+
+class ProgressTest(TestCase):
+
+    def setUp(self):
+        self.course = Course.objects.new_course('progress')
+        Course.objects.new_course('untouched')
+        self.user = User.objects.create_user('learner', 'l@l.com', 'secret')
+        self.client.login(username='learner', password='secret')
+
+    def test_course_scores_in_one_query_and_cached(self):
+        CourseScore.objects.add_score(self.user.id, self.course, 3, 4)
+        with self.assertNumQueries(1):
+            scores = course_scores(self.user.id)
+        self.assertEqual(scores, {u'progress': [3, 4, 75],
+                                  u'untouched': [0, 0, 0]})
+
+        with self.assertNumQueries(0):
+            course_scores(self.user.id)
+
+        Progress.objects.new_progress(self.user).update_score(
+            self.course, 1, 1)
+        self.assertEqual(course_scores(self.user.id)[u'progress'],
+                         [4, 5, 80])
+
+        Course.objects.new_course('new')
+        self.assertIn(u'new', course_scores(self.user.id))
+
+    def test_scores_forgotten_after_answer_commits(self):
+        quiz = Quiz.objects.create(title='p', url='p', course=self.course)
+        question = TF_Question.objects.create(content='t', correct=True,
+                                              course=self.course)
+        question.quiz.add(quiz)
+        sitting = Sitting.objects.new_sitting(self.user, quiz)
+        course_scores(self.user.id)
+
+        depth = len(connection.savepoint_ids)
+        depths = []
+        forget = progress.forget_course_scores
+
+        def forget_course_scores(user_ids):
+            depths.append(len(connection.savepoint_ids))
+            forget(user_ids)
+
+        progress.forget_course_scores = forget_course_scores
+        try:
+            sitting.record_answer(question, 'True', True)
+        finally:
+            progress.forget_course_scores = forget
+
+        self.assertEqual(depths, [depth])
+        self.assertEqual(course_scores(self.user.id)[u'progress'],
+                         [1, 1, 100])
+
+    def test_progress_keeps_its_old_api(self):
+        progress = Progress.objects.new_progress(self.user)
+        self.assertIsNone(progress.update_score('progress', 3, 4))
+        self.assertIsNone(progress.update_score(self.course, 1, 1))
+        self.assertEqual(progress.update_score('nothing', 1, 1),
+                         ('error', 'course does not exist or invalid score'))
+        self.assertEqual(progress.update_score('progress', -1, 1),
+                         ('error', 'course does not exist or invalid score'))
+
+        self.assertEqual(progress.list_all_cat_scores(),
+                         {u'progress': [4, 5, 80], u'untouched': [0, 0, 0]})
+        self.assertEqual(tuple(progress.check_cat_score('progress')), (4, 5))
+        self.assertEqual(progress.check_cat_score('untouched'), (0, 0))
+        self.assertEqual(progress.check_cat_score('nothing'),
+                         ('error', 'course does not exist'))
+
+    def test_progress_page_does_not_write(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/learn/progress/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query for query in queries
+                          if 'INSERT' in query['sql'] or
+                          'UPDATE' in query['sql']])
+
+
+class QuizTakeAnonTest(QuizTakeMixin, TestCase):
+
+    def take_quiz(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            self.answer(self.questions[0], True)
+            self.answer(self.questions[1], False)
+            response = self.answer(self.questions[2], True)
+
+        self.assertContains(response, 'You answered 2 questions correctly'
+                                      ' out of 3')
+        self.assertContains(response, 'Your session score is 2 out of a'
+                                      ' possible 3')
+        writes = [query for query in queries
+                  if 'INSERT' in query['sql'] or 'UPDATE' in query['sql']
+                  or 'DELETE' in query['sql']]
+        self.assertEqual(writes, [])
+
+    def test_cache_store(self):
+        with self.settings(ANON_QUIZ_STORE='learn.anon.CacheAnonStore'):
+            self.take_quiz()
+
+    def test_sitting_survives_edits_which_keep_the_questions(self):
+        self.client.get(self.url)
+        self.answer(self.questions[0], True)
+        self.quiz.description = 'edited'
+        self.quiz.save()
+        quizcache.invalidate_pending()
+
+        response = self.answer(self.questions[1], True)
+        self.assertEqual(response.context['question'], self.questions[2])
+
+        MCQuestion.objects.create(content='new', course=self.course)\
+                          .quiz.add(self.quiz)
+        quizcache.invalidate_pending()
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['question'], self.questions[0])
+
+    def test_signed_cookie_store(self):
+        with self.settings(ANON_QUIZ_STORE='learn.anon.SignedCookieAnonStore'):
+            self.take_quiz()
+            self.assertIn('anon_totals', self.client.cookies)
+
+
+class RequestStatsTest(QuizTakeMixin, TestCase):
+
+    def setUp(self):
+        super(RequestStatsTest, self).setUp()
+        requeststats.reset()
+
+    def test_sampled_views_are_reported(self):
+        with self.settings(REQUEST_STATS_SAMPLE_RATE=1):
+            with CaptureQueriesContext(connection) as first:
+                self.client.get(self.url)
+            guess = self.questions[0].answer_set.get(correct=True).id
+            with CaptureQueriesContext(connection) as second:
+                self.client.post(self.url, {'answers': guess})
+
+        stats = requeststats.collect()['learn.views.QuizTake']
+        self.assertEqual(stats.requests, 2)
+        self.assertEqual(stats.queries, len(first) + len(second))
+        self.assertEqual(stats.renders, 2)
+
+    def test_report_is_staff_only(self):
+        User.objects.create_user('jacob', 'jacob@jacob.com', 'top_secret')
+        self.client.login(username='jacob', password='top_secret')
+        response = self.client.get('/learn/stats/requests/')
+        self.assertEqual(response.status_code, 302)
+
+        User.objects.filter(username='jacob').update(is_staff=True)
+        with self.settings(REQUEST_STATS_SAMPLE_RATE=1):
+            self.client.get(self.url)
+            response = self.client.get('/learn/stats/requests/?order=queries')
+        views = json.loads(response.content)['views']
+        self.assertEqual(views[0]['view'], 'learn.views.QuizTake')
+
+
+class CatalogueCacheTest(TestCase):
+
+    def setUp(self):
+        self.course = Course.objects.new_course('elderberries')
+        self.quiz = Quiz.objects.create(title='test quiz', url='tq',
+                                        course=self.course)
+        catalogue.invalidate_pending()
+
+    def test_anonymous_pages_are_cached_until_content_changes(self):
+        self.client.get('/learn/tq/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/learn/tq/')
+        self.assertContains(response, 'test quiz')
+
+        self.quiz.title = 'renamed quiz'
+        self.quiz.save()
+        self.assertContains(self.client.get('/learn/tq/'), 'renamed quiz')
+
+    def test_version_is_bumped_again_after_the_transaction(self):
+        self.quiz.save()
+        version = catalogue.get_version()
+        self.client.get('/learn/tq/')
+        self.assertGreater(catalogue.get_version(), version)
+        version = catalogue.get_version()
+        self.client.get('/learn/tq/')
+        self.assertEqual(catalogue.get_version(), version)
+
+    def test_conditional_get(self):
+        response = self.client.get('/learn/course/')
+        self.assertIn('Cookie', response['Vary'])
+        response = self.client.get('/learn/course/',
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_signed_in_chrome_is_not_shared(self):
+        for name in ('jacob', 'grace'):
+            User.objects.create_user(name, '%s@example.com' % name, 'pw')
+        etags = []
+        for name in ('jacob', 'grace'):
+            self.client.login(username=name, password='pw')
+            response = self.client.get('/learn/')
+            self.assertContains(response, 'Welcome, %s!' % name)
+            self.assertContains(response, 'test quiz')
+            self.assertIn('private', response['Cache-Control'])
+            etags.append(response['ETag'])
+        self.assertNotEqual(etags[0], etags[1])
+
+
+class QuestionBankTest(TestCase):
+
+    def setUp(self):
+        self.course = Course.objects.new_course('elderberries')
+        self.quiz = Quiz.objects.create(title='test quiz', url='tq',
+                                        course=self.course)
+
+    def test_import_then_export(self):
+        lines = [
+            {'type': 'mc', 'content': 'pick one', 'course': 'elderberries',
+             'quizzes': ['tq'], 'answers': [{'content': 'a', 'correct': True},
+                                            {'content': 'b'}]},
+            {'type': 'tf', 'content': 'true?', 'correct': True,
+             'quizzes': ['tq']},
+            {'type': 'essay', 'content': 'discuss'},
+            {'type': 'mc', 'content': 'no key', 'answers': [{'content': 'a'}]},
+            {'type': 'tf', 'content': 'lost', 'quizzes': ['missing']},
+        ]
+        stream = StringIO(''.join(json.dumps(line) + '\n' for line in lines))
+        importer = bank.Importer(batch_size=2)
+        importer.run(bank.read_jsonlines(stream))
+
+        self.assertEqual([number for number, _ in importer.errors], [4, 5])
+        question = MCQuestion.objects.get(content='pick one')
+        self.assertEqual([(answer.content, answer.correct)
+                          for answer in question.get_answers()],
+                         [('a', True), ('b', False)])
+        self.assertTrue(TF_Question.objects.get(content='true?').correct)
+        self.assertTrue(Essay_Question.objects.filter(content='discuss')
+                                              .exists())
+        self.assertEqual(Quiz.objects.get(id=self.quiz.id).question_count, 2)
+        self.assertEqual(len(get_snapshot(self.quiz.id)), 2)
+
+        exported = StringIO()
+        list(bank.write_csv(bank.export_records(Question.objects.all()),
+                            exported))
+        exported.seek(0)
+        records = [record for _, record in bank.read_csv(exported)]
+        self.assertEqual([record['type'] for record in records],
+                         ['mc', 'tf', 'essay'])
+        self.assertEqual(records[0]['answers'],
+                         [{'content': 'a', 'correct': 'true'},
+                          {'content': 'b', 'correct': 'false'}])
+
+    def import_essays(self, count, importer=None):
+        importer = importer or bank.Importer(batch_size=2)
+        importer.run((number, {'type': 'essay', 'content': 'e%s' % number})
+                     for number in range(count))
+
+    def test_failed_import_leaves_nothing(self):
+        class FailingImporter(bank.Importer):
+            def insert_subclass_rows(self, model, rows):
+                if self.counts['essay'] > 2:
+                    raise IntegrityError('second batch')
+                super(FailingImporter, self).insert_subclass_rows(model,
+                                                                  rows)
+
+        with self.assertRaises(IntegrityError):
+            self.import_essays(3, FailingImporter(batch_size=2))
+        self.assertFalse(Question.objects.exists())
+
+    def test_ids_of_deleted_questions_are_not_reused(self):
+        question = Essay_Question.objects.create(content='gone')
+        question.delete()
+        self.import_essays(1)
+        self.assertTrue(Question.objects.get().id > question.id)
+
+
+class QuizAdminTest(TestCase):
+
+    def setUp(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.login(username='admin', password='pw')
+        self.course = Course.objects.new_course('elderberries')
+        self.quiz = Quiz.objects.create(title='test quiz', url='tq',
+                                        course=self.course)
+        self.questions = [MCQuestion.objects.create(content='q%s' % number,
+                                                    course=self.course)
+                          for number in range(6)]
+        self.quiz.question_set.add(*self.questions[:3])
+        self.url = '/admin/learn/quiz/%s/' % self.quiz.id
+
+    def test_change_page_renders_only_picked_questions(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, '<option value="%s" selected="selected"'
+                                      '>q0</option>' % self.questions[0].id,
+                            html=False)
+        self.assertNotContains(response, '>q4</option>')
+
+    def test_urls_of_other_pages_are_refused(self):
+        response = self.client.post(self.url, {
+            'title': 'test quiz', 'url': 'Search', 'course': self.course.id,
+            'pass_mark': 0, 'questions': []})
+        self.assertContains(response, 'is used by another page')
+        self.assertEqual(Quiz.objects.get(id=self.quiz.id).url, 'tq')
+        with self.assertRaises(ValidationError):
+            Quiz.objects.create(title='stats', url='stats',
+                                course=self.course)
+
+    def test_save_diffs_membership(self):
+        picked = [self.questions[0].id, self.questions[4].id]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {
+                'title': 'test quiz', 'url': 'tq', 'course': self.course.id,
+                'pass_mark': 0, 'questions': picked})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(sorted(self.quiz.question_set.values_list(
+            'id', flat=True)), picked)
+        self.assertEqual(Quiz.objects.get(id=self.quiz.id).question_count, 2)
+        # one insert of the added question, one delete of the two removed
+        writes = [query['sql'] for query in queries
+                  if 'learn_question_quiz' in query['sql'] and
+                  ('INSERT' in query['sql'] or 'DELETE' in query['sql'])]
+        self.assertEqual(len(writes), 2)
+
+    def test_question_search(self):
+        Essay_Question.objects.create(content='q essay', course=self.course)
+        quiz_admin = admin.site._registry[Quiz]
+        quiz_admin.question_page_size = 4
+        try:
+            response = self.client.get('/admin/learn/quiz/questions/',
+                                       {'q': 'q', 'type': 'mc', 'page': 2})
+        finally:
+            del quiz_admin.question_page_size
+        data = json.loads(response.content)
+        self.assertEqual(data['page'], 2)
+        self.assertFalse(data['has_next'])
+        self.assertEqual([result['content'] for result in data['results']],
+                         ['q1', 'q0'])
+        self.assertEqual(data['results'][0]['type'], 'mc')
+
+
+class QuestionSearchTest(TestCase):
+
+    def setUp(self):
+        self.course = Course.objects.new_course('elderberries')
+        self.quiz = Quiz.objects.create(title='Plants', url='plants',
+                                        course=self.course)
+        self.light = MCQuestion.objects.create(
+            content='What drives photosynthesis?', course=self.course,
+            explanation='Light from the sun.')
+        self.light.quiz.add(self.quiz)
+        self.water = TF_Question.objects.create(
+            content='Water boils at 100 degrees', course=self.course)
+
+    def test_index_follows_saves_and_deletes(self):
+        self.assertEqual(search.ranked_ids('photo sun'), [self.light.id])
+        self.assertEqual(search.ranked_ids('boils'), [self.water.id])
+
+        self.water.content = 'Water freezes at 0 degrees'
+        self.water.save()
+        self.assertEqual(search.ranked_ids('boils'), [])
+        self.assertEqual(search.ranked_ids('freez'), [self.water.id])
+
+        self.light.delete()
+        self.assertEqual(search.ranked_ids('photo'), [])
+
+    def test_filters_subclass_querysets(self):
+        self.assertEqual(list(search.filter_questions(
+            MCQuestion.objects.all(), 'light')), [self.light])
+        self.assertEqual(list(search.filter_questions(
+            TF_Question.objects.all(), 'light')), [])
+
+    def test_admin_changelist_uses_index(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.login(username='admin', password='pw')
+        response = self.client.get('/admin/learn/mcquestion/',
+                                   {'q': 'photosynth'})
+        self.assertContains(response, 'What drives photosynthesis?')
+        response = self.client.get('/admin/learn/mcquestion/',
+                                   {'q': 'boils'})
+        self.assertNotContains(response, 'What drives photosynthesis?')
+
+    def test_quiz_search(self):
+        response = self.client.get('/learn/search/', {'q': 'photosynthesis'})
+        results = json.loads(response.content)['results']
+        self.assertEqual([result['url'] for result in results],
+                         ['/learn/plants/'])
+        self.assertEqual(results[0]['matching_questions'], 1)
+        self.assertNotIn('photosynthesis', response.content)
+
+
+class QuestionTypeTest(TestCase):
+
+    def setUp(self):
+        self.course = Course.objects.new_course('elderberries')
+        self.essay = Essay_Question.objects.create(content='Why?',
+                                                  course=self.course)
+        self.tf = TF_Question.objects.create(content='True?', correct=True)
+        self.mc = MCQuestion.objects.create(content='Which?')
+
+    def test_saves_record_the_type(self):
+        self.assertEqual(
+            dict(Question.objects.values_list('id', 'question_type')),
+            {self.essay.id: 'essay_question', self.tf.id: 'tf_question',
+             self.mc.id: 'mcquestion'})
+
+    def test_loads_subclasses_in_order_one_query_per_type(self):
+        with self.assertNumQueries(4):
+            questions = Question.objects.order_by('-id')\
+                                        .as_subclasses('course')
+            self.assertEqual(questions, [self.mc, self.tf, self.essay])
+            self.assertEqual([type(question) for question in questions],
+                             [MCQuestion, TF_Question, Essay_Question])
+            self.assertEqual(questions[2].course, self.course)
+            self.assertTrue(questions[1].correct)
+
+        self.assertIsInstance(
+            Question.objects.get_subclass(id=self.tf.id), TF_Question)
+
+
+class ItemAnalysisTest(QuizTakeMixin, TestCase):
+
+    def setUp(self):
+        super(ItemAnalysisTest, self).setUp()
+        # the first sitting answers every question correctly, the next
+        # one question fewer each, the last none
+        for number in range(4):
+            user = User.objects.create_user('taker%s' % number)
+            sitting = Sitting.objects.new_sitting(user, self.quiz)
+            for position, question in enumerate(self.questions):
+                sitting.record_answer(question, 'guess',
+                                      position < 3 - number)
+            sitting.mark_quiz_complete()
+        unfinished = Sitting.objects.new_sitting(user, self.quiz)
+        unfinished.record_answer(self.questions[2], 'guess', True)
+
+    def check(self, analysis):
+        self.assertEqual(analysis['sittings'], 4)
+        self.assertAlmostEqual(analysis['mean_score'], 1.5)
+        self.assertAlmostEqual(analysis['alpha'], 0.75)
+        questions = dict((question['id'], question)
+                         for question in analysis['questions'])
+        first, _, last = [questions[question.id]
+                          for question in self.questions]
+        self.assertAlmostEqual(first['facility'], 0.75)
+        self.assertAlmostEqual(last['facility'], 0.25)
+        self.assertAlmostEqual(first['discrimination'],
+                               0.1875 / math.sqrt(0.1875 * 0.6875))
+
+    def test_statistics(self):
+        self.check(itemanalysis.analyse(self.quiz.id, use_numpy=False))
+
+    @skipIf(itemanalysis.numpy is None, 'NumPy is not installed')
+    def test_statistics_with_numpy(self):
+        self.check(itemanalysis.analyse(self.quiz.id, use_numpy=True))
+
+    def test_sittings_and_marks_read_together(self):
+        get_snapshot(self.quiz.id)
+        chunk_size = itemanalysis.CHUNK_SIZE
+        itemanalysis.CHUNK_SIZE = 2
+        try:
+            for use_numpy in (False, True)[:1 + bool(itemanalysis.numpy)]:
+                # the latest sitting, then the sittings with their marks
+                with self.assertNumQueries(2):
+                    analysis = itemanalysis.analyse(self.quiz.id,
+                                                    use_numpy=use_numpy)
+                self.check(analysis)
+        finally:
+            itemanalysis.CHUNK_SIZE = chunk_size
+
+    def test_cached_until_marked_again(self):
+        itemanalysis.item_analysis(self.quiz.id)
+        with self.assertNumQueries(1):
+            itemanalysis.item_analysis(self.quiz.id)
+
+        sitting = Sitting.objects.filter(complete=True).order_by('id')[0]
+        Sitting.objects.apply_marks([(sitting.id, self.questions[0].id,
+                                      False)])
+        analysis = itemanalysis.item_analysis(self.quiz.id)
+        self.assertAlmostEqual(analysis['questions'][0]['facility']
+                               + analysis['questions'][1]['facility'], 1)
+
+    def test_staff_only(self):
+        url = '/learn/stats/items/tq/'
+        self.assertEqual(self.client.get(url).status_code, 302)
+        User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.login(username='admin', password='pw')
+        self.assertEqual(json.loads(self.client.get(url).content)['title'],
+                         'test quiz')
+
+
+class QuizStatsTest(TestCase):
+
+    def setUp(self):
+        self.course = Course.objects.new_course('elderberries')
+        self.quiz = Quiz.objects.create(title='test quiz', url='tq',
+                                        course=self.course, pass_mark=50,
+                                        exam_paper=True)
+        self.questions = []
+        for number in range(4):
+            question = TF_Question.objects.create(content='q%s' % number,
+                                                  course=self.course,
+                                                  correct=True)
+            question.quiz.add(self.quiz)
+            self.questions.append(question)
+
+    def sit(self, username, right, complete=True):
+        user, _ = User.objects.get_or_create(username=username)
+        sitting = Sitting.objects.new_sitting(user, self.quiz)
+        for number, question in enumerate(self.questions):
+            sitting.record_answer(question, 'True', number < right)
+        if complete:
+            sitting.mark_quiz_complete()
+        return sitting
+
+    def leaderboard(self):
+        return list(LeaderboardEntry.objects.filter(quiz=self.quiz)
+                                    .values_list('user__username',
+                                                 'percent'))
+
+    def test_totals_and_leaderboard(self):
+        with self.settings(QUIZ_LEADERBOARD_SIZE=2):
+            self.sit('ann', 2)
+            self.sit('bob', 3)
+            self.sit('ann', 4)
+            self.sit('cat', 1)
+            self.sit('dan', 4, complete=False)
+
+            stats = QuizStats.objects.get(quiz=self.quiz)
+            self.assertEqual((stats.attempts, stats.completions,
+                              stats.passed), (5, 4, 3))
+            self.assertEqual(stats.mean, 62.5)
+            self.assertEqual(self.leaderboard(), [('ann', 100), ('bob', 75)])
+
+            self.sit('cat', 4)
+            self.assertEqual(self.leaderboard(), [('ann', 100), ('cat', 100)])
+
+            rebuilt = quizstats.rebuild()
+            self.assertEqual(rebuilt, 6)
+            self.assertEqual(self.leaderboard(), [('ann', 100), ('cat', 100)])
+            self.assertEqual(QuizStats.objects.get(quiz=self.quiz).score_sum,
+                             350)
+
+    def test_remarking(self):
+        sitting = self.sit('ann', 1)
+        Sitting.objects.apply_marks([(sitting.id, self.questions[1].id,
+                                      True)])
+        stats = QuizStats.objects.get(quiz=self.quiz)
+        self.assertEqual((stats.score_sum, stats.passed), (50, 1))
+        self.assertEqual(self.leaderboard(), [('ann', 50)])
+
+    def test_staff_views(self):
+        self.sit('ann', 3)
+        User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.login(username='admin', password='pw')
+        quiz = json.loads(self.client.get('/learn/stats/quizzes/tq/').content)
+        self.assertEqual(quiz['leaderboard'][0]['user'], 'ann')
+        course = json.loads(
+            self.client.get('/learn/stats/courses/elderberries/').content)
+        self.assertEqual(course['pass_rate'], 100)
+
+
+class ResultsExportTest(QuizTakeMixin, TestCase):
+
+    def setUp(self):
+        super(ResultsExportTest, self).setUp()
+        self.user = User.objects.create_user('taker', 't@t.com', 'secret')
+        self.sittings = []
+        for number in range(3):
+            sitting = Sitting.objects.new_sitting(self.user, self.quiz)
+            for question in self.questions:
+                answer = question.answer_set.get(correct=number != 1)
+                sitting.record_answer(question, str(answer.id),
+                                      number != 1)
+            sitting.mark_quiz_complete()
+            self.sittings.append(sitting)
+        Sitting.objects.new_sitting(self.user, self.quiz)
+
+        User.objects.create_superuser('marker', 'm@m.com', 'secret')
+        self.client.login(username='marker', password='secret')
+
+    def test_streams_every_complete_sitting(self):
+        response = self.client.get('/learn/marking/export/',
+                                   {'format': 'jsonl', 'quiz': 'tq'})
+        self.assertTrue(response.streaming)
+        records = [json.loads(line) for line
+                   in ''.join(response.streaming_content).splitlines()]
+        self.assertEqual([record['sitting'] for record in records],
+                         [sitting.id for sitting in self.sittings])
+        self.assertEqual(records[1]['percent'], 0)
+        self.assertEqual(records[1]['answers'][0],
+                         {'question_id': self.questions[0].id,
+                          'question': 'q0', 'answer': 'wrong',
+                          'correct': False})
+
+    def test_csv_in_chunks(self):
+        with self.assertNumQueries(7):
+            lines = list(results.csv_lines(results.export_records(
+                results.complete_sittings(course=self.course),
+                chunk_size=2)))
+        self.assertEqual(len(lines), 1 + 3 * 3)
+        self.assertTrue(lines[1].startswith('%s,taker,tq,elderberries,'
+                                            % self.sittings[0].id))
+
+    def test_date_range(self):
+        today = datetime.date.today()
+        response = self.client.get('/learn/marking/export/', {
+            'start': (today + datetime.timedelta(days=2)).isoformat()})
+        self.assertEqual(len(list(response.streaming_content)), 1)
+        response = self.client.get('/learn/marking/export/',
+                                   {'start': 'last week'})
+        self.assertEqual(response.status_code, 400)
+
+
+class QuizAPITest(QuizTakeMixin, TestCase):
+
+    def setUp(self):
+        super(QuizAPITest, self).setUp()
+        self.quiz.answers_at_end = True
+        self.quiz.exam_paper = True
+        self.quiz.save()
+        self.essay = Essay_Question.objects.create(content='why?',
+                                                   course=self.course)
+        self.essay.quiz.add(self.quiz)
+        User.objects.create_user('jacob', 'jacob@jacob.com', 'top_secret')
+        self.client.login(username='jacob', password='top_secret')
+        self.url = '/learn/tq/api/'
+
+    def submit(self, answers, sitting=None):
+        if sitting is None:
+            sitting = Sitting.objects.get().id
+        return self.client.post(self.url, json.dumps({
+            'sitting': sitting, 'answers': answers}),
+            content_type='application/json')
+
+    def test_delivers_whole_quiz_without_correct_answers(self):
+        response = self.client.get(self.url)
+        data = json.loads(response.content)
+
+        self.assertEqual(data['sitting'], Sitting.objects.get().id)
+        self.assertEqual([question['id'] for question in data['questions']],
+                         [question.id for question in self.questions] +
+                         [self.essay.id])
+        self.assertEqual(data['questions'][0]['type'], 'mcquestion')
+        self.assertEqual(data['questions'][0]['choices'][0],
+                         {'id': self.questions[0].answer_set
+                                    .get(correct=True).id,
+                          'content': 'right'})
+        self.assertEqual(data['questions'][3]['choices'], [])
+        self.assertNotIn('correct', response.content)
+
+    def test_batch_submission(self):
+        self.client.get(self.url)
+        answers = dict((str(question.id),
+                        question.answer_set.get(correct=number != 1).id)
+                       for number, question in enumerate(self.questions))
+        answers[str(self.essay.id)] = 'because'
+        with CaptureQueriesContext(connection) as queries:
+            response = self.submit(answers)
+        data = json.loads(response.content)
+
+        for table in ('INSERT INTO "learn_useranswer"',
+                      'UPDATE "learn_sitting"'):
+            self.assertEqual(len([query for query in queries
+                                  if table in query['sql']]), 1)
+
+        self.assertEqual((data['score'], data['max_score']), (2, 4))
+        self.assertEqual(data['answers'][str(self.questions[1].id)], False)
+        sitting = Sitting.objects.get()
+        self.assertTrue(sitting.complete)
+        self.assertEqual(sitting.get_incorrect_questions,
+                         [self.questions[1].id, self.essay.id])
+        self.assertEqual(sitting.get_user_answers()[self.essay.id],
+                         'because')
+        score = CourseScore.objects.get()
+        self.assertEqual((score.score, score.possible), (2, 4))
+
+        self.assertEqual(self.submit(answers, sitting.id).status_code, 409)
+
+    def test_refuses_unknown_questions(self):
+        self.client.get(self.url)
+        response = self.submit({'12345': 1})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UserAnswer.objects.exists())
+
+    def test_per_question_quizzes_keep_take_view(self):
+        self.quiz.answers_at_end = False
+        self.quiz.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content)['url'],
+                         '/learn/tq/take/')
+
+
+class SyntheticQuizTest(TestCase):
+
+    def test_question_count(self):
+        quiz = synthetic.make_quiz(questions=3, true_false=2)
+        self.assertEqual(quiz.question_count, 5)
+        self.assertEqual(Quiz.objects.get(id=quiz.id).question_count, 5)
+
+
+class MigrationTestCase(TransactionTestCase):
+    """
+    Migrates learn back to migrate_from for the test to fill in with the
+    historical models of self.apps, then migrate() runs migrate_to.
+    """
+    migrate_from = None
+    migrate_to = None
+
+    def migrate_learn(self, name):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('learn', name)])
+        return executor.loader.project_state(('learn', name)).render()
+
+    def setUp(self):
+        self.apps = self.migrate_learn(self.migrate_from)
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def migrate(self):
+        self.apps = self.migrate_learn(self.migrate_to)
+
+
+class CourseScoreMigrationTest(MigrationTestCase):
+    migrate_from = '0001_initial'
+    migrate_to = '0002_course_scores'
+
+    def test_score_csv_split_into_rows(self):
+        User = self.apps.get_model('auth', 'User')
+        Course = self.apps.get_model('learn', 'Course')
+        Progress = self.apps.get_model('learn', 'Progress')
+        maths = Course.objects.create(course='maths')
+        Course.objects.create(course='art')
+        learner = User.objects.create(username='learner')
+        Progress.objects.create(
+            user=learner,
+            score='Maths,3,4,gone,5,5,art,x,1,maths,1,1,')
+        Progress.objects.create(user=User.objects.create(username='new'),
+                                score='')
+
+        self.migrate()
+        CourseScore = self.apps.get_model('learn', 'CourseScore')
+        self.assertEqual(list(CourseScore.objects.values_list(
+            'user', 'course', 'score', 'possible')),
+            [(learner.id, maths.id, 4, 5)])
+
+
+class QuestionOrderMigrationTest(MigrationTestCase):
+    migrate_from = '0002_course_scores'
+    migrate_to = '0003_sitting_question_order'
+
+    def test_answered_questions_go_before_the_cursor(self):
+        User = self.apps.get_model('auth', 'User')
+        Course = self.apps.get_model('learn', 'Course')
+        Quiz = self.apps.get_model('learn', 'Quiz')
+        Sitting = self.apps.get_model('learn', 'Sitting')
+        user = User.objects.create(username='old')
+        quiz = Quiz.objects.create(
+            title='old', url='old', course=Course.objects.create(course='c'))
+        started = Sitting.objects.create(
+            user=user, quiz=quiz, question_list='5,6,', current_score=1,
+            user_answers='{"4": "b", "3": "a"}')
+        broken = Sitting.objects.create(
+            user=user, quiz=quiz, question_list='5,6,', current_score=0,
+            user_answers='not json')
+
+        self.migrate()
+        Sitting = self.apps.get_model('learn', 'Sitting')
+        started = Sitting.objects.get(id=started.id)
+        self.assertEqual(json.loads(started.question_order), [3, 4, 5, 6])
+        self.assertEqual(started.cursor, 2)
+        broken = Sitting.objects.get(id=broken.id)
+        self.assertEqual(json.loads(broken.question_order), [5, 6])
+        self.assertEqual(broken.cursor, 0)
+
+
+class DatabaseSetupTest(TestCase):
+
+    @skipIf(connection.vendor != 'sqlite', 'SQLite pragmas')
+    def test_new_connections_get_the_pragmas(self):
+        directory = tempfile.mkdtemp()
+        wrapper = DatabaseWrapper(dict(connection.settings_dict,
+                                       NAME=os.path.join(directory, 'db')),
+                                  'pragmas')
+        try:
+            cursor = wrapper.cursor()
+            pragmas = []
+            for name in ('journal_mode', 'synchronous', 'busy_timeout'):
+                cursor.execute('PRAGMA %s' % name)
+                pragmas.append(cursor.fetchone()[0])
+        finally:
+            wrapper.close()
+            shutil.rmtree(directory)
+
+        journal_mode = dict(settings.SQLITE_PRAGMAS)['journal_mode']
+        timeout = connection.settings_dict['OPTIONS'].get('timeout', 5)
+        #  synchronous NORMAL is 1
+        self.assertEqual(pragmas, [journal_mode.lower(), 1, timeout * 1000])
+
+    def test_threaded_load_test_needs_a_scratch_database(self):
+        name = os.environ.pop('SMA_DB_NAME', None)
+        try:
+            with self.assertRaises(CommandError):
+                call_command('loadtest', threads=2)
+        finally:
+            if name is not None:
+                os.environ['SMA_DB_NAME'] = name
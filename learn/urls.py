@@ -4,7 +4,8 @@ from django.conf import settings
 
 from learn.views import QuizListView, CategoriesListView,\
     ViewQuizListByCourse, QuizUserProgressView, QuizMarkingList,\
-    QuizMarkingDetail, QuizDetailView, QuizTake
+    QuizMarkingDetail, QuizMarkingBulk, QuizResultsExport, QuizDetailView,\
+    QuizTake, QuizAPI
 
 urlpatterns = patterns('',
 
@@ -48,10 +49,38 @@ urlpatterns = patterns('',
 		   view=QuizMarkingList.as_view(),
 		   name='quiz_marking'),
 
+	   url(regex=r'^marking/export/$',
+		   view=QuizResultsExport.as_view(),
+		   name='quiz_results_export'),
+
+	   url(regex=r'^marking/bulk/$',
+		   view=QuizMarkingBulk.as_view(),
+		   name='quiz_marking_bulk'),
+
 	   url(regex=r'^marking/(?P<pk>[\d.]+)/$',
 		   view=QuizMarkingDetail.as_view(),
 		   name='quiz_marking_detail'),
 
+	   url(r'^search/$',
+		   views.quiz_search,
+		   name='quiz_search'),
+
+	   url(r'^stats/requests/$',
+		   views.request_stats,
+		   name='request_stats'),
+
+	   url(r'^stats/items/(?P<slug>[\w-]+)/$',
+		   views.item_analysis,
+		   name='quiz_item_analysis'),
+
+	   url(r'^stats/quizzes/(?P<slug>[\w-]+)/$',
+		   views.quiz_stats,
+		   name='quiz_stats'),
+
+	   url(r'^stats/courses/(?P<course_name>[\w.-]+)/$',
+		   views.course_stats,
+		   name='course_stats'),
+
 	   #  passes variable 'quiz_name' to quiz_take view
 	   url(regex=r'^(?P<slug>[\w-]+)/$',
 		   view=QuizDetailView.as_view(),
@@ -61,4 +90,8 @@ urlpatterns = patterns('',
 		   view=QuizTake.as_view(),
 		   name='quiz_question'),
 
+	   url(regex=r'^(?P<quiz_name>[\w-]+)/api/$',
+		   view=QuizAPI.as_view(),
+		   name='quiz_api'),
+
 )
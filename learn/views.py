@@ -1,18 +1,31 @@
-import random
-
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required, permission_required
+from django.core.urlresolvers import reverse
+from django.db import transaction
 from django.shortcuts import get_object_or_404, render, render_to_response
+from django.utils.cache import patch_cache_control, patch_vary_headers
 from django.utils.decorators import method_decorator
-from django.views.generic import DetailView, ListView, TemplateView, FormView
-from django.http import HttpResponse, HttpResponseRedirect
+from django.views.decorators.http import condition
+from django.views.generic import DetailView, ListView, TemplateView, FormView,\
+    View
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse,\
+    StreamingHttpResponse
 from django.template import RequestContext
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import logout
+from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from datetime import datetime
+import json
 
 from learn.forms import QuestionForm, EssayForm, UserForm, UserProfileForm
-from learn.models import Quiz, Course, Progress, Sitting, Question,Essay_Question
+from learn.models import Quiz, Course, Sitting, Question,Essay_Question,\
+    new_seed
+from learn.quizcache import get_snapshot, get_question
+from learn.progress import course_scores, exam_page, forget_course_scores
+from learn.anon import AnonSitting, get_anon_store
+from learn import catalogue, itemanalysis, quizstats, requeststats, \
+    results, search
 
 
 # Create your views here.
@@ -174,7 +187,7 @@ def user_logout(request):
     return HttpResponseRedirect('/learn/')            
 class QuizMarkerMixin(object):
     @method_decorator(login_required)
-    @method_decorator(permission_required('quiz.view_sittings'))
+    @method_decorator(permission_required('learn.view_sittings'))
     def dispatch(self, *args, **kwargs):
         return super(QuizMarkerMixin, self).dispatch(*args, **kwargs)
 
@@ -183,25 +196,73 @@ class SittingFilterTitleMixin(object):
         queryset = super(SittingFilterTitleMixin, self).get_queryset()
         quiz_filter = self.request.GET.get('quiz_filter')
         if quiz_filter:
-            queryset = queryset.filter(quiz__title__icontains=quiz_filter)
+            queryset = queryset.filter(
+                quiz__in=Quiz.objects.filter(title__istartswith=quiz_filter))
 
         return queryset
 
 
-class QuizListView(ListView):
+class CatalogueCacheMixin(object):
+    """
+    Caches the page under the catalogue content version, see
+    learn.catalogue. cache_timeout is in seconds.
+    """
+    cache_timeout = 60 * 15
+
+    def dispatch(self, request, *args, **kwargs):
+        return condition(etag_func=catalogue.etag,
+                         last_modified_func=catalogue.last_modified)(
+            self.cached_dispatch)(request, *args, **kwargs)
+
+    def cached_dispatch(self, request, *args, **kwargs):
+        anonymous = not request.user.is_authenticated()
+        if not anonymous or request.method not in ('GET', 'HEAD'):
+            response = super(CatalogueCacheMixin, self)\
+                .dispatch(request, *args, **kwargs)
+        else:
+            cache = catalogue._cache()
+            key = catalogue.page_key(request)
+            content = cache.get(key)
+            if content is not None:
+                response = HttpResponse(content)
+            else:
+                response = super(CatalogueCacheMixin, self)\
+                    .dispatch(request, *args, **kwargs)
+                if response.status_code == 200:
+                    response.render()
+                    cache.set(key, response.content, self.cache_timeout)
+
+        patch_vary_headers(response, ('Cookie',))
+        if not anonymous:
+            patch_cache_control(response, private=True)
+        return response
+
+    def get_context_data(self, **kwargs):
+        context = super(CatalogueCacheMixin, self).get_context_data(**kwargs)
+        context['catalogue_version'] = catalogue.get_version()
+        context['cache_timeout'] = self.cache_timeout
+        return context
+
+
+class QuizListView(CatalogueCacheMixin, ListView):
     model = Quiz
 
+    def get_queryset(self):
+        return super(QuizListView, self).get_queryset()\
+                                        .select_related('course')
+
 
-class QuizDetailView(DetailView):
+class QuizDetailView(CatalogueCacheMixin, DetailView):
     model = Quiz
     slug_field = 'url'
 
 
-class CategoriesListView(ListView):
+class CategoriesListView(CatalogueCacheMixin, ListView):
     model = Course
+    cache_timeout = 60 * 60
 
 
-class ViewQuizListByCourse(ListView):
+class ViewQuizListByCourse(CatalogueCacheMixin, ListView):
     model = Quiz
     template_name = 'view_quiz_course.html'
 
@@ -236,41 +297,209 @@ class QuizUserProgressView(TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super(QuizUserProgressView, self).get_context_data(**kwargs)
-        progress, c = Progress.objects.get_or_create(user=self.request.user)
-        context['cat_scores'] = progress.list_all_cat_scores()
-        context['exams'] = progress.show_exams()
+        context['cat_scores'] = course_scores(self.request.user.id)
+        context['exams'] = exam_page(self.request.user,
+                                     self.request.GET.get('page'))
         return context
 
 
 class QuizMarkingList(QuizMarkerMixin, SittingFilterTitleMixin, ListView):
+    """
+    Complete sittings, newest first, a page at a time.
+    Pages are keyed on the id of the last sitting shown (?before=<id>),
+    so deep pages cost the same as the first one.
+    Filters match the start of the username and quiz title.
+    """
     model = Sitting
+    page_size = 50
 
     def get_queryset(self):
         queryset = super(QuizMarkingList, self).get_queryset()\
-                                               .filter(complete=True)
+                                               .filter(complete=True)\
+                                               .select_related('user',
+                                                               'quiz')
 
         user_filter = self.request.GET.get('user_filter')
         if user_filter:
-            queryset = queryset.filter(user__username__icontains=user_filter)
+            queryset = queryset.filter(
+                user__in=User.objects.filter(
+                    username__istartswith=user_filter))
 
-        return queryset
+        before = self.request.GET.get('before', '')
+        if before.isdigit():
+            queryset = queryset.filter(id__lt=int(before))
+
+        return queryset.order_by('-id')
+
+    def get_context_data(self, **kwargs):
+        context = super(QuizMarkingList, self).get_context_data(**kwargs)
+
+        sittings = list(self.object_list[:self.page_size + 1])
+        if len(sittings) > self.page_size:
+            sittings = sittings[:self.page_size]
+            query = self.request.GET.copy()
+            query['before'] = sittings[-1].id
+            context['next_page'] = query.urlencode()
+
+        context['object_list'] = context['sitting_list'] = sittings
+        context['user_filter'] = self.request.GET.get('user_filter', '')
+        context['quiz_filter'] = self.request.GET.get('quiz_filter', '')
+        return context
 
 
 class QuizMarkingDetail(QuizMarkerMixin, DetailView):
     model = Sitting
 
-    def get_object(self, queryset=None):
-        sitting = super(QuizMarkingDetail, self).get_object()
+    def post(self, request, *args, **kwargs):
+        """
+        Toggles whether the question posted as id was answered correctly,
+        without one re-grades the automatically marked answers, e.g.
+        after an answer has been corrected in admin.
+        """
+        sitting = self.get_object()
+
+        q_to_toggle = request.POST.get('id', '')
+        if q_to_toggle.isdigit():
+            correct = int(q_to_toggle) in sitting.get_incorrect_questions
+            Sitting.objects.apply_marks([(sitting.id, q_to_toggle, correct)])
+        else:
+            sitting.remark()
 
-        q_to_toggle = self.request.GET.get('id')
-        if q_to_toggle:
-            q = Question.objects.get_subclass(id=int(q_to_toggle))
-            if int(q_to_toggle) in sitting.get_incorrect_questions:
-                sitting.remove_incorrect_question(q)
-            else:
-                sitting.add_incorrect_question(q)
+        return HttpResponseRedirect(request.path)
 
-        return sitting
+
+class QuizResultsExport(QuizMarkerMixin, View):
+    """
+    Streams the complete sittings and their answers, see learn.results,
+    as ?format=csv (the default) or jsonl, filtered by ?quiz= (url),
+    ?course= (name) and ?start= and ?end= dates, YYYY-MM-DD.
+    """
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in results.FORMATS:
+            return JsonResponse({'error': 'format must be csv or jsonl'},
+                                status=400)
+
+        filters = {}
+        dates = {}
+        if request.GET.get('quiz'):
+            filters['quiz'] = get_object_or_404(Quiz,
+                                                url=request.GET['quiz'])
+        if request.GET.get('course'):
+            filters['course'] = get_object_or_404(
+                Course, course=request.GET['course'])
+        for name in ('start', 'end'):
+            if request.GET.get(name):
+                try:
+                    dates[name] = datetime.strptime(request.GET[name],
+                                                    '%Y-%m-%d').date()
+                except ValueError:
+                    return JsonResponse({'error': '%s must be a date, '
+                                                  'YYYY-MM-DD' % name},
+                                        status=400)
+
+        records = results.export_records(
+            results.complete_sittings(**filters), **dates)
+        response = StreamingHttpResponse(
+            results.FORMATS[export_format](records),
+            content_type=results.CONTENT_TYPES[export_format])
+        response['Content-Disposition'] = \
+            'attachment; filename="results.%s"' % export_format
+        return response
+
+
+class QuizMarkingBulk(QuizMarkerMixin, View):
+    """
+    Applies many marks at once, across sittings.
+
+    POST a json body of the form
+        {"marks": [{"sitting": 1, "question": 2, "correct": true}, ...]}
+
+    Responds with the new score, max score, percent and incorrect
+    questions of every sitting named, and the marks which were refused
+    (unknown or incomplete sittings, questions not in the sitting).
+    """
+
+    def post(self, request, *args, **kwargs):
+        try:
+            marks = [(int(mark['sitting']), int(mark['question']),
+                      bool(mark['correct']))
+                     for mark in json.loads(request.body)['marks']]
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({'error': 'expected {"marks": [{"sitting":'
+                                          ' id, "question": id, "correct":'
+                                          ' bool}, ...]}'},
+                                status=400)
+
+        totals, errors = Sitting.objects.apply_marks(marks)
+        return JsonResponse({'sittings': totals, 'errors': errors})
+
+
+def quiz_search(request):
+    """
+    Quizzes matching ?q= by title or by the text of their questions, as
+    json. Only the quizzes are returned, never the questions.
+    """
+    results = []
+    for quiz, matches in search.search_quizzes(request.GET.get('q', '')):
+        results.append({
+            'title': quiz.title,
+            'url': reverse('quiz_start_page', kwargs={'slug': quiz.url}),
+            'course': unicode(quiz.course),
+            'questions': quiz.question_count,
+            'matching_questions': matches,
+        })
+    return JsonResponse({'results': results})
+
+
+@staff_member_required
+def request_stats(request):
+    """
+    The sampled per view stats of learn.requeststats as json.
+    ?top= limits the number of views, ?order= is one of
+    requeststats.ORDERINGS.
+    """
+    order = request.GET.get('order', 'time')
+    if order not in requeststats.ORDERINGS:
+        return JsonResponse({'error': 'order must be one of %s' % ', '.join(
+            sorted(requeststats.ORDERINGS))}, status=400)
+    try:
+        count = int(request.GET.get('top', 20))
+    except ValueError:
+        count = 20
+    return JsonResponse({'order': order,
+                         'views': requeststats.top(count, order)})
+
+
+@staff_member_required
+def item_analysis(request, slug):
+    """
+    The item analysis of a quiz, see learn.itemanalysis, as json.
+    """
+    quiz = get_object_or_404(Quiz, url=slug)
+    analysis = dict(itemanalysis.item_analysis(quiz.id), title=quiz.title)
+    return JsonResponse(analysis)
+
+
+@staff_member_required
+def quiz_stats(request, slug):
+    """
+    The statistics and leaderboard of a quiz, see learn.quizstats, as
+    json.
+    """
+    quiz = get_object_or_404(Quiz, url=slug)
+    return JsonResponse(dict(quizstats.quiz_summary(quiz), title=quiz.title))
+
+
+@staff_member_required
+def course_stats(request, course_name):
+    """
+    The statistics of the quizzes of a course added together, as json.
+    """
+    course = get_object_or_404(Course, course=course_name)
+    return JsonResponse(dict(quizstats.course_summary(course),
+                             course=course.course))
 
 
 class QuizTake(FormView):
@@ -285,12 +514,16 @@ class QuizTake(FormView):
             self.sitting = Sitting.objects.user_sitting(request.user,
                                                         self.quiz)
         else:
+            self.anon_store = get_anon_store(request)
             self.sitting = self.anon_load_sitting()
 
         if self.sitting is False:
             return render(request, 'single_complete.html')
 
-        return super(QuizTake, self).dispatch(request, *args, **kwargs)
+        response = super(QuizTake, self).dispatch(request, *args, **kwargs)
+        if not self.logged_in_user:
+            self.anon_store.apply(response)
+        return response
 
     def get_form(self, form_class):
         if self.logged_in_user:
@@ -315,7 +548,7 @@ class QuizTake(FormView):
                 return self.final_result_user()
         else:
             self.form_valid_anon(form)
-            if not self.request.session[self.quiz.anon_q_list()]:
+            if self.anon_next_question() is None:
                 return self.final_result_anon()
 
         self.request.POST = ''
@@ -330,17 +563,9 @@ class QuizTake(FormView):
         return context
 
     def form_valid_user(self, form):
-        progress, c = Progress.objects.get_or_create(user=self.request.user)
         guess = form.cleaned_data['answers']
         is_correct = self.question.check_if_correct(guess)
 
-        if is_correct is True:
-            self.sitting.add_to_score(1)
-            progress.update_score(self.question.course, 1, 1)
-        else:
-            self.sitting.add_incorrect_question(self.question)
-            progress.update_score(self.question.course, 0, 1)
-
         if self.quiz.answers_at_end is not True:
             self.previous = {'previous_answer': guess,
                              'previous_outcome': is_correct,
@@ -351,14 +576,13 @@ class QuizTake(FormView):
         else:
             self.previous = {}
 
-        self.sitting.add_user_answer(self.question, guess)
-        self.sitting.remove_first_question()
+        self.sitting.record_answer(self.question, guess, is_correct)
 
     def final_result_user(self):
         results = {
             'quiz': self.quiz,
             'score': self.sitting.get_current_score,
-            'max_score': self.quiz.get_max_score,
+            'max_score': self.sitting.max_score,
             'percent': self.sitting.get_percent_correct,
             'sitting': self.sitting,
             'previous': self.previous,
@@ -370,7 +594,7 @@ class QuizTake(FormView):
             self.sitting.delete()
 
         if self.quiz.answers_at_end:
-            results['questions'] = self.quiz.get_questions()
+            results['questions'] = get_snapshot(self.quiz.id).questions
             results['incorrect_questions'] =\
                 self.sitting.get_incorrect_questions
 
@@ -380,43 +604,47 @@ class QuizTake(FormView):
         if self.quiz.single_attempt is True:
             return False
 
-        if self.quiz.anon_q_list() in self.request.session:
-            return self.request.session[self.quiz.anon_q_list()]
-        else:
+        self.snapshot = get_snapshot(self.quiz.id)
+        sitting = self.anon_store.load(self.quiz)
+
+        # a quiz whose questions changed since the sitting started is
+        # started again, other edits keep the sitting
+        if sitting is None or\
+                sitting.checksum != self.snapshot.order_checksum or\
+                sitting.next_question_id(self.snapshot) is None:
             return self.new_anon_quiz_session()
+        return sitting
 
     def new_anon_quiz_session(self):
         """
-        Sets the session variables when starting a quiz for the first time
-        as a non signed-in user
+        Starts the quiz for a non signed-in user
         """
-        self.request.session.set_expiry(259200)  # expires after 3 days
-        questions = self.quiz.get_questions()
-        question_list = [question.id for question in questions]
+        seed = None
         if self.quiz.random_order is True:
-            random.shuffle(question_list)
-
-        # session score for anon users
-        self.request.session[self.quiz.anon_score_id()] = 0
+            seed = new_seed()
 
-        # session list of questions
-        self.request.session[self.quiz.anon_q_list()] = question_list
-
-        return self.request.session[self.quiz.anon_q_list()]
+        sitting = AnonSitting(self.quiz.id, self.snapshot.order_checksum,
+                              seed)
+        self.anon_store.save(sitting, self.quiz)
+        return sitting
 
     def anon_next_question(self):
-        next_question_id = self.request.session[self.quiz.anon_q_list()][0]
-        return Question.objects.get_subclass(id=next_question_id)
+        next_question_id = self.sitting.next_question_id(self.snapshot)
+        if next_question_id is None:
+            return None
+        return get_question(self.quiz.id, next_question_id)
 
     def form_valid_anon(self, form):
         guess = form.cleaned_data['answers']
         is_correct = self.question.check_if_correct(guess)
 
+        totals = self.anon_store.get_totals()
         if is_correct:
-            self.request.session[self.quiz.anon_score_id()] += 1
-            anon_session_score(self.request.session, 1, 1)
+            self.sitting.score += 1
+            anon_session_score(totals, 1, 1)
         else:
-            anon_session_score(self.request.session, 0, 1)
+            anon_session_score(totals, 0, 1)
+        self.anon_store.save_totals(totals)
 
         self.previous = {}
         if self.quiz.answers_at_end is not True:
@@ -427,14 +655,15 @@ class QuizTake(FormView):
                              'question_type': {self.question
                                                .__class__.__name__: True}}
 
-        self.request.session[self.quiz.anon_q_list()] =\
-            self.request.session[self.quiz.anon_q_list()][1:]
+        self.sitting.cursor += 1
+        self.anon_store.save(self.sitting, self.quiz)
 
     def final_result_anon(self):
-        score = self.request.session[self.quiz.anon_score_id()]
-        max_score = self.quiz.get_max_score
+        score = self.sitting.score
+        max_score = len(self.sitting.get_question_order(self.snapshot))
         percent = int(round((float(score) / max_score) * 100))
-        session, session_possible = anon_session_score(self.request.session)
+        session, session_possible = anon_session_score(
+            self.anon_store.get_totals())
         if score is 0:
             score = "0"
 
@@ -446,19 +675,129 @@ class QuizTake(FormView):
             'possible': session_possible
         }
 
-        del self.request.session[self.quiz.anon_q_list()]
+        self.anon_store.remove(self.quiz)
 
         if self.quiz.answers_at_end:
-            results['questions'] = self.quiz.get_questions()
+            results['questions'] = get_snapshot(self.quiz.id).questions
         else:
             results['previous'] = self.previous
 
         return render(self.request, 'result.html', results)
 
 
+class QuizAPI(View):
+    """
+    The whole of a quiz in one request, for signed in users taking quizzes
+    whose answers are shown at the end. Quizzes which show the answer
+    after every question are taken one question at a time, by QuizTake.
+
+    GET returns the sitting and its unanswered questions in the order of
+    the sitting, shuffled when the quiz is in random order, with the
+    choices of each but not which are correct.
+
+    POST a json body of the form
+        {"sitting": 1, "answers": {"<question id>": guess, ...}}
+    where a guess is an answer id for multiple choice questions, true or
+    false for true/false questions and text for essays. Questions left
+    out are answered with an empty guess. Every answer is graded at once
+    and the sitting completed; responds with the score and whether each
+    question was answered correctly.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        self.quiz = get_object_or_404(Quiz, url=self.kwargs['quiz_name'])
+        if not request.user.is_authenticated():
+            return JsonResponse({'error': 'sign in to take this quiz'},
+                                status=403)
+        if self.quiz.answers_at_end is not True:
+            return JsonResponse({
+                'error': 'this quiz is taken one question at a time',
+                'url': reverse('quiz_question',
+                               kwargs={'quiz_name': self.quiz.url})},
+                status=400)
+        return super(QuizAPI, self).dispatch(request, *args, **kwargs)
+
+    def get(self, request, *args, **kwargs):
+        sitting = Sitting.objects.user_sitting(request.user, self.quiz)
+        if sitting is False:
+            return JsonResponse({'error': 'this quiz may only be sat once'},
+                                status=403)
+
+        return JsonResponse({
+            'quiz': {'title': self.quiz.title,
+                     'url': self.quiz.url,
+                     'description': self.quiz.description},
+            'sitting': sitting.id,
+            'max_score': sitting.max_score,
+            'questions': [question_data(question) for question
+                          in sitting.get_remaining_questions()],
+        })
+
+    def post(self, request, *args, **kwargs):
+        try:
+            body = json.loads(request.body)
+            sitting_id = int(body['sitting'])
+            guesses = dict((int(question_id), guess) for question_id, guess
+                           in body['answers'].items())
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return JsonResponse({'error': 'expected {"sitting": id, '
+                                          '"answers": {"question id": '
+                                          'guess, ...}}'},
+                                status=400)
+
+        with transaction.atomic():
+            try:
+                sitting = Sitting.objects.select_for_update().get(
+                    id=sitting_id, user=request.user, quiz=self.quiz,
+                    complete=False)
+            except Sitting.DoesNotExist:
+                return JsonResponse({'error': 'no sitting of this quiz in '
+                                              'progress'},
+                                    status=409)
+            sitting.quiz = self.quiz
+
+            unknown = set(guesses) - set(
+                sitting.get_question_order()[sitting.cursor:])
+            if unknown:
+                return JsonResponse({'error': 'questions not in the '
+                                              'sitting',
+                                     'questions': sorted(unknown)},
+                                    status=400)
+
+            marked = sitting.record_answers(guesses)
+            if self.quiz.exam_paper is False:
+                sitting.delete()
+
+        #  record_answers ran inside the transaction above
+        forget_course_scores([request.user.id])
+        percent = sitting.get_percent_correct
+        return JsonResponse({
+            'sitting': sitting_id,
+            'score': sitting.current_score,
+            'max_score': sitting.max_score,
+            'percent': percent,
+            'passed': percent >= self.quiz.pass_mark,
+            'answers': dict((str(question_id), correct)
+                            for question_id, correct in marked.items()),
+        })
+
+
+def question_data(question):
+    """
+    A question as sent by QuizAPI, without its correct answers.
+    """
+    choices = question.get_answers_list() or []
+    return {'id': question.id,
+            'type': question.__class__._meta.model_name,
+            'content': question.content,
+            'choices': [{'id': choice, 'content': unicode(content)}
+                        for choice, content in choices]}
+
+
 def anon_session_score(session, to_add=0, possible=0):
     """
-    Returns the session score for non-signed in users.
+    Returns the session score for non-signed in users, kept in the
+    anonymous quiz store.
     If number passed in then add this to the running total and
     return session score.
 
@@ -0,0 +1,148 @@
+"""
+The question picker of the quiz admin.
+
+Quizzes can draw on banks of tens of thousands of questions, too many to
+render as options. The picker renders only the questions already chosen
+and finds others a page at a time through QuizAdmin.question_search.
+"""
+from django import forms
+from django.core.exceptions import ValidationError
+from django.core.urlresolvers import reverse
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from learn import search
+from learn.models import Course, Question, MCQuestion, TF_Question, \
+    Essay_Question
+
+# the picker's type keys and the question_type of each
+QUESTION_TYPES = (
+    ('mc', 'mcquestion', MCQuestion),
+    ('tf', 'tf_question', TF_Question),
+    ('essay', 'essay_question', Essay_Question),
+)
+
+# stays under the 999 parameters SQLite allows in one query
+ID_BATCH = 500
+
+
+def in_batches(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), ID_BATCH):
+        yield ids[start:start + ID_BATCH]
+
+
+def question_type(question):
+    """
+    The key and verbose name of the type of a question loaded as its
+    subclass.
+    """
+    for key, _, model in QUESTION_TYPES:
+        if isinstance(question, model):
+            return key, model._meta.verbose_name
+    return '', 'Question'
+
+
+def filter_questions(queryset, text='', course='', kind=''):
+    if text:
+        queryset = search.filter_questions(queryset, text)
+    if course:
+        queryset = queryset.filter(course=course)
+    for key, question_type, _ in QUESTION_TYPES:
+        if kind == key:
+            queryset = queryset.filter(question_type=question_type)
+    return queryset
+
+
+class QuestionPicker(forms.SelectMultiple):
+
+    class Media:
+        js = ('js/question_picker.js',)
+
+    def render(self, name, value, attrs=None, choices=()):
+        attrs = self.build_attrs(attrs, name=name)
+        selected = [int(question_id) for question_id in value or ()
+                    if unicode(question_id).isdigit()]
+        labels = {}
+        for batch in in_batches(selected):
+            labels.update(Question.objects.filter(id__in=batch)
+                                          .values_list('id', 'content'))
+
+        options = u''.join(
+            format_html(u'<option value="{0}" selected="selected">{1}'
+                        '</option>', question_id, labels[question_id])
+            for question_id in selected if question_id in labels)
+        courses = u''.join(
+            format_html(u'<option value="{0}">{1}</option>', course_id, title)
+            for course_id, title in Course.objects.order_by('course')
+                                                  .values_list('id',
+                                                               'course'))
+        types = u''.join(
+            format_html(u'<option value="{0}">{1}</option>', key,
+                        model._meta.verbose_name)
+            for key, _, model in QUESTION_TYPES)
+
+        return format_html(
+            u'<div class="question-picker" data-search-url="{0}">'
+            '<p><select multiple="multiple" size="12" {1}>{2}</select><br>'
+            '<a href="#" class="picker-remove">Remove highlighted</a></p>'
+            '<p><input type="text" class="picker-search" '
+            'placeholder="Search questions"> '
+            '<select class="picker-course"><option value="">All courses'
+            '</option>{3}</select> '
+            '<select class="picker-type"><option value="">All types'
+            '</option>{4}</select></p>'
+            '<ul class="picker-results"></ul>'
+            '<p><a href="#" class="picker-previous">Previous</a> '
+            '<a href="#" class="picker-next">Next</a></p>'
+            '</div>',
+            reverse('admin:learn_quiz_questions'),
+            flatatt(attrs), mark_safe(options),
+            mark_safe(courses), mark_safe(types))
+
+
+class QuestionPickerField(forms.Field):
+    """
+    Cleans to the list of question ids picked.
+    """
+    widget = QuestionPicker
+
+    def to_python(self, value):
+        if not value:
+            return []
+        try:
+            ids = sorted(set(int(question_id) for question_id in value))
+        except (TypeError, ValueError):
+            raise ValidationError('Pick questions from the list.',
+                                  code='invalid')
+        found = set()
+        for batch in in_batches(ids):
+            found.update(Question.objects.filter(id__in=batch)
+                                         .values_list('id', flat=True))
+        missing = [question_id for question_id in ids
+                   if question_id not in found]
+        if missing:
+            raise ValidationError(
+                'Questions %s do not exist.' % ', '.join(map(str, missing)),
+                code='invalid_choice')
+        return ids
+
+
+def search_results(questions, page, page_size):
+    """
+    One page of the questions, newest first, for the picker.
+    Returns the json ready results and whether there is a next page.
+    """
+    start = (page - 1) * page_size
+    found = questions.order_by('-id')[start:start + page_size + 1]\
+                     .as_subclasses('course')
+    results = []
+    for question in found[:page_size]:
+        key, label = question_type(question)
+        results.append({'id': question.id,
+                        'content': question.content,
+                        'type': key,
+                        'type_name': unicode(label),
+                        'course': unicode(question.course or '')})
+    return results, len(found) > page_size
@@ -0,0 +1,228 @@
+"""
+Pre-aggregated score data behind the charts.
+
+Sittings of quizzes which are not exam papers are deleted as soon as
+they are completed, so the charts cannot be drawn from the Sitting
+table, and scanning it on every request would be slow anyway. Instead
+every sitting is added, as it completes, to two small tables:
+
+    ScoreBucket   sittings per quiz per band of percent score
+    DailyResult   sittings, passes and scores per quiz per day
+
+Marking a complete sitting again moves it to its new band and corrects
+the totals of its day. rebuild() refills both tables from the complete
+sittings still in the database, which are those of exam papers.
+
+The functions at the bottom read the tables for the chart endpoints.
+Time series are summed into at most the number of points asked for, so
+a chart of years of results is still a few dozen points.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Max, Sum
+from django.utils import timezone
+
+from learn.database import add_to_row
+from learn.models import Course, Sitting, course_percent
+from plotma.models import ScoreBucket, DailyResult
+
+BUCKET_WIDTH = 10
+
+
+def bucket_of(percent):
+    """
+    The lowest percent of the histogram bucket of a score, 100 falls in
+    the top bucket.
+    """
+    percent = max(0, min(int(percent), 100 - BUCKET_WIDTH))
+    return percent // BUCKET_WIDTH * BUCKET_WIDTH
+
+
+def local_date(moment):
+    if timezone.is_aware(moment):
+        moment = timezone.localtime(moment)
+    return moment.date()
+
+
+def completion_day(sitting):
+    """
+    The day a complete sitting was finished, which is the day of its
+    last answer.
+    """
+    answered = sitting.useranswer_set.aggregate(
+        last=Max('answered_at'))['last']
+    return local_date(answered or timezone.now())
+
+
+def sitting_completed(sender, sitting, **kwargs):
+    quiz = sitting.quiz
+    percent = course_percent(sitting.current_score, sitting.max_score)
+    add_to_row(ScoreBucket, {'quiz_id': quiz.id,
+                             'bucket': bucket_of(percent)},
+               sittings=1)
+    add_to_row(DailyResult, {'quiz_id': quiz.id,
+                             'day': completion_day(sitting)},
+               defaults={'course_id': quiz.course_id}, sittings=1,
+               passed=int(percent >= quiz.pass_mark),
+               score=sitting.current_score, max_score=sitting.max_score)
+
+
+def sitting_remarked(sender, sitting, previous_score, **kwargs):
+    quiz = sitting.quiz
+    before = course_percent(previous_score, sitting.max_score)
+    after = course_percent(sitting.current_score, sitting.max_score)
+
+    # a sitting completed before the tables were filled is not in them
+    if bucket_of(before) != bucket_of(after):
+        moved = ScoreBucket.objects.filter(
+            quiz=quiz.id, bucket=bucket_of(before), sittings__gt=0)\
+            .update(sittings=F('sittings') - 1)
+        if not moved:
+            return
+        add_to_row(ScoreBucket, {'quiz_id': quiz.id,
+                                 'bucket': bucket_of(after)},
+                   sittings=1)
+
+    passed = int(after >= quiz.pass_mark) - int(before >= quiz.pass_mark)
+    DailyResult.objects.filter(quiz=quiz.id, day=completion_day(sitting))\
+        .update(score=F('score') + sitting.current_score - previous_score,
+                passed=F('passed') + passed)
+
+
+def rebuild():
+    """
+    Refills the tables from the complete sittings in the database.
+    Returns the number of sittings counted.
+    """
+    buckets = {}
+    days = {}
+    today = local_date(timezone.now())
+    sittings = Sitting.objects.filter(complete=True)\
+        .annotate(finished=Max('useranswer__answered_at'))\
+        .values_list('quiz_id', 'quiz__course_id', 'quiz__pass_mark',
+                     'current_score', 'max_score', 'finished')
+
+    count = 0
+    for quiz_id, course_id, pass_mark, score, max_score, finished in\
+            sittings.iterator():
+        count += 1
+        percent = course_percent(score, max_score)
+        key = (quiz_id, bucket_of(percent))
+        buckets[key] = buckets.get(key, 0) + 1
+
+        key = (quiz_id, local_date(finished) if finished else today)
+        totals = days.setdefault(key, [course_id, 0, 0, 0, 0])
+        totals[1] += 1
+        totals[2] += int(percent >= pass_mark)
+        totals[3] += score
+        totals[4] += max_score
+
+    with transaction.atomic():
+        ScoreBucket.objects.all().delete()
+        DailyResult.objects.all().delete()
+        ScoreBucket.objects.bulk_create(
+            ScoreBucket(quiz_id=quiz_id, bucket=bucket, sittings=total)
+            for (quiz_id, bucket), total in buckets.items())
+        DailyResult.objects.bulk_create(
+            DailyResult(quiz_id=quiz_id, day=day, course_id=course_id,
+                        sittings=total, passed=passed, score=score,
+                        max_score=max_score)
+            for (quiz_id, day), (course_id, total, passed, score, max_score)
+            in days.items())
+    return count
+
+
+def score_histogram(quiz=None, course=None):
+    """
+    The number of sittings in each band of percent score, of one quiz,
+    the quizzes of one course or every quiz.
+    """
+    buckets = ScoreBucket.objects.all()
+    if quiz is not None:
+        buckets = buckets.filter(quiz=quiz)
+    if course is not None:
+        buckets = buckets.filter(quiz__course=course)
+    counts = dict(buckets.values_list('bucket')
+                         .annotate(total=Sum('sittings'))
+                         .order_by())
+    top = bucket_of(100)
+    return [{'from': bucket,
+             'to': 100 if bucket == top else bucket + BUCKET_WIDTH - 1,
+             'sittings': counts.get(bucket, 0)}
+            for bucket in range(0, top + 1, BUCKET_WIDTH)]
+
+
+def downsample(daily, start, end, points):
+    """
+    Sums a dict of day to [sittings, passed, score, max score] into at
+    most points periods of equal length from start to end.
+    """
+    days = (end - start).days + 1
+    step = max(1, -(-days // points))
+    periods = [[0, 0, 0, 0] for _ in range(-(-days // step))]
+    for day, totals in daily.items():
+        period = periods[(day - start).days // step]
+        for index, value in enumerate(totals):
+            period[index] += value
+
+    series = []
+    for number, (sittings, passed, score, max_score) in enumerate(periods):
+        first = start + timedelta(days=number * step)
+        series.append({
+            'start': first.isoformat(),
+            'end': min(first + timedelta(days=step - 1), end).isoformat(),
+            'sittings': sittings,
+            'passed': passed,
+            'pass_rate': course_percent(passed, sittings)
+            if sittings else None,
+            'mean_percent': course_percent(score, max_score)
+            if max_score else None,
+        })
+    return series
+
+
+TOTALS = ('sittings', 'passed', 'score', 'max_score')
+
+
+def _daily(rows, *group):
+    """
+    Yields the group values, the day and the list of TOTALS summed over
+    the rows of the group and day.
+    """
+    sums = dict(('total_%s' % field, Sum(field)) for field in TOTALS)
+    for row in rows.values(*group + ('day',)).annotate(**sums).order_by():
+        yield tuple(row[field] for field in group + ('day',)) + (
+            [row['total_%s' % field] for field in TOTALS],)
+
+
+def results_over_time(start, end, points, quiz=None, course=None):
+    """
+    Sittings, passes, pass rate and mean percent score from start to end,
+    in at most points periods.
+    """
+    rows = DailyResult.objects.filter(day__gte=start, day__lte=end)
+    if quiz is not None:
+        rows = rows.filter(quiz=quiz)
+    if course is not None:
+        rows = rows.filter(course=course)
+    daily = dict(_daily(rows))
+    return downsample(daily, start, end, points)
+
+
+def course_progress(start, end, points):
+    """
+    results_over_time for every course with results from start to end.
+    """
+    rows = DailyResult.objects.filter(day__gte=start, day__lte=end,
+                                      course__isnull=False)
+    courses = {}
+    for course_id, day, totals in _daily(rows, 'course'):
+        courses.setdefault(course_id, {})[day] = totals
+
+    names = dict(Course.objects.filter(id__in=courses)
+                               .values_list('id', 'course'))
+    return [{'course': names.get(course_id, ''),
+             'id': course_id,
+             'results': downsample(daily, start, end, points)}
+            for course_id, daily in sorted(courses.items())]
@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class PlotmaConfig(AppConfig):
+    name = 'plotma'
+
+    def ready(self):
+        from learn.models import Sitting, sitting_completed, sitting_remarked
+        from plotma import aggregates
+        sitting_completed.connect(aggregates.sitting_completed,
+                                  sender=Sitting)
+        sitting_remarked.connect(aggregates.sitting_remarked, sender=Sitting)
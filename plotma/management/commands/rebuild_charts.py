@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from plotma import aggregates
+
+
+class Command(BaseCommand):
+    help = ("Refills the score histogram and daily result tables of the "
+            "charts from the complete sittings in the database. Sittings "
+            "already deleted, those of quizzes which are not exam papers, "
+            "are lost from the charts.")
+
+    def handle(self, *args, **options):
+        count = aggregates.rebuild()
+        self.stdout.write('Counted %s complete sittings.' % count)
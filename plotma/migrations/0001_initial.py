@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learn', '0009_question_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyResult',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('day', models.DateField(db_index=True)),
+                ('sittings', models.PositiveIntegerField(default=0)),
+                ('passed', models.PositiveIntegerField(default=0)),
+                ('score', models.IntegerField(default=0)),
+                ('max_score', models.PositiveIntegerField(default=0)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.SET_NULL, blank=True, to='learn.Course', null=True)),
+                ('quiz', models.ForeignKey(to='learn.Quiz')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='ScoreBucket',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('bucket', models.PositiveSmallIntegerField()),
+                ('sittings', models.PositiveIntegerField(default=0)),
+                ('quiz', models.ForeignKey(to='learn.Quiz')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='scorebucket',
+            unique_together=set([('quiz', 'bucket')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyresult',
+            unique_together=set([('quiz', 'day')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='dailyresult',
+            index_together=set([('course', 'day')]),
+        ),
+    ]
@@ -1,3 +1,47 @@
 from django.db import models
 
 # Create your models here.
+
+
+class ScoreBucket(models.Model):
+    """
+    The number of complete sittings of a quiz whose percent score falls
+    in one bucket of the score histogram. Bucket is the lowest percent
+    of the bucket, see plotma.aggregates.bucket_of.
+    """
+    quiz = models.ForeignKey('learn.Quiz')
+
+    bucket = models.PositiveSmallIntegerField()
+
+    sittings = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = (('quiz', 'bucket'),)
+
+
+class DailyResult(models.Model):
+    """
+    The complete sittings of a quiz on one day: how many, how many
+    passed and the sum of their scores and of their maximum scores.
+
+    Course is the course of the quiz when the row was created, kept here
+    so the progress of a course is read without a join.
+    """
+    quiz = models.ForeignKey('learn.Quiz')
+
+    course = models.ForeignKey('learn.Course', null=True, blank=True,
+                               on_delete=models.SET_NULL)
+
+    day = models.DateField(db_index=True)
+
+    sittings = models.PositiveIntegerField(default=0)
+
+    passed = models.PositiveIntegerField(default=0)
+
+    score = models.IntegerField(default=0)
+
+    max_score = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = (('quiz', 'day'),)
+        index_together = (('course', 'day'),)
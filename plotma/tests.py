@@ -1,3 +1,124 @@
+import json
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+
+from learn.models import Course, Quiz, TF_Question, Sitting
+from plotma import aggregates
+from plotma.models import ScoreBucket, DailyResult
 
 # Create your tests here.
+
+
+class ChartDataTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        User.objects.create_superuser('staff', 's@s.com', 'secret')
+        self.client.login(username='staff', password='secret')
+        self.course = Course.objects.new_course('elderberries')
+        self.quiz = Quiz.objects.create(title='test quiz', url='tq',
+                                        course=self.course, pass_mark=50,
+                                        exam_paper=True)
+        self.questions = []
+        for number in range(4):
+            question = TF_Question.objects.create(content='q%s' % number,
+                                                  course=self.course,
+                                                  correct=True)
+            question.quiz.add(self.quiz)
+            self.questions.append(question)
+
+    def sit(self, right, days_ago=0):
+        user = User.objects.create_user('taker%s' % User.objects.count())
+        sitting = Sitting.objects.new_sitting(user, self.quiz)
+        for number, question in enumerate(self.questions):
+            sitting.record_answer(question, 'True', number < right)
+        if days_ago:
+            sitting.useranswer_set.update(
+                answered_at=timezone.now() - timedelta(days=days_ago))
+        sitting.mark_quiz_complete()
+        return sitting
+
+    def test_completed_sittings_are_counted(self):
+        for right in (4, 4, 1):
+            self.sit(right)
+        histogram = self.client.get('/plotma/data/scores/',
+                                    {'quiz': self.quiz.id})
+        buckets = json.loads(histogram.content)['buckets']
+        self.assertEqual(buckets[-1], {'from': 90, 'to': 100,
+                                       'sittings': 2})
+        self.assertEqual(buckets[2]['sittings'], 1)
+
+        # the session and the user, then the chart data
+        with self.assertNumQueries(3):
+            response = self.client.get('/plotma/data/results/',
+                                       {'course': self.course.id})
+        results = json.loads(response.content)['results']
+        self.assertTrue(len(results) <= 52)
+        self.assertEqual(results[-1]['sittings'], 3)
+        self.assertEqual(results[-1]['pass_rate'], 67)
+        self.assertEqual(results[-1]['mean_percent'], 75)
+
+        response = self.client.get('/plotma/data/courses/', {'points': 12})
+        courses = json.loads(response.content)['courses']
+        self.assertEqual([course['course'] for course in courses],
+                         ['elderberries'])
+        self.assertEqual(courses[0]['results'][-1]['sittings'], 3)
+
+    def test_remarking_moves_the_sitting(self):
+        sitting = self.sit(1)
+        Sitting.objects.apply_marks([(sitting.id, self.questions[1].id,
+                                      True),
+                                     (sitting.id, self.questions[2].id,
+                                      True)])
+        self.assertEqual(
+            list(ScoreBucket.objects.filter(sittings__gt=0)
+                                    .values_list('bucket', 'sittings')),
+            [(70, 1)])
+        day = DailyResult.objects.get()
+        self.assertEqual((day.score, day.passed), (3, 1))
+
+        self.assertEqual(aggregates.rebuild(), 1)
+        self.assertEqual(list(ScoreBucket.objects.values_list('bucket')),
+                         [(70,)])
+        self.assertEqual(DailyResult.objects.get().score, 3)
+
+    def test_counted_on_the_day_of_the_last_answer(self):
+        sitting = self.sit(1, days_ago=2)
+        day = aggregates.local_date(timezone.now() - timedelta(days=2))
+        self.assertEqual(DailyResult.objects.get().day, day)
+
+        Sitting.objects.apply_marks([(sitting.id, self.questions[1].id,
+                                      True)])
+        live = list(DailyResult.objects.values_list('day', 'score',
+                                                    'passed'))
+        self.assertEqual(live, [(day, 2, 1)])
+        aggregates.rebuild()
+        self.assertEqual(list(DailyResult.objects.values_list(
+            'day', 'score', 'passed')), live)
+
+    def test_staff_only(self):
+        self.client.logout()
+        response = self.client.get('/plotma/data/scores/')
+        self.assertEqual(response.status_code, 302)
+
+    def test_downsample(self):
+        start = date(2015, 1, 1)
+        series = aggregates.downsample(
+            {start: [1, 1, 2, 4], start + timedelta(days=9): [1, 0, 1, 4]},
+            start, start + timedelta(days=9), 3)
+        self.assertEqual([(period['start'], period['end'],
+                           period['sittings']) for period in series],
+                         [('2015-01-01', '2015-01-04', 1),
+                          ('2015-01-05', '2015-01-08', 0),
+                          ('2015-01-09', '2015-01-10', 1)])
+        self.assertEqual(series[0]['pass_rate'], 100)
+        self.assertEqual(series[1]['mean_percent'], None)
+
+    def test_bad_parameters(self):
+        response = self.client.get('/plotma/data/courses/',
+                                   {'start': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
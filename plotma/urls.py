@@ -8,4 +8,16 @@ urlpatterns = patterns('',
 			views.index, 
 			name='index'),
 
+      url(r'^data/scores/$',
+			views.score_histogram,
+			name='score_histogram'),
+
+      url(r'^data/results/$',
+			views.results_over_time,
+			name='results_over_time'),
+
+      url(r'^data/courses/$',
+			views.course_progress,
+			name='course_progress'),
+
 )
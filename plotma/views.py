@@ -1,10 +1,103 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render, render_to_response
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
 from django.template import RequestContext
+from django.utils import timezone
+from django.views.decorators.cache import cache_page
+
+from plotma import aggregates
 
 # Create your views here.
 
+CACHE_TIMEOUT = getattr(settings, 'PLOTMA_CACHE_TIMEOUT', 60)
+
+MAX_POINTS = 366
+
+
 def index(request):
     
     context = RequestContext(request)
     return render_to_response('plotma/index.html',{}, context)
+
+
+def _id(request, name):
+    value = request.GET.get(name, '')
+    if not value:
+        return None
+    if not value.isdigit():
+        raise ValueError('%s must be an id' % name)
+    return int(value)
+
+
+def _date(request, name, default):
+    value = request.GET.get(name, '')
+    if not value:
+        return default
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError('%s must be a date, YYYY-MM-DD' % name)
+
+
+def _range(request):
+    """
+    The start, end and number of points of a time series chart, from
+    ?start=, ?end= and ?points=. The default is the last year.
+    """
+    end = _date(request, 'end', aggregates.local_date(timezone.now()))
+    start = _date(request, 'start', end - timedelta(days=364))
+    if start > end:
+        raise ValueError('start is after end')
+    try:
+        points = int(request.GET.get('points', 52))
+    except ValueError:
+        raise ValueError('points must be a number')
+    return start, end, max(1, min(points, MAX_POINTS))
+
+
+@staff_member_required
+@cache_page(CACHE_TIMEOUT)
+def score_histogram(request):
+    """
+    The number of sittings per band of percent score as json, of the
+    quiz ?quiz=, the quizzes of the course ?course= or every quiz.
+    """
+    try:
+        quiz, course = _id(request, 'quiz'), _id(request, 'course')
+    except ValueError as error:
+        return JsonResponse({'error': unicode(error)}, status=400)
+    return JsonResponse({'buckets': aggregates.score_histogram(quiz,
+                                                               course)})
+
+
+@staff_member_required
+@cache_page(CACHE_TIMEOUT)
+def results_over_time(request):
+    """
+    Sittings, pass rate and mean score over time as json, see _range,
+    of ?quiz=, ?course= or every quiz.
+    """
+    try:
+        quiz, course = _id(request, 'quiz'), _id(request, 'course')
+        start, end, points = _range(request)
+    except ValueError as error:
+        return JsonResponse({'error': unicode(error)}, status=400)
+    return JsonResponse({'results': aggregates.results_over_time(
+        start, end, points, quiz, course)})
+
+
+@staff_member_required
+@cache_page(CACHE_TIMEOUT)
+def course_progress(request):
+    """
+    results_over_time of every course as json.
+    """
+    try:
+        start, end, points = _range(request)
+    except ValueError as error:
+        return JsonResponse({'error': unicode(error)}, status=400)
+    return JsonResponse({'courses': aggregates.course_progress(
+        start, end, points)})
@@ -42,6 +42,9 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'learn.requeststats.RequestStatsMiddleware',
+    'learn.quizcache.QuizCacheMiddleware',
+    'learn.catalogue.CatalogueCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -59,23 +62,94 @@ WSGI_APPLICATION = 'smaproject.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/1.7/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+# The database is chosen by the environment: SMA_DB_ENGINE is sqlite
+# (the default) or postgresql, SMA_DB_NAME, SMA_DB_USER, SMA_DB_PASSWORD,
+# SMA_DB_HOST and SMA_DB_PORT locate it. PostgreSQL connections are kept
+# open for SMA_DB_CONN_MAX_AGE seconds instead of one per request.
+
+if os.environ.get('SMA_DB_ENGINE', 'sqlite') == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql_psycopg2',
+            'NAME': os.environ.get('SMA_DB_NAME', 'sma'),
+            'USER': os.environ.get('SMA_DB_USER', 'djangodb'),
+            'PASSWORD': os.environ.get('SMA_DB_PASSWORD', ''),
+            'HOST': os.environ.get('SMA_DB_HOST', '127.0.0.1'),
+            'PORT': os.environ.get('SMA_DB_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('SMA_DB_CONN_MAX_AGE', 600)),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SMA_DB_NAME',
+                                   os.path.join(BASE_DIR, 'db.sqlite3')),
+            'OPTIONS': {
+                # seconds a connection waits for the write lock
+                'timeout': int(os.environ.get('SMA_SQLITE_TIMEOUT', 20)),
+            },
+        }
     }
+
+# Run on every new SQLite connection by learn.database. In WAL mode
+# readers no longer wait for a writer, and with synchronous NORMAL a
+# commit does not wait for the disk, only checkpoints do.
+SQLITE_PRAGMAS = (
+    ('journal_mode', os.environ.get('SMA_SQLITE_JOURNAL_MODE', 'WAL')),
+    ('synchronous', 'NORMAL'),
+)
+
+# Caches
+# https://docs.djangoproject.com/en/1.7/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+#    'quiz': {
+#        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+#        'LOCATION': os.path.join(BASE_DIR, 'cache', 'quiz'),
+#        'TIMEOUT': None,
+#    },
 }
 
-#DATABASES = {
-#    'default': {
-#        'ENGINE': 'django.db.backends.psycopg2',
-#        'NAME': 'iquantihrms',
-#        'USER': 'djangodb',
-#        'PASSWORD': 'djangodb',
-#        'HOST': '127.0.0.1',
-#        'PORT': '5432',
-#    }
-#}
+# Cache holding the compiled quiz snapshots and their versions.
+# Use a cache shared between processes (file based, memcached) when
+# running more than one worker so admin edits reach all of them.
+QUIZ_CACHE = 'default'
+
+# Seconds quiz versions and snapshots are kept for. With a cache which is
+# not shared, admin edits reach the other workers after at most this long.
+QUIZ_CACHE_TIMEOUT = 300
+
+# Where the progress of users taking a quiz without signing in is kept,
+# learn.anon.CacheAnonStore (in ANON_QUIZ_CACHE) or
+# learn.anon.SignedCookieAnonStore. Neither writes to the database.
+ANON_QUIZ_STORE = 'learn.anon.CacheAnonStore'
+ANON_QUIZ_CACHE = 'default'
+
+# Cache of the quiz and course catalogue pages, see learn.catalogue.
+CATALOGUE_CACHE = 'default'
+
+# Share of requests whose queries and timings learn.requeststats records,
+# from 0 (none) to 1 (all). The per process totals are written to
+# REQUEST_STATS_CACHE every REQUEST_STATS_FLUSH_INTERVAL seconds; it has
+# to be shared between processes for the request_stats command to see
+# the numbers of the web server.
+REQUEST_STATS_SAMPLE_RATE = 0.05
+REQUEST_STATS_CACHE = 'default'
+REQUEST_STATS_FLUSH_INTERVAL = 60
+
+# Cache of the per quiz item analysis, see learn.itemanalysis.
+ITEM_ANALYSIS_CACHE = 'default'
+
+# Number of users on the leaderboard of each quiz, see learn.quizstats.
+QUIZ_LEADERBOARD_SIZE = 10
+
+# Seconds the chart data of plotma is cached for. It is read from small
+# pre-aggregated tables, so this only saves repeated dashboard loads.
+PLOTMA_CACHE_TIMEOUT = 60
 
 # Internationalization
 # https://docs.djangoproject.com/en/1.7/topics/i18n/
@@ -0,0 +1,75 @@
+/* The question picker of the quiz admin, see learn/widgets.py. */
+(function($) {
+    $(function() {
+        $('.question-picker').each(function() {
+            var picker = $(this),
+                chosen = picker.find('select[multiple]'),
+                results = picker.find('.picker-results'),
+                page = 1,
+                timer = null;
+
+            function search() {
+                $.getJSON(picker.data('search-url'), {
+                    q: picker.find('.picker-search').val(),
+                    course: picker.find('.picker-course').val(),
+                    type: picker.find('.picker-type').val(),
+                    page: page
+                }, function(data) {
+                    results.empty();
+                    $.each(data.results, function(i, question) {
+                        var item = $('<li>'),
+                            label = question.content + ' (' +
+                                question.type_name +
+                                (question.course ? ', ' + question.course : '') +
+                                ')';
+                        if (chosen.find('option[value="' + question.id + '"]').length) {
+                            item.text(label + ' - in quiz');
+                        } else {
+                            item.append($('<a href="#">Add</a>').click(function() {
+                                chosen.append($('<option>')
+                                    .val(question.id).text(question.content));
+                                item.text(label + ' - in quiz');
+                                return false;
+                            })).append(' ').append($('<span>').text(label));
+                        }
+                        results.append(item);
+                    });
+                    picker.find('.picker-previous').toggle(page > 1);
+                    picker.find('.picker-next').toggle(data.has_next);
+                });
+            }
+
+            picker.find('.picker-search').keyup(function() {
+                clearTimeout(timer);
+                timer = setTimeout(function() { page = 1; search(); }, 300);
+            });
+            picker.find('.picker-course, .picker-type').change(function() {
+                page = 1;
+                search();
+            });
+            picker.find('.picker-previous').click(function() {
+                page -= 1;
+                search();
+                return false;
+            });
+            picker.find('.picker-next').click(function() {
+                page += 1;
+                search();
+                return false;
+            });
+            picker.find('.picker-remove').click(function() {
+                chosen.find('option:selected').remove();
+                chosen.find('option').prop('selected', false);
+                return false;
+            });
+            // every question listed belongs to the quiz
+            picker.closest('form').submit(function() {
+                chosen.find('option').prop('selected', true);
+            });
+
+            // highlighting only marks questions to remove
+            chosen.find('option').prop('selected', false);
+            search();
+        });
+    });
+})(django.jQuery);